@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+from metrics import Metrics
+
+STT_ADAPTIVE_DECODING = os.environ.get("STT_ADAPTIVE_DECODING", "false").lower() == "true"
+# Pending decodes per worker and smoothed decode latency at which levels 1, 2 and 3 start
+STT_DEGRADE_QUEUE_DEPTHS = [float(v) for v in os.environ.get("STT_DEGRADE_QUEUE_DEPTHS", "2,4,8").split(",")]
+STT_DEGRADE_LATENCY_MS = [float(v) for v in os.environ.get("STT_DEGRADE_LATENCY_MS", "2000,4000,8000").split(",")]
+STT_DEGRADE_COOLDOWN_S = float(os.environ.get("STT_DEGRADE_COOLDOWN_S", "5"))
+STT_DEGRADED_BEAM_SIZE = int(os.environ.get("STT_DEGRADED_BEAM_SIZE", "1"))
+# Pending decodes per worker above which new sessions are rejected, 0 disables admission control
+STT_ADMISSION_MAX_QUEUE_DEPTH = float(os.environ.get("STT_ADMISSION_MAX_QUEUE_DEPTH", "0"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Decode options of each degradation level, level 3 also moves decodes to the fallback model
+LEVEL_OPTIONS = [
+    {},
+    {"beam_size": STT_DEGRADED_BEAM_SIZE},
+    {"beam_size": STT_DEGRADED_BEAM_SIZE, "temperature": 0.0},
+    {"beam_size": STT_DEGRADED_BEAM_SIZE, "temperature": 0.0},
+]
+
+
+def _exceeded(value: float, thresholds: list) -> int:
+    return sum(value >= threshold for threshold in thresholds)
+
+
+class LoadGovernor:
+    """Degrades Whisper decoding step by step as the worker pool saturates.
+
+    The level follows the pending decodes per worker and the smoothed decode
+    latency of the pool, whichever is worse. Level 1 lowers the beam size,
+    level 2 also turns off temperature fallback and level 3 sends decodes to
+    the smaller fallback model, if one is loaded. The level rises at once
+    and drops one step after the load has stayed lower for the cooldown.
+    """
+
+    def __init__(self, enabled: bool = STT_ADAPTIVE_DECODING, queue_depths: list = STT_DEGRADE_QUEUE_DEPTHS,
+                 latency_ms: list = STT_DEGRADE_LATENCY_MS, cooldown_s: float = STT_DEGRADE_COOLDOWN_S,
+                 max_queue_depth: float = STT_ADMISSION_MAX_QUEUE_DEPTH):
+        self.enabled = enabled
+        self.queue_depths = queue_depths
+        self.latency_ms = latency_ms
+        self.cooldown = cooldown_s
+        self.max_queue_depth = max_queue_depth
+        self._level = 0
+        self._lower_since = None
+
+    @staticmethod
+    def queue_depth(pool) -> float:
+        return pool.pending / pool.num_workers
+
+    def level(self, pool, has_fallback: bool = False) -> int:
+        """Update and return the degradation level from the current load of pool."""
+        if not self.enabled:
+            return 0
+        depth = self.queue_depth(pool)
+        # The smoothed latency is stale once the pool runs dry, e.g. while the fallback model takes the load
+        latency_ms = pool.latency_ms if pool.pending else 0.0
+        Metrics.set_gauge("stt_decode_queue_depth", depth)
+        Metrics.set_gauge("stt_decode_latency_ms", pool.latency_ms)
+        max_level = len(LEVEL_OPTIONS) - (1 if has_fallback else 2)
+        target = min(max_level, max(_exceeded(depth, self.queue_depths), _exceeded(latency_ms, self.latency_ms)))
+        now = time.monotonic()
+        if target > self._level:
+            self._change(target, depth, latency_ms)
+        elif target < self._level:
+            if self._lower_since is None:
+                self._lower_since = now
+            elif now - self._lower_since >= self.cooldown:
+                self._change(self._level - 1, depth, latency_ms)
+        else:
+            self._lower_since = None
+        return self._level
+
+    def _change(self, level: int, depth: float, latency_ms: float):
+        Metrics.increment("stt_degradation_changes", direction="up" if level > self._level else "down", level=level)
+        logger.warning(f"Whisper decoding degradation level {self._level} -> {level} "
+                       f"(queue depth: {depth:.1f}, latency: {latency_ms:.0f}ms).")
+        self._level = level
+        self._lower_since = None
+        Metrics.set_gauge("stt_degradation_level", level)
+
+    def plan(self, pool, fallback_pool=None, **options) -> tuple:
+        """Return the pool and the decode options for the next decode."""
+        level = self.level(pool, fallback_pool is not None)
+        if level == 0:
+            return pool, options
+        degraded = {**options, **LEVEL_OPTIONS[level]}
+        Metrics.increment("stt_degraded_decodes", action="beam_size")
+        if level >= 2:
+            Metrics.increment("stt_degraded_decodes", action="no_temperature_fallback")
+        if level >= 3 and fallback_pool is not None:
+            Metrics.increment("stt_degraded_decodes", action="fallback_model")
+            return fallback_pool, degraded
+        return pool, degraded
+
+    def admit(self, pool) -> bool:
+        """Whether a new session may start, the client should retry elsewhere otherwise."""
+        if self.max_queue_depth and self.queue_depth(pool) >= self.max_queue_depth:
+            Metrics.increment("stt_rejected_sessions", reason="overload")
+            logger.warning(f"Rejecting session, {self.queue_depth(pool):.1f} decodes pending per worker.")
+            return False
+        return True
@@ -0,0 +1,129 @@
+import os
+import time
+import struct
+import logging
+import numpy as np
+import av
+from metrics import Metrics
+
+# Initial size of the decode buffer, it grows if a message decodes to more audio
+STT_DECODE_BUFFER_S = float(os.environ.get("STT_DECODE_BUFFER_S", "30"))
+
+SAMPLE_RATE = 16000
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# codec query parameter -> decoder, None for raw 16-bit little-endian PCM
+CODECS = {
+    "pcm": None,
+    "opus": "libopus",
+}
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Compressed packets are sent back to back, each one prefixed with its length
+PACKET_LENGTH = struct.Struct("<H")
+
+
+def pack_packets(packets) -> bytes:
+    return b"".join(PACKET_LENGTH.pack(len(packet)) + bytes(packet) for packet in packets)
+
+
+def split_packets(message) -> list:
+    """Return views of the length-prefixed packets of a message."""
+    view = memoryview(message)
+    packets = []
+    offset = 0
+    while offset < len(view):
+        if offset + PACKET_LENGTH.size > len(view):
+            raise ValueError("Truncated packet length")
+        (length,) = PACKET_LENGTH.unpack_from(view, offset)
+        offset += PACKET_LENGTH.size
+        if offset + length > len(view):
+            raise ValueError(f"Packet of {length} bytes is truncated")
+        packets.append(view[offset:offset + length])
+        offset += length
+    return packets
+
+
+class AudioDecoder:
+    """Decodes the audio a client sends into 16 kHz mono 16-bit PCM.
+
+    Decoded and resampled frames are written into one preallocated buffer
+    that is reused for every message. A decoder holds one continuous stream:
+    streaming sessions decode message after message, utterance sessions pass
+    end=True so every utterance starts a fresh stream.
+    """
+
+    def __init__(self, codec: str = "pcm", sample_rate: int = SAMPLE_RATE, channels: int = 1,
+                 buffer_s: float = STT_DECODE_BUFFER_S):
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported codec: {codec}")
+        if codec == "opus" and sample_rate not in OPUS_SAMPLE_RATES:
+            raise ValueError(f"Unsupported Opus sample rate: {sample_rate}")
+        if channels not in (1, 2) or sample_rate <= 0:
+            raise ValueError(f"Unsupported audio format: {sample_rate} Hz, {channels} channels")
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.layout = "mono" if channels == 1 else "stereo"
+        # 16 kHz mono PCM is what the providers expect, it is passed through untouched
+        self.passthrough = codec == "pcm" and sample_rate == SAMPLE_RATE and channels == 1
+        self._buffer = bytearray(0 if self.passthrough else int(buffer_s * SAMPLE_RATE) * 2)
+        self._length = 0
+        self._decoder = None
+        self._resampler = None
+        if not self.passthrough:
+            self._open()
+
+    def _open(self):
+        if CODECS[self.codec] is not None:
+            self._decoder = av.CodecContext.create(CODECS[self.codec], "r")
+            self._decoder.sample_rate = self.sample_rate
+            self._decoder.layout = self.layout
+        self._resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+
+    def _frames(self, message):
+        if self._decoder is None:
+            samples = np.frombuffer(message, dtype=np.int16, count=len(message) // (2 * self.channels) * self.channels)
+            if not len(samples):
+                return
+            frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout=self.layout)
+            frame.sample_rate = self.sample_rate
+            yield frame
+            return
+        for packet in split_packets(message):
+            yield from self._decoder.decode(av.Packet(packet))
+
+    def _write(self, frame):
+        for resampled in self._resampler.resample(frame):
+            size = resampled.samples * 2
+            if self._length + size > len(self._buffer):
+                self._buffer.extend(bytes(max(size, len(self._buffer))))
+            # The plane may be padded, only its samples are copied
+            self._buffer[self._length:self._length + size] = memoryview(resampled.planes[0])[:size]
+            self._length += size
+
+    def decode(self, message, end: bool = False) -> bytes:
+        """Decode a message and return its audio as 16 kHz mono PCM, end flushes and restarts the stream."""
+        if self.passthrough:
+            return bytes(message)
+        start = time.perf_counter()
+        self._length = 0
+        try:
+            for frame in self._frames(message):
+                self._write(frame)
+            if end:
+                if self._decoder is not None:
+                    for frame in self._decoder.decode(None):
+                        self._write(frame)
+                self._write(None)
+                self._open()
+        except av.FFmpegError as e:
+            Metrics.increment("stt_decode_errors", codec=self.codec)
+            # The stream is corrupt, the next message starts a new one
+            self._open()
+            raise ValueError(f"Decoding {self.codec} audio failed: {e}") from e
+        Metrics.observe("stt_decode_ms", (time.perf_counter() - start) * 1000, codec=self.codec)
+        return bytes(memoryview(self._buffer)[:self._length])
@@ -0,0 +1,64 @@
+import io
+import os
+import struct
+import logging
+import numpy as np
+import av
+
+GROQ_STT_UPLOAD_ENCODING = os.environ.get("GROQ_STT_UPLOAD_ENCODING", "wav").lower()
+GROQ_STT_OPUS_BITRATE = int(os.environ.get("GROQ_STT_OPUS_BITRATE", "24000"))
+# libopus defaults to the slowest complexity (10), which costs ~20 ms per second of audio
+GROQ_STT_OPUS_COMPLEXITY = int(os.environ.get("GROQ_STT_OPUS_COMPLEXITY", "0"))
+
+SAMPLE_RATE = 16000
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# encoding -> (file name sent with the upload, container format, codec)
+ENCODINGS = {
+    "wav": ("audio.wav", None, None),
+    "flac": ("audio.flac", "flac", "flac"),
+    "opus": ("audio.ogg", "ogg", "libopus"),
+}
+
+
+def wav_header(num_bytes: int, num_channels: int = 1, sample_rate: int = SAMPLE_RATE, bits_per_sample: int = 16) -> bytes:
+    """Return the 44 byte header of a PCM WAV file holding num_bytes of audio."""
+    block_align = num_channels * bits_per_sample // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", num_bytes + 36, b"WAVE",
+        b"fmt ", 16, 1, num_channels, sample_rate, sample_rate * block_align, block_align, bits_per_sample,
+        b"data", num_bytes,
+    )
+
+
+def _encode_compressed(data, container: str, codec: str) -> bytes:
+    """Encode raw 16-bit mono PCM in one pass, the samples are copied into a single frame once."""
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format=container) as output:
+        options = {"compression_level": str(GROQ_STT_OPUS_COMPLEXITY)} if codec == "libopus" else {}
+        stream = output.add_stream(codec, rate=SAMPLE_RATE, layout="mono", options=options)
+        if codec == "libopus":
+            stream.bit_rate = GROQ_STT_OPUS_BITRATE
+        frame = av.AudioFrame.from_ndarray(
+            np.frombuffer(data, dtype=np.int16, count=len(data) // 2).reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = SAMPLE_RATE
+        for packet in stream.encode(frame):
+            output.mux(packet)
+        for packet in stream.encode(None):
+            output.mux(packet)
+    return buffer.getvalue()
+
+
+def encode_upload(data, encoding: str = GROQ_STT_UPLOAD_ENCODING) -> tuple:
+    """Return (file name, body) for uploading raw 16 kHz 16-bit mono PCM in the given encoding."""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unsupported upload encoding: {encoding}")
+    filename, container, codec = ENCODINGS[encoding]
+    if container is None:
+        # Header and samples are copied into the body once
+        return filename, b"".join((wav_header(len(data)), data))
+    return filename, _encode_compressed(data, container, codec)
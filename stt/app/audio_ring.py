@@ -0,0 +1,108 @@
+import os
+import logging
+import numpy as np
+from multiprocessing import shared_memory
+
+SAMPLE_RATE = 16000
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AudioRingBuffer:
+    """Ring buffer holding the most recent audio of a session as normalized float32.
+
+    16-bit PCM frames are converted straight into the ring as they arrive,
+    without intermediate arrays. Every sample is written twice, at its slot
+    and at the slot plus the capacity, so any window of up to capacity
+    samples is a single contiguous view. With shared=True the ring lives in
+    shared memory and worker processes read the same views through block().
+    """
+
+    def __init__(self, capacity_s: float, shared: bool = True):
+        self.capacity = max(1, int(capacity_s * SAMPLE_RATE))
+        self._shm = None
+        if shared:
+            self._shm = self._allocate(2 * self.capacity * 4)
+            self._samples = np.ndarray((2 * self.capacity,), dtype=np.float32, buffer=self._shm.buf)
+        else:
+            self._samples = np.empty(2 * self.capacity, dtype=np.float32)
+        self._start = 0  # absolute index of the oldest sample
+        self._end = 0  # absolute index after the newest sample
+
+    @staticmethod
+    def _allocate(size: int) -> shared_memory.SharedMemory:
+        """Create a shared memory block whose pages are all reserved up front.
+
+        /dev/shm is a tmpfs, a block that does not fit is only noticed when
+        a page is first written, as a SIGBUS. Reserving it fails right away
+        instead, with ENOSPC.
+        """
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(shm._fd, 0, size)
+            except OSError as e:
+                shm.close()
+                shm.unlink()
+                raise OSError(e.errno, f"No room for {size / 2 ** 20:.1f}MB of audio in /dev/shm, "
+                                       f"raise the shared memory size of the container ({e.strerror})") from e
+        return shm
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def write(self, data) -> int:
+        """Append 16-bit PCM, return the number of samples dropped from the front to make room."""
+        pcm = np.frombuffer(data, dtype=np.int16, count=len(data) // 2)
+        total = len(pcm)
+        if total > self.capacity:
+            pcm = pcm[-self.capacity:]
+        position = (self._end + total - len(pcm)) % self.capacity
+        head = min(len(pcm), self.capacity - position)
+        for offset in (position, position + self.capacity):
+            np.multiply(pcm[:head], 1.0 / 32768.0, out=self._samples[offset:offset + head], dtype=np.float32)
+        if head < len(pcm):
+            # The rest wraps around to the start of both copies
+            rest = len(pcm) - head
+            for offset in (0, self.capacity):
+                np.multiply(pcm[head:], 1.0 / 32768.0, out=self._samples[offset:offset + rest], dtype=np.float32)
+        self._end += total
+        dropped = max(0, len(self) - self.capacity)
+        self._start += dropped
+        return dropped
+
+    def consume(self, num_samples: int):
+        """Drop num_samples from the front."""
+        self._start = min(self._end, self._start + num_samples)
+
+    def clear(self):
+        self._start = self._end
+
+    def _slice(self, start: int, end: int) -> tuple:
+        end = len(self) if end is None else min(end, len(self))
+        start = min(start, end)
+        offset = (self._start + start) % self.capacity
+        return offset, end - start
+
+    def view(self, start: int = 0, end: int = None) -> np.ndarray:
+        """Read-only view of the samples from start to end, counted from the oldest sample."""
+        offset, length = self._slice(start, end)
+        view = self._samples[offset:offset + length]
+        view.flags.writeable = False
+        return view
+
+    def block(self, start: int = 0, end: int = None) -> tuple:
+        """Return (shared memory name, offset, length) of a window, in samples, for a worker process."""
+        if self._shm is None:
+            raise ValueError("The ring buffer is not in shared memory")
+        return (self._shm.name, *self._slice(start, end))
+
+    def close(self):
+        """Release the shared memory, views of the ring must not be used afterwards."""
+        if self._shm is not None:
+            self._samples = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,107 @@
+import os
+import asyncio
+import logging
+from metrics import Metrics
+
+STT_BATCH_MAX_SIZE = int(os.environ.get("STT_BATCH_MAX_SIZE", "1"))
+STT_BATCH_MAX_WAIT_MS = float(os.environ.get("STT_BATCH_MAX_WAIT_MS", "20"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionBatcher:
+    """Collects utterances from concurrent sessions and decodes them in batches.
+
+    A batch is dispatched once it holds `max_batch_size` utterances or the
+    oldest utterance has waited `max_wait_ms`. Each caller awaits its own
+    future, so results go back to the session that submitted the audio.
+    """
+
+    def __init__(self, pool, max_batch_size: int = STT_BATCH_MAX_SIZE, max_wait_ms: float = STT_BATCH_MAX_WAIT_MS):
+        self.pool = pool
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = asyncio.Queue()
+        self._task = None
+        # Dispatched batches, the loop only keeps weak references to tasks
+        self._dispatches = set()
+
+    async def transcribe(self, data, **options) -> dict:
+        """Queue an utterance for the next batch and wait for its result."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put_nowait((data, options, future, loop.time()))
+        Metrics.set_gauge("stt_batch_queue_depth", self._queue.qsize())
+        return await future
+
+    async def _run(self):
+        batch = []
+        try:
+            await self._collect(batch)
+        except BaseException as e:
+            # Nothing would resolve the utterances collected or still queued, fail them instead of hanging
+            if isinstance(e, Exception):
+                logger.exception("Transcription batcher failed.")
+            error = e if isinstance(e, Exception) else RuntimeError("Transcription batcher stopped")
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            for item in batch:
+                if not item[2].done():
+                    item[2].set_exception(error)
+            raise
+
+    async def _collect(self, batch: list):
+        """Collect batches into batch and dispatch them, batch holds the items not dispatched yet."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch.append(await self._queue.get())
+            deadline = batch[0][3] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            Metrics.set_gauge("stt_batch_queue_depth", self._queue.qsize())
+
+            # Utterances can only share a decode when they use the same options
+            groups = {}
+            for item in batch:
+                if item[2].done():  # the session went away while waiting
+                    continue
+                groups.setdefault(repr(sorted(item[1].items())), []).append(item)
+            for group in groups.values():
+                task = asyncio.create_task(self._dispatch(group))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+            batch.clear()
+
+    async def _dispatch(self, batch):
+        now = asyncio.get_running_loop().time()
+        Metrics.observe("stt_batch_size", len(batch))
+        for item in batch:
+            Metrics.observe("stt_batch_wait_ms", (now - item[3]) * 1000)
+        logger.info(f"Dispatching transcription batch of {len(batch)} utterances.")
+
+        try:
+            if len(batch) == 1:
+                # The regular decode keeps timestamps and temperature fallback
+                results = [await self.pool.transcribe(batch[0][0], **batch[0][1])]
+            else:
+                results = await self.pool.transcribe_batch([item[0] for item in batch], **batch[0][1])
+        except Exception as e:
+            for item in batch:
+                if not item[2].done():
+                    item[2].set_exception(e)
+            return
+
+        for item, result in zip(batch, results):
+            if not item[2].done():
+                item[2].set_result(result)
@@ -0,0 +1,125 @@
+import os
+import re
+import asyncio
+import logging
+import numpy as np
+from metrics import Metrics
+
+STT_CHUNKING = os.environ.get("STT_CHUNKING", "false").lower() == "true"
+# Utterances of at least this length are split and their chunks decoded concurrently
+STT_CHUNK_MIN_S = float(os.environ.get("STT_CHUNK_MIN_S", "30"))
+# Chunks are cut at the quietest frame of the last STT_CHUNK_SEARCH_S before STT_CHUNK_TARGET_S
+STT_CHUNK_TARGET_S = float(os.environ.get("STT_CHUNK_TARGET_S", "20"))
+STT_CHUNK_SEARCH_S = float(os.environ.get("STT_CHUNK_SEARCH_S", "5"))
+# Audio before each cut that is decoded again at the start of the next chunk
+STT_CHUNK_OVERLAP_S = float(os.environ.get("STT_CHUNK_OVERLAP_S", "1"))
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 320  # 20 ms
+# Words per second of overlap that may be repeated at the start of a chunk
+OVERLAP_WORDS_PER_S = 4
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def quietest_sample(pcm: np.ndarray, start: int, end: int) -> int:
+    """Return the middle of the 20 ms frame with the least energy between two samples."""
+    frames = (end - start) // FRAME_SAMPLES
+    if frames < 1:
+        return end
+    window = pcm[start:start + frames * FRAME_SAMPLES].astype(np.float32).reshape(frames, FRAME_SAMPLES)
+    energy = np.einsum("ij,ij->i", window, window)
+    return start + int(np.argmin(energy)) * FRAME_SAMPLES + FRAME_SAMPLES // 2
+
+
+def plan_chunks(data, target_s: float = STT_CHUNK_TARGET_S, search_s: float = STT_CHUNK_SEARCH_S,
+                overlap_s: float = STT_CHUNK_OVERLAP_S) -> list:
+    """Return (start, cut, end) sample offsets of the chunks of raw 16-bit PCM.
+
+    A chunk covers the audio from its cut to the next one at end. It is
+    decoded from start, the overlap before its cut, so a word clipped at
+    the cut is heard in full by at least one of the two chunks.
+    """
+    pcm = np.frombuffer(data, dtype=np.int16, count=len(data) // 2)
+    target = max(FRAME_SAMPLES, int(target_s * SAMPLE_RATE))
+    search = min(target, int(search_s * SAMPLE_RATE))
+    overlap = int(overlap_s * SAMPLE_RATE)
+    cuts = [0]
+    while len(pcm) - cuts[-1] > target:
+        cuts.append(quietest_sample(pcm, cuts[-1] + target - search, cuts[-1] + target))
+    cuts.append(len(pcm))
+    return [(max(0, cut - overlap) if i else 0, cut, end) for i, (cut, end) in enumerate(zip(cuts, cuts[1:]))]
+
+
+def _normalize(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def _overlap_length(previous: list, words: list, max_words: int) -> int:
+    """Length of the longest run of words that ends previous and starts words."""
+    previous = [_normalize(word) for word in previous[-max_words:]]
+    words = [_normalize(word) for word in words[:max_words]]
+    for length in range(min(len(previous), len(words)), 0, -1):
+        if previous[-length:] == words[:length]:
+            return length
+    return 0
+
+
+def _drop_words(segments: list, count: int) -> list:
+    """Remove the first count words from the text of the segments, dropping emptied segments."""
+    kept = []
+    for segment in segments:
+        words = segment["text"].split()
+        if count >= len(words):
+            count -= len(words)
+            continue
+        if count:
+            segment = {**segment, "text": " " + " ".join(words[count:]), "words": None}
+            count = 0
+        kept.append(segment)
+    return kept
+
+
+def stitch(chunks: list, transcriptions: list, overlap_s: float = STT_CHUNK_OVERLAP_S) -> dict:
+    """Merge the transcriptions of the chunks into one, on the timeline of the whole utterance."""
+    max_words = max(1, int(overlap_s * OVERLAP_WORDS_PER_S))
+    segments = []
+    for (start, _, _), transcription in zip(chunks, transcriptions):
+        shift = start / SAMPLE_RATE
+        shifted = [
+            {**segment, "start": segment["start"] + shift, "end": segment["end"] + shift}
+            for segment in transcription["segments"]
+        ]
+        if segments and shifted:
+            previous = " ".join(segment["text"] for segment in segments[-max_words:]).split()
+            words = " ".join(segment["text"] for segment in shifted).split()
+            repeated = _overlap_length(previous, words, max_words)
+            if repeated:
+                Metrics.increment("stt_chunk_overlap_words", repeated)
+                shifted = _drop_words(shifted, repeated)
+        segments.extend(shifted)
+    return {
+        "segments": segments,
+        "language": transcriptions[0]["language"],
+        "duration": chunks[-1][2] / SAMPLE_RATE,
+        "cpu_s": sum(transcription.get("cpu_s", 0.0) for transcription in transcriptions),
+    }
+
+
+async def transcribe_chunked(engine, data, **options) -> dict:
+    """Split long PCM at silences and decode the chunks concurrently on engine.
+
+    Chunks are decoded on as many workers as the pool has, so the latency of
+    a long utterance stays close to the latency of its longest chunk.
+    """
+    chunks = plan_chunks(data)
+    view = memoryview(data)
+    Metrics.increment("stt_chunked_utterances")
+    Metrics.observe("stt_utterance_chunks", len(chunks))
+    logger.info(f"Decoding {len(data) / 2 / SAMPLE_RATE:.2f}s of audio in {len(chunks)} chunks.")
+    transcriptions = await asyncio.gather(*[
+        engine.transcribe(view[start * 2:end * 2], **options) for start, _, end in chunks
+    ])
+    return stitch(chunks, transcriptions)
@@ -0,0 +1,201 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from collections import deque
+from deepgram import LiveTranscriptionEvents
+from metrics import Metrics
+
+STT_DEEPGRAM_POOL_SIZE = int(os.environ.get("STT_DEEPGRAM_POOL_SIZE", "0"))
+STT_DEEPGRAM_POOL_CHECK_S = float(os.environ.get("STT_DEEPGRAM_POOL_CHECK_S", "5"))
+# Wait for the results of a returned connection's trailing audio, it is closed when they do not arrive
+STT_DEEPGRAM_POOL_FLUSH_S = float(os.environ.get("STT_DEEPGRAM_POOL_FLUSH_S", "2"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Connection events forwarded to the session that has the connection checked out
+SESSION_HANDLERS = {
+    LiveTranscriptionEvents.Transcript: "on_message",
+    LiveTranscriptionEvents.UtteranceEnd: "on_utterance_end",
+    LiveTranscriptionEvents.Metadata: "on_metadata",
+    LiveTranscriptionEvents.Error: "on_error",
+    LiveTranscriptionEvents.Close: "on_close",
+}
+
+
+class PooledConnection:
+    """A live Deepgram connection and the session currently using it."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.session = None
+        self.closed = False
+        # Finalize messages whose from_finalize result has not arrived yet
+        self.pending_finalizes = 0
+        self.flushed = None
+
+    async def finalize(self) -> bool:
+        """Flush the audio sent so far, Deepgram answers with a from_finalize result."""
+        self.pending_finalizes += 1
+        return await self.connection.finalize()
+
+
+class DeepgramConnectionPool:
+    """Keeps started Deepgram live connections open so sessions skip the TLS and websocket handshake.
+
+    Handlers cannot be removed from a connection, so every connection gets
+    one set of dispatchers that forward events to the session that has it
+    checked out. A returned connection only becomes idle once the results of
+    all its Finalize messages arrived, so no late result of one session
+    reaches the next. Idle connections are kept alive by the SDK and probed
+    every check_interval_s; closed ones are replaced.
+    """
+
+    def __init__(self, client, options, addons: dict = None, size: int = STT_DEEPGRAM_POOL_SIZE,
+                 check_interval_s: float = STT_DEEPGRAM_POOL_CHECK_S, flush_timeout_s: float = STT_DEEPGRAM_POOL_FLUSH_S):
+        self.client = client
+        self.options = options
+        self.addons = addons
+        self.size = size
+        self.check_interval = check_interval_s
+        self.flush_timeout = flush_timeout_s
+        self._idle = deque()
+        self._opening = 0
+        self._fill_task = None
+        self._check_task = None
+
+    async def start(self):
+        """Open the pool's connections and start the health checks."""
+        await self._fill()
+        if self._check_task is None:
+            self._check_task = asyncio.create_task(self._check_loop())
+        logger.info(f"Deepgram connection pool started with {len(self._idle)} connections.")
+
+    async def _open(self):
+        start = time.perf_counter()
+        self._opening += 1
+        try:
+            connection = self.client.listen.asyncwebsocket.v("1")
+            pooled = PooledConnection(connection)
+            for event, handler in SESSION_HANDLERS.items():
+                connection.on(event, functools.partial(self._dispatch, pooled, handler))
+            if await connection.start(self.options, addons=self.addons) is False:
+                logger.error("Failed to connect to Deepgram")
+                Metrics.increment("stt_deepgram_pool_connect_failures")
+                return None
+        finally:
+            self._opening -= 1
+        Metrics.observe("stt_deepgram_connect_ms", (time.perf_counter() - start) * 1000)
+        return pooled
+
+    async def _dispatch(self, pooled: PooledConnection, handler: str, dg, *args, **kwargs):
+        if handler in ("on_error", "on_close"):
+            pooled.closed = True
+            if pooled.flushed is not None:
+                pooled.flushed.set()
+        result = kwargs.get("result")
+        if handler == "on_message" and getattr(result, "from_finalize", False) and pooled.pending_finalizes:
+            pooled.pending_finalizes -= 1
+            if pooled.pending_finalizes == 0 and pooled.flushed is not None:
+                pooled.flushed.set()
+        session = pooled.session
+        if session is not None and hasattr(session, handler):
+            await getattr(session, handler)(dg, *args, **kwargs)
+
+    async def _fill(self):
+        missing = self.size - len(self._idle) - self._opening
+        if missing <= 0:
+            return
+        for pooled in await asyncio.gather(*[self._open() for _ in range(missing)]):
+            if pooled is not None:
+                self._idle.append(pooled)
+        Metrics.set_gauge("stt_deepgram_pool_idle", len(self._idle))
+
+    def _refill(self):
+        if self._fill_task is None or self._fill_task.done():
+            self._fill_task = asyncio.create_task(self._fill())
+
+    async def _discard(self, pooled: PooledConnection, reason: str):
+        Metrics.increment("stt_deepgram_pool_discarded", reason=reason)
+        pooled.session = None
+        try:
+            await pooled.connection.finish()
+        except Exception as e:
+            logger.warning(f"Closing Deepgram connection failed: {e!r}")
+
+    async def acquire(self, session):
+        """Check out an open connection for session, opening a new one if none is idle."""
+        if self._check_task is None:
+            # Pools that fill up on first use are health checked as well
+            self._check_task = asyncio.create_task(self._check_loop())
+        while self._idle:
+            pooled = self._idle.popleft()
+            if pooled.closed:
+                await self._discard(pooled, "closed")
+                continue
+            Metrics.increment("stt_deepgram_pool_checkouts", result="hit")
+            break
+        else:
+            Metrics.increment("stt_deepgram_pool_checkouts", result="miss")
+            pooled = await self._open()
+        Metrics.set_gauge("stt_deepgram_pool_idle", len(self._idle))
+        self._refill()
+        if pooled is not None:
+            pooled.session = session
+        return pooled
+
+    async def release(self, pooled: PooledConnection):
+        """Return a connection once the results of the audio the session left on it arrived."""
+        pooled.session = None
+        if pooled.closed or len(self._idle) >= self.size:
+            await self._discard(pooled, "released")
+            return
+        pooled.flushed = asyncio.Event()
+        if not await pooled.finalize():
+            await self._discard(pooled, "released")
+            return
+        try:
+            await asyncio.wait_for(pooled.flushed.wait(), self.flush_timeout)
+        except asyncio.TimeoutError:
+            # A result arriving later would reach the next session
+            await self._discard(pooled, "flush_timeout")
+            return
+        pooled.flushed = None
+        if pooled.closed or len(self._idle) >= self.size:
+            await self._discard(pooled, "released")
+            return
+        self._idle.append(pooled)
+        Metrics.set_gauge("stt_deepgram_pool_idle", len(self._idle))
+
+    async def _check_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Deepgram connection pool health check failed: {e!r}")
+
+    async def check(self):
+        """Probe the idle connections, replace the ones that are closed or do not accept a KeepAlive."""
+        for pooled in list(self._idle):
+            if pooled.closed:
+                reason = "closed"
+            elif not await pooled.connection.keep_alive():
+                reason = "failed_probe"
+            else:
+                continue
+            # The connection may have been checked out while probing the others
+            if pooled in self._idle:
+                self._idle.remove(pooled)
+                await self._discard(pooled, reason)
+        Metrics.set_gauge("stt_deepgram_pool_idle", len(self._idle))
+        await self._fill()
+
+    async def close(self):
+        if self._check_task:
+            self._check_task.cancel()
+        while self._idle:
+            await self._discard(self._idle.popleft(), "shutdown")
@@ -8,30 +8,137 @@ from deepgram import (
     LiveOptions,
 )
 from stt_interface import STTInterface
+from deepgram_pool import DeepgramConnectionPool, STT_DEEPGRAM_POOL_SIZE
 
 API_KEY = os.getenv('DG_API_KEY', '')
+# Empty means api.deepgram.com, use a ws:// URL for a local stand-in without TLS
+STT_DEEPGRAM_URL = os.getenv('STT_DEEPGRAM_URL', '')
+STT_DEEPGRAM_ENDPOINTING_MS = int(os.getenv('STT_DEEPGRAM_ENDPOINTING_MS', '300'))
+STT_DEEPGRAM_UTTERANCE_END_MS = int(os.getenv('STT_DEEPGRAM_UTTERANCE_END_MS', '1000'))
+
+# Deepgram rejects UtteranceEnd timeouts below one second
+MIN_UTTERANCE_END_MS = 1000
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def live_options(streaming: bool = False,
+                 endpointing_ms: int = STT_DEEPGRAM_ENDPOINTING_MS,
+                 utterance_end_ms: int = STT_DEEPGRAM_UTTERANCE_END_MS) -> LiveOptions:
+    """Deepgram options for live transcription.
+
+    The streaming mode asks for interim results, endpointing after
+    endpointing_ms of silence and UtteranceEnd events after utterance_end_ms
+    without words.
+    """
+    if streaming:
+        return LiveOptions(
+            model="nova-2",
+            language="en-US",
+            encoding="linear16",
+            channels=1,
+            sample_rate=16000,
+            interim_results=True,
+            utterance_end_ms=str(max(MIN_UTTERANCE_END_MS, utterance_end_ms)),
+            vad_events=True,
+            endpointing=endpointing_ms,
+        )
+    return LiveOptions(
+        model="nova-2",
+        language="en-US",
+        # Apply smart formatting to the output
+        # smart_format=True,
+        # Raw audio format details
+        encoding="linear16",
+        channels=1,
+        sample_rate=16000,
+        # To get UtteranceEnd, the following must be set:
+        # interim_results=True,
+        # utterance_end_ms="1000",
+        #vad_events=True,
+        # Time in milliseconds of silence to wait for before finalizing speech
+        #endpointing=300,
+    )
+
+ADDONS = {
+    # Prevent waiting for additional numbers
+    "no_delay": "true"
+}
+
+# Only sessions with the configured options share pooled connections, custom endpoint timings
+# open their own connection so clients cannot make the service hold more open connections
+POOLED_OPTIONS = {(False,), (True, STT_DEEPGRAM_ENDPOINTING_MS, STT_DEEPGRAM_UTTERANCE_END_MS)}
+
 class DeepGramSTT(STTInterface):
-    def __init__(self):
+    _client = None  # Class-level attribute to store the shared DeepgramClient instance
+    _pools = {}  # Class-level attribute to store the shared pools of open live connections, keyed by session options
+
+    @classmethod
+    def get_client(cls):
+        if cls._client is None:
+            # Idle pooled connections are closed by Deepgram unless the SDK sends KeepAlive messages
+            options = {"keepalive": "true"} if STT_DEEPGRAM_POOL_SIZE > 0 else {}
+            cls._client = DeepgramClient(API_KEY, DeepgramClientOptions(url=STT_DEEPGRAM_URL, options=options))
+            logger.info("Deepgram client initialized.")
+        return cls._client
+
+    @classmethod
+    def get_pool(cls, session_options: tuple = (False,)):
+        # Connections are opened with fixed options, sessions only share connections with the same ones
+        if session_options not in POOLED_OPTIONS:
+            raise ValueError(f"No Deepgram connection pool for options {session_options}")
+        if session_options not in cls._pools:
+            cls._pools[session_options] = DeepgramConnectionPool(cls.get_client(), live_options(*session_options), ADDONS)
+        return cls._pools[session_options]
+
+    @classmethod
+    async def preload(cls):
+        cls.get_client()
+        if STT_DEEPGRAM_POOL_SIZE > 0:
+            # Pools for the streaming options fill up on first use
+            await cls.get_pool().start()
+
+    def __init__(self, streaming: bool = False, endpointing_ms: int = None, utterance_end_ms: int = None):
         self._is_open = False
         self.is_finals = []
         self.text_handler = None
+        self.dg_connection = None
+        self.pooled = None
+        self.streaming = streaming
+        if streaming:
+            self.session_options = (
+                True,
+                STT_DEEPGRAM_ENDPOINTING_MS if endpointing_ms is None else endpointing_ms,
+                STT_DEEPGRAM_UTTERANCE_END_MS if utterance_end_ms is None else utterance_end_ms,
+            )
+        else:
+            self.session_options = (False,)
 
         
         
     async def initialize(self, text_handler: callable = None):
-        logger.info("Initializing Deepgram")
+        logger.info(f"Initializing Deepgram (options: {self.session_options})")
         self.text_handler = text_handler
         # config: DeepgramClientOptions = DeepgramClientOptions(
         #     verbose=verboselogs.DEBUG, options={"keepalive": "true"}
         # )
         # self.model = DeepgramClient(API_KEY, config)
-        self.model = DeepgramClient(API_KEY)
-        
+        self.model = self.get_client()
+
+        if STT_DEEPGRAM_POOL_SIZE > 0 and self.session_options in POOLED_OPTIONS:
+            # Check out an already open connection, its events are routed to this session
+            if self.pooled is not None:
+                # The previous connection was closed under this session
+                await self.get_pool(self.session_options).release(self.pooled)
+            self.pooled = await self.get_pool(self.session_options).acquire(self)
+            if self.pooled is None:
+                return
+            self.dg_connection = self.pooled.connection
+            self._is_open = True
+            return
+
+        # Each session streams over its own live connection
         self.dg_connection = self.model.listen.asyncwebsocket.v("1")
         
         # Define the event handlers for the connection
@@ -40,41 +147,27 @@ class DeepGramSTT(STTInterface):
         self.dg_connection.on(LiveTranscriptionEvents.Transcript, self.on_message)
         self.dg_connection.on(LiveTranscriptionEvents.Metadata, self.on_metadata)
         self.dg_connection.on(LiveTranscriptionEvents.Error, self.on_error)
+        self.dg_connection.on(LiveTranscriptionEvents.UtteranceEnd, self.on_utterance_end)
 
-        # Configure Deepgram options for live transcription
-        self.options = LiveOptions(
-            model="nova-2",
-            language="en-US",
-            # Apply smart formatting to the output
-            # smart_format=True,
-            # Raw audio format details
-            encoding="linear16",
-            channels=1,
-            sample_rate=16000,
-            # To get UtteranceEnd, the following must be set:
-            # interim_results=True,
-            # utterance_end_ms="1000",
-            #vad_events=True,
-            # Time in milliseconds of silence to wait for before finalizing speech
-            #endpointing=300,
-        )
-        self.addons = {
-            # Prevent waiting for additional numbers
-            "no_delay": "true"
-        }
-        if await self.dg_connection.start(self.options, addons=self.addons) is False:
+        if await self.dg_connection.start(live_options(*self.session_options), addons=ADDONS) is False:
             logger.error("Failed to connect to Deepgram")
+            # finish() fails on a connection that never started
+            self.dg_connection = None
             return
         self._is_open = True
 
     async def transcribe(self, data) -> str:
         if not self._is_open:
             await self.initialize(self.text_handler)
+            if not self._is_open:
+                return ''
         await self.dg_connection.send(data)
         return ''
 
     async def on_message(self, dg, result, **kwargs):
         # logger.debug(result)
+        if self.streaming:
+            return await self.on_streaming_message(result)
         sentence = result.channel.alternatives[0].transcript
         if len(sentence) == 0:
             return
@@ -88,6 +181,44 @@ class DeepGramSTT(STTInterface):
                 # Send the result to the orchestrator
                 await self.text_handler(utterance)
 
+    async def on_streaming_message(self, result):
+        sentence = result.channel.alternatives[0].transcript
+        if not result.is_final:
+            # Interim results revise the words after the last final result
+            if sentence:
+                await self.text_handler(" ".join(self.is_finals + [sentence]), type="interim")
+            return
+        if sentence:
+            self.is_finals.append(sentence)
+        if result.speech_final:
+            await self.finalize("endpointing")
+        elif result.from_finalize:
+            await self.finalize("finalize")
+
+    async def on_utterance_end(self, dg, utterance_end, **kwargs):
+        # Sent after utterance_end_ms without words, also when endpointing missed the end because of noise
+        if self.streaming:
+            await self.finalize("utterance_end")
+
+    async def finalize(self, reason: str):
+        """Send the final results collected so far as one utterance."""
+        if not self.is_finals:
+            return
+        utterance = " ".join(self.is_finals)
+        self.is_finals = []
+        logger.info(f"Speech Final ({reason}): {utterance}")
+        await self.text_handler(utterance, type="final", reason=reason)
+
+    async def end_utterance(self) -> str:
+        # The client detected the end of speech, flush Deepgram instead of waiting for the endpoint
+        if self.streaming and self._is_open:
+            if self.pooled is not None:
+                # Counted, the pool waits for its result before handing the connection on
+                await self.pooled.finalize()
+            else:
+                await self.dg_connection.finalize()
+        return ''
+
     async def on_metadata(self,dg, metadata, **kwargs):
         logger.info(f"Metadata received: {metadata}")
 
@@ -104,7 +235,11 @@ class DeepGramSTT(STTInterface):
         self._is_open = False
 
     async def close(self):
-        self.dg_connection.finish()
+        if self.pooled is not None:
+            await self.get_pool(self.session_options).release(self.pooled)
+            self.pooled = None
+        elif self.dg_connection is not None:
+            await self.dg_connection.finish()
         self._is_open = False
         logger.info("Deepgram connection closed.")
 
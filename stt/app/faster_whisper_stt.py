@@ -1,11 +1,23 @@
 import os
+import time
 import logging
-from faster_whisper import WhisperModel
+from contextlib import aclosing
 from stt_interface import STTInterface
-import numpy as np
+from whisper_worker_pool import WhisperWorkerPool
+from batch_scheduler import TranscriptionBatcher, STT_BATCH_MAX_SIZE
+from whisper_autotune import load_profile, WHISPER_AUTOTUNE
+from whisper_streaming import WhisperStream
+from adaptive_decoding import LoadGovernor
+from model_cascade import escalation_reason, STT_CASCADE, WHISPER_CASCADE_MODEL, WHISPER_CASCADE_WORKERS
+from hallucination_filter import filter_segments, keep_segment, reject_utterance
+from chunked_transcription import transcribe_chunked, STT_CHUNKING, STT_CHUNK_MIN_S, SAMPLE_RATE
+from model_registry import ModelRegistry, select_model
+from metrics import Metrics
 
-WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "tiny")
 STT_LANGUAGE_CODE = os.environ.get("STT_LANGUAGE_CODE", "en")
+# Smaller model that takes over under heavy load, loaded only when set
+WHISPER_FALLBACK_MODEL = os.environ.get("WHISPER_FALLBACK_MODEL", "")
+WHISPER_FALLBACK_WORKERS = int(os.environ.get("WHISPER_FALLBACK_WORKERS", "1"))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,41 +26,209 @@ logger = logging.getLogger(__name__)
 class FasterWhisperSTT(STTInterface):
     """Speech-to-text using the Faster Whisper model."""
     
-    _model = None  # Class-level attribute to store the shared WhisperModel instance
+    _pool = None  # Class-level attribute to store the shared worker pool
+    _batcher = None  # Class-level attribute to store the shared cross-session batcher
+    _tiers = {}  # Class-level attribute to store the pools of the additional models, keyed by model
+    _governor = None  # Class-level attribute to store the shared load governor
+    _registry = None  # Class-level attribute to store the models selected by sessions
 
     @classmethod
-    def get_model(cls):
-        if cls._model is None:
-            cls._model = WhisperModel(WHISPER_MODEL, compute_type="float32")
-            logger.info(f"Faster Whisper (model: {WHISPER_MODEL}) loaded.")
-        return cls._model
+    def get_pool(cls):
+        if cls._pool is None:
+            profile = load_profile() if WHISPER_AUTOTUNE else None
+            if profile:
+                logger.info(f"Using autotuned Whisper profile: {profile['compute_type']}, {profile['num_workers']} workers x {profile['cpu_threads']} threads.")
+                cls._pool = WhisperWorkerPool(
+                    num_workers=profile["num_workers"],
+                    compute_type=profile["compute_type"],
+                    cpu_threads=profile["cpu_threads"],
+                )
+            else:
+                cls._pool = WhisperWorkerPool()
+        return cls._pool
 
-    def __init__(self):
+    @classmethod
+    def get_tier(cls, model: str, num_workers: int):
+        """Return the pool of an additional model, the fallback and cascade tiers share it if they are the same."""
+        if model not in cls._tiers:
+            cls._tiers[model] = WhisperWorkerPool(num_workers=num_workers, model_size=model)
+        return cls._tiers[model]
+
+    @classmethod
+    def get_fallback_pool(cls):
+        return cls.get_tier(WHISPER_FALLBACK_MODEL, WHISPER_FALLBACK_WORKERS) if WHISPER_FALLBACK_MODEL else None
+
+    @classmethod
+    def get_cascade_pool(cls):
+        return cls.get_tier(WHISPER_CASCADE_MODEL, WHISPER_CASCADE_WORKERS) if STT_CASCADE else None
+
+    @classmethod
+    def get_registry(cls):
+        if cls._registry is None:
+            cls._registry = ModelRegistry()
+        return cls._registry
+
+    @classmethod
+    def get_governor(cls):
+        if cls._governor is None:
+            cls._governor = LoadGovernor()
+        return cls._governor
+
+    @classmethod
+    def plan(cls, **options) -> tuple:
+        """Return the pool and options for the next decode, degraded when the workers are overloaded."""
+        return cls.get_governor().plan(cls.get_pool(), cls.get_fallback_pool(), **options)
+
+    @classmethod
+    def admit(cls) -> bool:
+        return cls.get_governor().admit(cls.get_pool())
+
+    @classmethod
+    def get_engine(cls):
+        """Return the batcher when batching is enabled, otherwise the worker pool."""
+        if STT_BATCH_MAX_SIZE <= 1:
+            return cls.get_pool()
+        if cls._batcher is None:
+            cls._batcher = TranscriptionBatcher(cls.get_pool())
+        return cls._batcher
+
+    @classmethod
+    async def preload(cls):
+        """Start all workers and wait until their models are loaded and warmed up."""
+        start = time.perf_counter()
+        workers = await cls.get_pool().start()
+        cls.get_fallback_pool()
+        cls.get_cascade_pool()
+        for tier in cls._tiers.values():
+            workers += await tier.start()
+        for worker in workers:
+            Metrics.observe("stt_model_load_ms", worker["load_s"] * 1000)
+            Metrics.observe("stt_model_warmup_ms", worker["warmup_s"] * 1000)
+        Metrics.set_gauge("stt_preload_ms", (time.perf_counter() - start) * 1000)
+        logger.info(f"Faster Whisper preloaded {len(workers)} workers in {time.perf_counter() - start:.2f}s.")
+
+    @classmethod
+    async def shutdown(cls):
+        if cls._pool is not None:
+            cls._pool.shutdown()
+            cls._pool = None
+            cls._batcher = None
+        for tier in cls._tiers.values():
+            tier.shutdown()
+        cls._tiers = {}
+        if cls._registry is not None:
+            cls._registry.shutdown()
+            cls._registry = None
+
+    def __init__(self, streaming: bool = False, model: str = None, language: str = None, compute_type: str = None):
         self._is_open = False
+        self.streaming = streaming
+        self.stream = None
+        self.language = language or STT_LANGUAGE_CODE
+        # (model, compute type) of a session that does not use the shared default model
+        self.selected_model = select_model(model, compute_type, language)
+        self.pool = None
 
     async def initialize(self, text_handler: callable = None):
+        if self.selected_model and self.pool is None:
+            self.pool = await self.get_registry().acquire(*self.selected_model)
         self._is_open = True
-        # We don't need to do anything with text_handler for this implementation
-        logger.info("FasterWhisperSTT initialized.")
+        # Only the streaming mode reports results through text_handler
+        if self.streaming and self.stream is None:
+            self.stream = WhisperStream(self.pool or self.get_pool(), text_handler, self.language, self._plan)
+        logger.info(f"FasterWhisperSTT initialized (streaming: {self.streaming}, model: {self.selected_model}).")
+
+    def _plan(self, **options) -> tuple:
+        """Selected models decode as asked, the shared default model is degraded under load."""
+        options = {"language": self.language, **options}
+        if self.pool is not None:
+            return self.pool, options
+        return self.plan(**options)
 
     async def transcribe(self, data):
         if not self._is_open:
             await self.initialize()
 
+        if self.stream:
+            # Interim and final transcripts are sent through text_handler
+            self.stream.feed(data)
+            return ''
+
         logger.info("Received segment of size: %d", len(data))
         result = ""
-        
-        raw_audio_array = np.frombuffer(data, np.int16).flatten().astype(np.float32) / 32768.0
-        
-        model = self.get_model()  # Get the shared model instance
-        segments, info = model.transcribe(audio=raw_audio_array, language=STT_LANGUAGE_CODE)
-        for segment in segments:
-            logger.info("[%.2fs -> %.2fs] %s", segment.start, segment.end, segment.text)
-            result += segment.text + " "
-        
+
+        # Decoding runs on a worker process, the event loop stays free for other sessions
+        pool, options = self._plan()
+        # Only the shared default model is batched and cascaded
+        shared = self.pool is None and pool is self.get_pool()
+        engine = self.get_engine() if shared else pool
+        if STT_CHUNKING and len(data) >= STT_CHUNK_MIN_S * SAMPLE_RATE * 2:
+            # Long monologues skip the cascade, the fast model would escalate most of their chunks
+            transcription = await transcribe_chunked(engine, data, **options)
+        elif shared and STT_CASCADE:
+            transcription = await self._cascade(data, options)
+        else:
+            transcription = await engine.transcribe(data, **options)
+        Metrics.observe("stt_utterance_cpu_ms", transcription.get("cpu_s", 0.0) * 1000)
+        # Hallucinations on noise would otherwise cost a full agent turn
+        for segment in filter_segments(transcription["segments"]):
+            logger.info("[%.2fs -> %.2fs] %s", segment["start"], segment["end"], segment["text"])
+            result += segment["text"] + " "
+
         return result
 
+    async def _cascade(self, data, options: dict) -> dict:
+        """Decode with the fast model, and again with the main model if the result looks unreliable."""
+        fast = await self.get_cascade_pool().transcribe(data, **options)
+        Metrics.observe("stt_cascade_cpu_ms", fast.get("cpu_s", 0.0) * 1000, tier="fast")
+        reason = escalation_reason(fast)
+        if reason is None:
+            Metrics.increment("stt_cascade_utterances", result="accepted")
+            return fast
+        Metrics.increment("stt_cascade_utterances", result="escalated")
+        Metrics.increment("stt_cascade_escalations", reason=reason)
+        logger.info(f"Escalating utterance to the main model ({reason}).")
+        full = await self.get_engine().transcribe(data, **options)
+        Metrics.observe("stt_cascade_cpu_ms", full.get("cpu_s", 0.0) * 1000, tier="full")
+        # The utterance cost both decodes
+        return {**full, "cpu_s": fast.get("cpu_s", 0.0) + full.get("cpu_s", 0.0)}
+
+    async def transcribe_segments(self, data):
+        if not self._is_open:
+            await self.initialize()
+
+        logger.info("Received segment of size: %d", len(data))
+        start = time.perf_counter()
+        first = True
+        rejected = 0
+        # Segments are yielded while the worker is still decoding the rest of the utterance
+        pool, options = self._plan()
+        # Closed explicitly, an abandoned generator would hold its shared memory block until collected
+        async with aclosing(pool.transcribe_segments(data, **options)) as segments:
+            async for segment in segments:
+                if not keep_segment(segment):
+                    rejected += 1
+                    continue
+                if first:
+                    Metrics.observe("stt_first_segment_ms", (time.perf_counter() - start) * 1000)
+                    first = False
+                logger.info("[%.2fs -> %.2fs] %s", segment["start"], segment["end"], segment["text"])
+                yield segment["text"]
+        if rejected and first:
+            reject_utterance()
+
+    async def end_utterance(self) -> str:
+        if self.stream:
+            await self.stream.finish()
+        return ''
+
     async def close(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.pool is not None:
+            self.get_registry().release(*self.selected_model)
+            self.pool = None
         self._is_open = False
         logger.info("FasterWhisperSTT connection closed.")
 
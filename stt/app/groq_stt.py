@@ -1,9 +1,15 @@
-import io
 import os
 import json
+import time
+import random
+import asyncio
 import logging
-from groq import Groq
+import contextvars
+import httpx
+from groq import AsyncGroq, APIConnectionError, RateLimitError, InternalServerError
 from stt_interface import STTInterface
+from audio_encoding import encode_upload, GROQ_STT_UPLOAD_ENCODING
+from metrics import Metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +18,43 @@ logger = logging.getLogger(__name__)
 STT_LANGUAGE_CODE = os.getenv('STT_LANGUAGE_CODE', 'en')
 NO_SPEECH_THRESHOLD = float(os.getenv('NO_SPEECH_THRESHOLD', '0.7'))
 API_KEY = os.environ.get('GROQ_STT_API_KEY', '')
+GROQ_STT_TIMEOUT_S = float(os.environ.get('GROQ_STT_TIMEOUT_S', '10'))
+GROQ_STT_MAX_RETRIES = int(os.environ.get('GROQ_STT_MAX_RETRIES', '2'))
+GROQ_STT_BACKOFF_S = float(os.environ.get('GROQ_STT_BACKOFF_S', '0.2'))
+GROQ_STT_MAX_CONNECTIONS = int(os.environ.get('GROQ_STT_MAX_CONNECTIONS', '32'))
+GROQ_STT_KEEPALIVE_S = float(os.environ.get('GROQ_STT_KEEPALIVE_S', '60'))
+
+# Errors worth another attempt, anything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError, asyncio.TimeoutError)
+
+# Timestamps of the HTTP request currently in flight in this task
+_request_timings = contextvars.ContextVar('groq_request_timings', default=None)
+
+
+async def _trace(event: str, info: dict):
+    """httpcore trace callback, records when the upload finished and the response headers arrived."""
+    timings = _request_timings.get()
+    if timings is None:
+        return
+    if event.endswith('send_request_body.complete'):
+        timings['uploaded'] = time.perf_counter()
+    elif event.endswith('receive_response_headers.complete'):
+        timings['headers'] = time.perf_counter()
+    elif event == 'connection.connect_tcp.started':
+        timings['new_connection'] = True
+
+
+async def _add_trace(request: httpx.Request):
+    request.extensions['trace'] = _trace
+
+
+def _record_timings(timings: dict):
+    if 'uploaded' in timings:
+        Metrics.observe('stt_groq_upload_ms', (timings['uploaded'] - timings['started']) * 1000)
+        if 'headers' in timings:
+            Metrics.observe('stt_groq_server_ms', (timings['headers'] - timings['uploaded']) * 1000)
+    if timings.get('new_connection'):
+        Metrics.increment('stt_groq_new_connections')
 
 class GroqSTT(STTInterface):
     _model = None  # Class-level attribute to store the shared Groq instance
@@ -19,10 +62,24 @@ class GroqSTT(STTInterface):
     @classmethod
     def get_model(cls):
         if cls._model is None:
-            cls._model = Groq(api_key=API_KEY)
+            # One keep-alive connection pool shared by every session; retries are handled in transcribe
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=GROQ_STT_MAX_CONNECTIONS,
+                    max_keepalive_connections=GROQ_STT_MAX_CONNECTIONS,
+                    keepalive_expiry=GROQ_STT_KEEPALIVE_S,
+                ),
+                timeout=httpx.Timeout(GROQ_STT_TIMEOUT_S, connect=min(5.0, GROQ_STT_TIMEOUT_S)),
+                event_hooks={'request': [_add_trace]},
+            )
+            cls._model = AsyncGroq(api_key=API_KEY, http_client=http_client, max_retries=0)
             logger.info("Groq model initialized.")
         return cls._model
 
+    @classmethod
+    async def preload(cls):
+        cls.get_model()
+
     def __init__(self):
         self._is_open = False
 
@@ -30,52 +87,22 @@ class GroqSTT(STTInterface):
         self._is_open = True
         logger.info("GroqSTT initialized.")
 
-    def generate_wav_header(self, num_channels, num_samples, sample_rate, bits_per_sample)->bytearray:
-        # Generate the WAV header
-        byte_rate = sample_rate * num_channels * bits_per_sample // 8
-        block_align = num_channels * bits_per_sample // 8
-
-        header = bytearray()
-        header.extend(b'RIFF')
-        header.extend((num_samples + 36).to_bytes(4, 'little'))
-        header.extend(b'WAVE')
-        header.extend(b'fmt ')
-        header.extend((16).to_bytes(4, 'little'))
-        header.extend((1).to_bytes(2, 'little'))
-        header.extend(num_channels.to_bytes(2, 'little'))
-        header.extend(sample_rate.to_bytes(4, 'little'))
-        header.extend(byte_rate.to_bytes(4, 'little'))
-        header.extend(block_align.to_bytes(2, 'little'))
-        header.extend(bits_per_sample.to_bytes(2, 'little'))
-        header.extend(b'data')
-        header.extend(num_samples.to_bytes(4, 'little'))
-
-        return header
-
     async def transcribe(self, data)->str:
         if not self._is_open:
             await self.initialize()
         
         logger.info("Transcribing audio using Groq API...")
-        header = self.generate_wav_header(
-            num_channels=1,
-            num_samples=len(data),
-            sample_rate=16000,
-            bits_per_sample=16
-        )
+        started = time.perf_counter()
+        if GROQ_STT_UPLOAD_ENCODING == 'wav':
+            upload = encode_upload(data, 'wav')
+        else:
+            upload = await asyncio.to_thread(encode_upload, data, GROQ_STT_UPLOAD_ENCODING)
+        Metrics.observe('stt_groq_encode_ms', (time.perf_counter() - started) * 1000, encoding=GROQ_STT_UPLOAD_ENCODING)
+        Metrics.observe('stt_groq_upload_bytes', len(upload[1]), encoding=GROQ_STT_UPLOAD_ENCODING)
 
-        # Combine the header and raw_audio_array
-        audio_data = header + data
-        stream = io.BytesIO(audio_data)
-
-        model = self.get_model()  # Get the shared model instance
-        transcription = model.audio.transcriptions.create(
-            file=('audio.wav', stream.read()),
-            model="whisper-large-v3",
-            response_format="verbose_json",
-            temperature=0.0,
-            language=STT_LANGUAGE_CODE
-        )
+        transcription = await self.create_transcription(upload)
+        if transcription is None:
+            return ''
         logger.info('-----')
         logger.info(transcription) 
 
@@ -90,6 +117,51 @@ class GroqSTT(STTInterface):
         
         return transcription.text
     
+    async def create_transcription(self, file):
+        """Call the transcription API within GROQ_STT_TIMEOUT_S, retrying transient errors with jittered backoff.
+
+        Returns None once the deadline or the retry budget is exhausted so the
+        session keeps running.
+        """
+        model = self.get_model()  # Get the shared model instance
+        started = time.perf_counter()
+        deadline = started + GROQ_STT_TIMEOUT_S
+        attempt = 0
+        while True:
+            remaining = deadline - time.perf_counter()
+            timings = {'started': time.perf_counter()}
+            token = _request_timings.set(timings)
+            try:
+                transcription = await asyncio.wait_for(
+                    model.audio.transcriptions.create(
+                        file=file,
+                        model="whisper-large-v3",
+                        response_format="verbose_json",
+                        temperature=0.0,
+                        language=STT_LANGUAGE_CODE,
+                        timeout=remaining,
+                    ),
+                    timeout=remaining,
+                )
+                _record_timings(timings)
+                Metrics.observe('stt_groq_total_ms', (time.perf_counter() - started) * 1000)
+                return transcription
+            except RETRYABLE_ERRORS as e:
+                _record_timings(timings)
+                # Full jitter keeps concurrent sessions from retrying in lockstep
+                delay = random.uniform(0, GROQ_STT_BACKOFF_S * 2 ** attempt)
+                if attempt >= GROQ_STT_MAX_RETRIES or time.perf_counter() + delay >= deadline:
+                    reason = 'deadline' if isinstance(e, asyncio.TimeoutError) or time.perf_counter() + delay >= deadline else 'retries'
+                    Metrics.increment('stt_groq_failures', reason=reason)
+                    logger.error(f"Groq transcription failed after {attempt + 1} attempts: {e!r}")
+                    return None
+                attempt += 1
+                Metrics.increment('stt_groq_retries')
+                logger.warning(f"Groq transcription attempt {attempt} failed ({e!r}), retrying in {delay:.2f}s.")
+                await asyncio.sleep(delay)
+            finally:
+                _request_timings.reset(token)
+
     async def close(self):
         self._is_open = False
         logger.info("GroqSTT connection closed.")
@@ -0,0 +1,73 @@
+import os
+import re
+import logging
+from metrics import Metrics
+
+STT_HALLUCINATION_FILTER = os.environ.get("STT_HALLUCINATION_FILTER", "true").lower() == "true"
+# A segment is rejected when it crosses one of these thresholds
+STT_FILTER_MAX_NO_SPEECH_PROB = float(os.environ.get("STT_FILTER_MAX_NO_SPEECH_PROB", "0.7"))
+STT_FILTER_MIN_AVG_LOGPROB = float(os.environ.get("STT_FILTER_MIN_AVG_LOGPROB", "-1.0"))
+# Like Whisper's own check, a low log probability only rejects a segment that is also likely silence
+STT_FILTER_LOW_LOGPROB_NO_SPEECH_PROB = float(os.environ.get("STT_FILTER_LOW_LOGPROB_NO_SPEECH_PROB", "0.6"))
+STT_FILTER_MAX_COMPRESSION_RATIO = float(os.environ.get("STT_FILTER_MAX_COMPRESSION_RATIO", "2.4"))
+# Phrases Whisper learned from subtitled videos and produces on noise, separated by "|".
+# A segment is only rejected when its text is made of nothing else.
+STT_HALLUCINATION_PHRASES = os.environ.get(
+    "STT_HALLUCINATION_PHRASES",
+    "thanks for watching|thank you for watching|thank you so much for watching|please subscribe|"
+    "like and subscribe|subtitles by the amara org community|see you in the next video",
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w']+", " ", text.lower()).split())
+
+
+HALLUCINATION_PHRASES = [_normalize(phrase) for phrase in STT_HALLUCINATION_PHRASES.split("|") if _normalize(phrase)]
+_PHRASES = "|".join(re.escape(phrase) for phrase in HALLUCINATION_PHRASES)
+# One or more phrases and nothing else, "thanks for watching my dog" is real speech
+HALLUCINATION_PATTERN = re.compile(rf"(?:{_PHRASES})(?: (?:{_PHRASES}))*") if HALLUCINATION_PHRASES else None
+
+
+def rejection_reason(segment: dict) -> str:
+    """Return why a decoded segment is not forwarded, or None to keep it."""
+    if segment["no_speech_prob"] > STT_FILTER_MAX_NO_SPEECH_PROB:
+        return "no_speech_prob"
+    if (segment["avg_logprob"] < STT_FILTER_MIN_AVG_LOGPROB
+            and segment["no_speech_prob"] > STT_FILTER_LOW_LOGPROB_NO_SPEECH_PROB):
+        return "avg_logprob"
+    if segment["compression_ratio"] > STT_FILTER_MAX_COMPRESSION_RATIO:
+        return "compression_ratio"
+    if HALLUCINATION_PATTERN and HALLUCINATION_PATTERN.fullmatch(_normalize(segment["text"])):
+        return "phrase"
+    return None
+
+
+def keep_segment(segment: dict, record: bool = True) -> bool:
+    """Whether a segment is forwarded, rejected segments are counted unless record is False."""
+    if not STT_HALLUCINATION_FILTER:
+        return True
+    reason = rejection_reason(segment)
+    if reason is None:
+        return True
+    if record:
+        Metrics.increment("stt_rejected_segments", reason=reason)
+        logger.info(f"Rejected segment ({reason}): {segment['text']}")
+    return False
+
+
+def reject_utterance():
+    """Count an utterance whose segments were all rejected, it never reaches the agent."""
+    Metrics.increment("stt_rejected_utterances")
+
+
+def filter_segments(segments: list, record: bool = True) -> list:
+    """Drop the segments that are likely hallucinated."""
+    kept = [segment for segment in segments if keep_segment(segment, record)]
+    if record and segments and not kept:
+        reject_utterance()
+    return kept
@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+import logging
+from stt_interface import STTInterface
+from metrics import Metrics
+
+STT_HEDGE_PRIMARY = os.environ.get("STT_HEDGE_PRIMARY", "groq")
+STT_HEDGE_SECONDARY = os.environ.get("STT_HEDGE_SECONDARY", "faster_whisper")
+STT_HEDGE_DELAY_MS = float(os.environ.get("STT_HEDGE_DELAY_MS", "300"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class HedgedSTT(STTInterface):
+    """Races two utterance providers to cut tail latency.
+
+    Every utterance goes to the primary first. If it has not answered within
+    delay_ms, failed or returned no text, the secondary is started as well.
+    The first result with text is returned and the other request is
+    cancelled. Empty results only count once both providers are done,
+    since Groq also answers with no text when its retries run out.
+    """
+
+    def __init__(self, primary: STTInterface, secondary: STTInterface, delay_ms: float = STT_HEDGE_DELAY_MS):
+        self.primary = primary
+        self.secondary = secondary
+        self.delay = delay_ms / 1000
+        self._is_open = False
+
+    async def initialize(self, text_handler: callable = None):
+        await asyncio.gather(self.primary.initialize(text_handler), self.secondary.initialize(text_handler))
+        self._is_open = True
+        logger.info(f"HedgedSTT initialized (delay: {self.delay * 1000:.0f}ms).")
+
+    async def _timed(self, provider: STTInterface, data) -> tuple:
+        result = await provider.transcribe(data)
+        return result, time.perf_counter()
+
+    async def transcribe(self, data) -> str:
+        if not self._is_open:
+            await self.initialize()
+
+        start = time.perf_counter()
+        names = {asyncio.create_task(self._timed(self.primary, data)): "primary"}
+        started = {"primary": start}
+        pending = set(names)
+        error = None
+        empty = None
+        try:
+            while pending:
+                # Until the secondary is running only wait for the hedge delay
+                hedged = len(names) == 2
+                timeout = None if hedged else max(0.0, start + self.delay - time.perf_counter())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        logger.warning(f"Hedged {names[task]} STT failed: {error!r}")
+                    elif task.result()[0]:
+                        return self._finish(names, task, started, start)
+                    else:
+                        empty = task
+                        logger.info(f"Hedged {names[task]} STT returned no text.")
+
+                if not hedged:
+                    # The primary is slow, failed or has no text, start the secondary
+                    reason = "delay" if not done else "empty" if empty else "error"
+                    Metrics.increment("stt_hedge_secondary_started", reason=reason)
+                    secondary = asyncio.create_task(self._timed(self.secondary, data))
+                    names[secondary] = "secondary"
+                    started["secondary"] = time.perf_counter()
+                    pending.add(secondary)
+            if empty is not None:
+                # Neither provider heard any speech
+                return self._finish(names, empty, started, start)
+            Metrics.increment("stt_hedge_failures")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _finish(self, names: dict, winner: asyncio.Task, started: dict, start: float) -> str:
+        result, finished = winner.result()
+        name = names[winner]
+        Metrics.increment("stt_hedge_wins", winner=name)
+        Metrics.observe("stt_hedge_latency_ms", (finished - start) * 1000, winner=name)
+        for task, loser in names.items():
+            if task is winner:
+                continue
+            if task.done() and not task.cancelled() and task.exception() is None:
+                # Both answered, the margin is exact
+                margin = (task.result()[1] - finished) * 1000
+                Metrics.observe("stt_hedge_margin_ms", margin, winner=name)
+            elif not task.done():
+                # The loser is cancelled, its latency is at least the time it has been running
+                Metrics.observe("stt_hedge_loser_elapsed_ms", (finished - started[loser]) * 1000, loser=loser)
+        logger.info(f"Hedged STT won by {name} after {(finished - start) * 1000:.0f}ms.")
+        return result
+
+    async def end_utterance(self) -> str:
+        return ''
+
+    async def close(self):
+        await asyncio.gather(self.primary.close(), self.secondary.close())
+        self._is_open = False
+        logger.info("HedgedSTT connection closed.")
+
+    @property
+    def is_open(self) -> bool:
+        return self._is_open
@@ -1,52 +1,326 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
 import os
+import json
+import time
+import asyncio
 import logging
+from contextlib import aclosing
 from groq_stt import GroqSTT
 from deepgram_stt import DeepGramSTT
 from faster_whisper_stt import FasterWhisperSTT
+from hedged_stt import HedgedSTT, STT_HEDGE_PRIMARY, STT_HEDGE_SECONDARY
+from metrics import Metrics
+from whisper_autotune import ensure_profile, WHISPER_AUTOTUNE
+from vad_trim import trim_utterance, STT_VAD_TRIM
+from session_limiter import SessionLimiter
+from utterance_framing import UtteranceAssembler, parse_frame
+from audio_decoding import AudioDecoder
 
 app = FastAPI()
 STT_PROVIDER = os.environ.get("STT_PROVIDER", "faster_whisper")
+# Messages read ahead of the transcriber before the receiver stops reading the socket
+STT_RECEIVE_QUEUE_SIZE = int(os.environ.get("STT_RECEIVE_QUEUE_SIZE", "8"))
+# Utterances of a framed session that are transcribed concurrently
+STT_PIPELINE_DEPTH = int(os.environ.get("STT_PIPELINE_DEPTH", "2"))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PROVIDERS = {
+    "faster_whisper": FasterWhisperSTT,
+    "groq": GroqSTT,
+    "deepgram": DeepGramSTT,
+}
+
 class STTFactory:
-    _instance = None
+    """Creates one provider session per websocket connection.
+
+    Sessions only hold per-connection state (buffers, text handler, upstream
+    stream). Heavy resources such as Whisper workers and SDK clients are
+    class-level attributes of the providers and shared by all sessions.
+    """
 
     @classmethod
-    def get_instance(cls, provider: str):
-        if cls._instance is None:
-            if provider == "faster_whisper":
-                cls._instance = FasterWhisperSTT()
-            elif provider == "groq":
-                cls._instance = GroqSTT()
-            elif provider == "deepgram":
-                cls._instance = DeepGramSTT()
-            else:
-                raise ValueError(f"Unsupported STT provider: {provider}")
-        return cls._instance
+    def get_instance(cls, provider: str, streaming: bool = False, endpointing_ms: int = None, utterance_end_ms: int = None,
+                     model: str = None, language: str = None, compute_type: str = None):
+        if streaming and provider not in ("faster_whisper", "deepgram"):
+            raise ValueError(f"Streaming is not supported for STT provider: {provider}")
+        if provider != "faster_whisper" and (model or language or compute_type):
+            raise ValueError(f"Model selection is not supported for STT provider: {provider}")
+        if provider == "faster_whisper":
+            return FasterWhisperSTT(streaming=streaming, model=model, language=language, compute_type=compute_type)
+        elif provider == "deepgram":
+            return DeepGramSTT(streaming=streaming, endpointing_ms=endpointing_ms, utterance_end_ms=utterance_end_ms)
+        elif provider == "hedged":
+            # Deepgram answers through its live stream, only utterance providers can be raced
+            if {STT_HEDGE_PRIMARY, STT_HEDGE_SECONDARY} & {"deepgram", "hedged"}:
+                raise ValueError(f"Cannot hedge STT providers {STT_HEDGE_PRIMARY} and {STT_HEDGE_SECONDARY}")
+            return HedgedSTT(cls.get_instance(STT_HEDGE_PRIMARY), cls.get_instance(STT_HEDGE_SECONDARY))
+        elif provider in PROVIDERS:
+            return PROVIDERS[provider]()
+        else:
+            raise ValueError(f"Unsupported STT provider: {provider}")
+
+    @classmethod
+    async def preload(cls, provider: str):
+        if provider == "hedged":
+            await asyncio.gather(cls.preload(STT_HEDGE_PRIMARY), cls.preload(STT_HEDGE_SECONDARY))
+            return
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unsupported STT provider: {provider}")
+        await PROVIDERS[provider].preload()
+
+    @classmethod
+    def admit(cls, provider: str) -> bool:
+        # A hedged session mostly loads its primary, the secondary only takes the slow tail
+        if provider == "hedged":
+            return cls.admit(STT_HEDGE_PRIMARY)
+        return PROVIDERS[provider].admit() if provider in PROVIDERS else True
+
+async def warm_up() -> dict:
+    start = time.perf_counter()
+    # Benchmark compute profiles once, later boots load the persisted result
+    try:
+        providers = (STT_HEDGE_PRIMARY, STT_HEDGE_SECONDARY) if STT_PROVIDER == "hedged" else (STT_PROVIDER,)
+        if WHISPER_AUTOTUNE and "faster_whisper" in providers:
+            await ensure_profile()
+        await STTFactory.preload(STT_PROVIDER)
+    except Exception:
+        logger.exception(f"Warming up STT provider {STT_PROVIDER} failed.")
+        raise
+    warmup_ms = (time.perf_counter() - start) * 1000
+    Metrics.set_gauge("stt_ready_ms", warmup_ms)
+    logger.info(f"STT provider {STT_PROVIDER} ready after {warmup_ms:.0f}ms.")
+    return {"provider": STT_PROVIDER, "warmup_ms": warmup_ms}
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Models load in the background so /ready can report progress while the server is up
+    app.state.warm_up = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shut_down():
+    # Worker processes would outlive the server otherwise
+    await FasterWhisperSTT.shutdown()
+
+@app.get("/ready")
+async def ready():
+    task = getattr(app.state, "warm_up", None)
+    if task is None or not task.done():
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    if task.cancelled() or task.exception() is not None:
+        error = "cancelled" if task.cancelled() else repr(task.exception())
+        return JSONResponse({"status": "failed", "error": error}, status_code=503)
+    return {"status": "ready", **task.result()}
+
+@app.get("/api/v1/metrics")
+async def metrics():
+    return Metrics.snapshot()
 
 @app.websocket("/api/v1/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    stt_model = STTFactory.get_instance(STT_PROVIDER)
+async def websocket_endpoint(websocket: WebSocket, mode: str = "utterance", results: str = "utterance",
+                             endpointing_ms: int = None, utterance_end_ms: int = None, protocol: str = "raw",
+                             codec: str = "pcm", sample_rate: int = 16000, channels: int = 1,
+                             model: str = None, language: str = None, compute_type: str = None):
     await websocket.accept()
     try:
-        logger.info("WebSocket connection established.")
+        decoder = AudioDecoder(codec, sample_rate, channels)
+        # Endpoint timing only applies to Deepgram streaming sessions, model selection to Faster Whisper
+        stt_model = STTFactory.get_instance(STT_PROVIDER, streaming=(mode == "streaming"),
+                                            endpointing_ms=endpointing_ms, utterance_end_ms=utterance_end_ms,
+                                            model=model, language=language, compute_type=compute_type)
+    except ValueError as e:
+        logger.warning(f"Rejecting session: {e}")
+        # 1003: the client sends audio or asks for a model the service cannot handle
+        await websocket.close(code=1003)
+        return
+    warming_up = getattr(app.state, "warm_up", None)
+    # Pools created before warm-up finished would ignore the autotuned profile for good
+    if (warming_up is not None and not warming_up.done()) or not STTFactory.admit(STT_PROVIDER) \
+            or not SessionLimiter.try_acquire():
+        # 1013: try again later, the client can reconnect or go to another replica
+        await websocket.close(code=1013)
+        return
+
+    framed = protocol == "framed"
+    # Streamed audio and Deepgram's live connection must be fed in order, whole utterances can overlap
+    depth = STT_PIPELINE_DEPTH if framed and mode != "streaming" and STT_PROVIDER != "deepgram" else 1
+    # The receiver keeps reading the socket while the transcriber works through the queue
+    queue = asyncio.Queue(maxsize=STT_RECEIVE_QUEUE_SIZE)
+    running = {}
+    cancelled = set()
+    current = None
+    disconnected = False
+    try:
+        logger.info(f"WebSocket connection established (mode: {mode}, protocol: {protocol}, codec: {codec}).")
+
+        async def send(text, utterance_id=None, **fields):
+            if disconnected:
+                return
+            if utterance_id is not None:
+                fields["utterance_id"] = utterance_id
+            # Structured results such as interim transcripts are sent as JSON
+            if fields:
+                await websocket.send_json({"text": text, **fields})
+            else:
+                await websocket.send_text(text)
+
+        async def text_handler(text, **fields):
+            # Results the provider pushes belong to the utterance that is being fed
+            await send(text, current, **fields)
+
+        async def send_segments(utterance_id, data):
+            # Send each segment as soon as it is decoded, then a final marker
+            index = 0
+            if data:
+                # A cancelled utterance closes the generator right away, releasing the worker's job
+                async with aclosing(stt_model.transcribe_segments(data)) as segments:
+                    async for text in segments:
+                        await send(text, utterance_id, type="segment", index=index, final=False)
+                        index += 1
+            await send("", utterance_id, type="segment", index=index, final=True)
+
+        # Whole utterances are trimmed before inference, streamed frames are left untouched
+        vad_trim = STT_VAD_TRIM and mode != "streaming" and STT_PROVIDER != "deepgram"
+
+        async def process(kind, utterance_id, data):
+            nonlocal current
+            current = utterance_id
+            try:
+                if kind == "end":
+                    # The client detected the end of the utterance
+                    result = await stt_model.end_utterance()
+                else:
+                    if vad_trim:
+                        data = await trim_utterance(data)
+                    if results == "segments":
+                        await send_segments(utterance_id, data)
+                        return
+                    if not data:
+                        return
+                    result = await stt_model.transcribe(data)
+                if result:
+                    # Framed results are tagged, the client may get them out of order
+                    await send(result, utterance_id, **({"type": "final"} if framed else {}))
+            except Exception as e:
+                if disconnected:
+                    return
+                Metrics.increment("stt_transcription_errors")
+                logger.exception(f"Transcribing utterance {utterance_id} failed.")
+                if framed:
+                    await send("", utterance_id, type="error", error=repr(e))
+
+        async def decode(data, end=False):
+            Metrics.increment("stt_ingest_bytes", len(data), codec=codec)
+            if mode == "streaming" or decoder.passthrough:
+                return decoder.decode(data, end)
+            # Whole utterances are decoded off the event loop
+            return await asyncio.to_thread(decoder.decode, data, end)
+
+        async def receive_loop():
+            nonlocal disconnected
+            assembler = UtteranceAssembler()
+            try:
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        disconnected = True
+                        raise WebSocketDisconnect(message.get("code", 1000))
+
+                    items = []
+                    if message.get("bytes") is None:
+                        try:
+                            control = json.loads(message["text"])
+                            if not isinstance(control, dict):
+                                raise ValueError("control messages must be JSON objects")
+                        except ValueError as e:
+                            logger.warning(f"Invalid control message: {e}")
+                            await send("", type="error", error=str(e))
+                            continue
+                        if control.get("action") == "end":
+                            utterance_id = control.get("utterance_id", current)
+                            if mode == "streaming" and not decoder.passthrough:
+                                # Audio still buffered in the decoder belongs to this utterance
+                                tail = await decode(b"", end=True)
+                                if tail:
+                                    items.append(("audio", utterance_id, tail))
+                            items.append(("end", utterance_id, None))
+                        elif control.get("action") == "cancel" and framed and "utterance_id" in control:
+                            # The orchestrator no longer needs this result
+                            utterance_id = control.get("utterance_id")
+                            Metrics.increment("stt_utterances_cancelled")
+                            assembler.discard(utterance_id)
+                            cancelled.add(utterance_id)
+                            if utterance_id in running:
+                                running[utterance_id].cancel()
+                    else:
+                        try:
+                            if not framed:
+                                items.append(("audio", None, await decode(message["bytes"], mode != "streaming")))
+                            else:
+                                utterance_id, seq, end, payload = parse_frame(message["bytes"])
+                                if mode == "streaming":
+                                    # Frames are fed as they arrive, the end flag finalizes the utterance
+                                    items.append(("audio", utterance_id, await decode(payload, end)))
+                                    if end:
+                                        items.append(("end", utterance_id, None))
+                                else:
+                                    data = assembler.add(utterance_id, seq, end, payload)
+                                    if data is not None:
+                                        items.append(("audio", utterance_id, await decode(data, True)))
+                        except ValueError as e:
+                            logger.warning(f"Invalid audio message: {e}")
+                            await send("", type="error", error=str(e))
+
+                    for kind, utterance_id, data in items:
+                        # Blocks when the transcriber falls behind, which pushes back on the client
+                        await queue.put((kind, utterance_id, data, time.perf_counter()))
+                        Metrics.observe("stt_receive_queue_depth", queue.qsize())
+            finally:
+                await queue.put(None)
+
+        async def transcribe_loop():
+            slots = asyncio.Semaphore(depth)
+            tasks = set()
+            while (item := await queue.get()) is not None:
+                kind, utterance_id, data, queued = item
+                await slots.acquire()
+                Metrics.observe("stt_receive_queue_ms", (time.perf_counter() - queued) * 1000)
+                if utterance_id in cancelled:
+                    slots.release()
+                    continue
+                task = asyncio.create_task(process(kind, utterance_id, data))
+                tasks.add(task)
+                if framed and kind == "audio":
+                    running[utterance_id] = task
+
+                def done(task, utterance_id=utterance_id):
+                    slots.release()
+                    tasks.discard(task)
+                    if running.get(utterance_id) is task:
+                        del running[utterance_id]
 
-        async def text_handler(text):
-            await websocket.send_text(text)
+                task.add_done_callback(done)
+            # Finish what was received before the client went away
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         await stt_model.initialize(text_handler)
 
-        while True:
-            data = await websocket.receive_bytes()
-            result = await stt_model.transcribe(data)
+        receiver = asyncio.create_task(receive_loop())
+        try:
+            await transcribe_loop()
+        finally:
+            if not receiver.done():
+                receiver.cancel()
+        await receiver
 
-            if result:
-                await websocket.send_text(result)
-                
     except WebSocketDisconnect:
-        await stt_model.close()
         logger.info("Client disconnected")
+    finally:
+        # Shared models, pooled connections and ring buffers are released however the session ends
+        try:
+            await stt_model.close()
+        finally:
+            SessionLimiter.release()
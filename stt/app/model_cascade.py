@@ -0,0 +1,45 @@
+import os
+import logging
+from whisper_worker_pool import WHISPER_MODEL
+
+STT_CASCADE = os.environ.get("STT_CASCADE", "false").lower() == "true"
+# Fast model every utterance is decoded with first
+WHISPER_CASCADE_MODEL = os.environ.get("WHISPER_CASCADE_MODEL", "tiny")
+WHISPER_CASCADE_WORKERS = int(os.environ.get("WHISPER_CASCADE_WORKERS", "1"))
+# A fast decode is re-decoded with the main model when one of its segments crosses a threshold
+STT_CASCADE_MIN_AVG_LOGPROB = float(os.environ.get("STT_CASCADE_MIN_AVG_LOGPROB", "-0.5"))
+STT_CASCADE_MAX_NO_SPEECH_PROB = float(os.environ.get("STT_CASCADE_MAX_NO_SPEECH_PROB", "0.5"))
+STT_CASCADE_MAX_COMPRESSION_RATIO = float(os.environ.get("STT_CASCADE_MAX_COMPRESSION_RATIO", "2.4"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def cascade_enabled(enabled: bool, model: str, cascade_model: str) -> bool:
+    """The cascade only saves CPU when the fast model is smaller than the main model."""
+    if enabled and cascade_model == model:
+        logger.warning(f"Disabling the model cascade, WHISPER_CASCADE_MODEL and WHISPER_MODEL are both {model}. "
+                       f"Set WHISPER_MODEL to a larger model than the cascade model.")
+        return False
+    return enabled
+
+
+STT_CASCADE = cascade_enabled(STT_CASCADE, WHISPER_MODEL, WHISPER_CASCADE_MODEL)
+
+
+def escalation_reason(transcription: dict) -> str:
+    """Return why a decode of the fast model is not trusted, or None to accept it.
+
+    A decode without segments is accepted, the fast model is as good as the
+    main one at telling silence apart.
+    """
+    for segment in transcription["segments"]:
+        if segment["avg_logprob"] < STT_CASCADE_MIN_AVG_LOGPROB:
+            return "avg_logprob"
+        if segment["no_speech_prob"] > STT_CASCADE_MAX_NO_SPEECH_PROB:
+            return "no_speech_prob"
+        # Repetitive output is the typical hallucination of small models
+        if segment["compression_ratio"] > STT_CASCADE_MAX_COMPRESSION_RATIO:
+            return "compression_ratio"
+    return None
@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from faster_whisper.tokenizer import _LANGUAGE_CODES
+from whisper_worker_pool import WhisperWorkerPool, WHISPER_MODEL, WHISPER_COMPUTE_TYPE
+from metrics import Metrics
+
+# Models and compute types a session may ask for besides WHISPER_MODEL and WHISPER_COMPUTE_TYPE
+STT_ALLOWED_MODELS = [model for model in os.environ.get("STT_ALLOWED_MODELS", "").split(",") if model]
+STT_ALLOWED_COMPUTE_TYPES = [
+    compute_type for compute_type in os.environ.get("STT_ALLOWED_COMPUTE_TYPES", "").split(",") if compute_type
+]
+# Resident memory the models loaded on demand may use together, 0 for no limit
+STT_MODEL_MEMORY_BUDGET_MB = float(os.environ.get("STT_MODEL_MEMORY_BUDGET_MB", "0"))
+WHISPER_SESSION_MODEL_WORKERS = int(os.environ.get("WHISPER_SESSION_MODEL_WORKERS", "1"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def select_model(model: str = None, compute_type: str = None, language: str = None) -> tuple:
+    """Validate the model a session asks for, return its (model, compute type) or None for the default."""
+    model = model or WHISPER_MODEL
+    compute_type = compute_type or WHISPER_COMPUTE_TYPE
+    if model != WHISPER_MODEL and model not in STT_ALLOWED_MODELS:
+        raise ValueError(f"Unsupported Whisper model: {model}")
+    if compute_type != WHISPER_COMPUTE_TYPE and compute_type not in STT_ALLOWED_COMPUTE_TYPES:
+        raise ValueError(f"Unsupported compute type: {compute_type}")
+    if language is not None and language not in _LANGUAGE_CODES:
+        raise ValueError(f"Unsupported language: {language}")
+    if (model, compute_type) == (WHISPER_MODEL, WHISPER_COMPUTE_TYPE):
+        return None
+    return model, compute_type
+
+
+def process_rss_mb(pid: int) -> float:
+    """Resident memory of a process, 0 when it is gone."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class ModelRegistry:
+    """Worker pools of the Whisper models that sessions select at connect time.
+
+    A model is loaded by the first session that asks for it and shared by
+    every later one. Sessions hold a model from acquire() to release().
+    Once the resident memory of all loaded models exceeds the budget, the
+    least recently used models without sessions are shut down.
+    """
+
+    def __init__(self, budget_mb: float = STT_MODEL_MEMORY_BUDGET_MB, num_workers: int = WHISPER_SESSION_MODEL_WORKERS):
+        self.budget_mb = budget_mb
+        self.num_workers = num_workers
+        # (model, compute type) -> pool, sessions and the task loading the workers, least recently used first
+        self._entries = OrderedDict()
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._entries
+
+    async def acquire(self, model: str, compute_type: str):
+        """Return the pool of a model for a new session, loading it first if needed."""
+        key = (model, compute_type)
+        entry = self._entries.get(key)
+        if entry is None:
+            logger.info(f"Loading Whisper model {model} ({compute_type}) for a session.")
+            Metrics.increment("stt_model_loads", model=model, compute_type=compute_type)
+            pool = WhisperWorkerPool(num_workers=self.num_workers, model_size=model, compute_type=compute_type)
+            entry = {"pool": pool, "sessions": 0, "loading": asyncio.ensure_future(self._load(pool, model))}
+            self._entries[key] = entry
+            Metrics.set_gauge("stt_loaded_models", len(self._entries))
+        else:
+            Metrics.increment("stt_model_hits", model=model, compute_type=compute_type)
+        self._entries.move_to_end(key)
+        entry["sessions"] += 1
+        try:
+            # A session that goes away does not cancel the load the other sessions wait for
+            await asyncio.shield(entry["loading"])
+        except BaseException:
+            entry["sessions"] -= 1
+            if entry["loading"].done() and self._entries.get(key) is entry:
+                Metrics.increment("stt_model_load_errors", model=model, compute_type=compute_type)
+                self._remove(key)
+            raise
+        self.enforce_budget()
+        return entry["pool"]
+
+    @staticmethod
+    async def _load(pool, model: str):
+        start = time.perf_counter()
+        for worker in await pool.start():
+            Metrics.observe("stt_model_load_ms", worker["load_s"] * 1000, model=model)
+        logger.info(f"Whisper model {model} ready in {time.perf_counter() - start:.2f}s.")
+
+    def release(self, model: str, compute_type: str):
+        """Give back the model of a closed session, it stays loaded until the budget needs the memory."""
+        entry = self._entries.get((model, compute_type))
+        if entry is None:
+            return
+        entry["sessions"] -= 1
+        self._entries.move_to_end((model, compute_type))
+        self.enforce_budget()
+
+    def memory_mb(self) -> dict:
+        """Resident memory of the workers of each loaded model."""
+        return {
+            key: sum(process_rss_mb(pid) for pid in entry["pool"].ready_workers)
+            for key, entry in self._entries.items()
+        }
+
+    def enforce_budget(self):
+        """Shut down the least recently used idle models until the loaded ones fit the budget."""
+        if not self.budget_mb:
+            return
+        usage = self.memory_mb()
+        total = sum(usage.values())
+        for key in list(self._entries):
+            if total <= self.budget_mb:
+                break
+            entry = self._entries[key]
+            if entry["sessions"] or entry["pool"].pending or not entry["loading"].done():
+                continue
+            logger.info(f"Evicting Whisper model {key[0]} ({key[1]}), {total:.0f}MB loaded.")
+            Metrics.increment("stt_model_evictions", model=key[0], compute_type=key[1])
+            self._remove(key)
+            total -= usage[key]
+        if total > self.budget_mb:
+            logger.warning(f"Whisper models in use take {total:.0f}MB, over the budget of {self.budget_mb:.0f}MB.")
+        Metrics.set_gauge("stt_model_memory_mb", total)
+
+    def _remove(self, key: tuple):
+        self._entries.pop(key)["pool"].shutdown()
+        Metrics.set_gauge("stt_loaded_models", len(self._entries))
+
+    def shutdown(self):
+        for key in list(self._entries):
+            self._remove(key)
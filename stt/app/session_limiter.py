@@ -0,0 +1,34 @@
+import os
+import logging
+from metrics import Metrics
+
+STT_MAX_SESSIONS = int(os.environ.get("STT_MAX_SESSIONS", "0"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SessionLimiter:
+    """Counts active websocket sessions and enforces STT_MAX_SESSIONS (0 means unlimited)."""
+
+    _active = 0
+
+    @classmethod
+    def try_acquire(cls) -> bool:
+        if STT_MAX_SESSIONS and cls._active >= STT_MAX_SESSIONS:
+            Metrics.increment("stt_rejected_sessions", reason="max_sessions")
+            logger.warning(f"Rejecting session, {cls._active} of {STT_MAX_SESSIONS} sessions active.")
+            return False
+        cls._active += 1
+        Metrics.set_gauge("stt_active_sessions", cls._active)
+        return True
+
+    @classmethod
+    def release(cls):
+        cls._active = max(0, cls._active - 1)
+        Metrics.set_gauge("stt_active_sessions", cls._active)
+
+    @classmethod
+    def active(cls) -> int:
+        return cls._active
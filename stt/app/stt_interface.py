@@ -14,6 +14,29 @@ class STTInterface(ABC):
         """Transcribe audio data to text."""
         pass
 
+    @classmethod
+    async def preload(cls):
+        """Create the shared resources (models, clients) before the first session needs them."""
+        pass
+
+    @classmethod
+    def admit(cls) -> bool:
+        """Whether the provider has capacity for a new session."""
+        return True
+
+    async def transcribe_segments(self, data: bytearray):
+        """Yield transcript segments as they are decoded.
+
+        Providers without incremental results yield the whole utterance once.
+        """
+        text = await self.transcribe(data)
+        if text:
+            yield text
+
+    async def end_utterance(self) -> str:
+        """Signal the end of the current utterance to streaming providers."""
+        return ''
+
     @abstractmethod
     async def close(self):
         """Close the connection to the service."""
@@ -0,0 +1,69 @@
+import os
+import struct
+import logging
+from metrics import Metrics
+
+STT_MAX_PENDING_UTTERANCES = int(os.environ.get("STT_MAX_PENDING_UTTERANCES", "16"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Header of every binary message of the framed protocol: utterance id, sequence number of the
+# frame within the utterance and flags, little endian, followed by 16-bit PCM
+FRAME_HEADER = struct.Struct("<IIB")
+FLAG_END = 0x01
+
+
+def pack_frame(utterance_id: int, seq: int, payload: bytes, end: bool = False) -> bytes:
+    return FRAME_HEADER.pack(utterance_id, seq, FLAG_END if end else 0) + payload
+
+
+def parse_frame(message: bytes) -> tuple:
+    """Return (utterance id, seq, end, payload) of a framed message, the payload is a view of message."""
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError(f"Frame of {len(message)} bytes is shorter than its {FRAME_HEADER.size} byte header")
+    utterance_id, seq, flags = FRAME_HEADER.unpack_from(message)
+    return utterance_id, seq, bool(flags & FLAG_END), memoryview(message)[FRAME_HEADER.size:]
+
+
+class UtteranceAssembler:
+    """Collects the frames of pipelined utterances until each one is complete.
+
+    An utterance is complete once its end frame and every frame before it
+    have arrived, so frames may be interleaved across utterances and need not
+    arrive in order.
+    """
+
+    def __init__(self, max_pending: int = STT_MAX_PENDING_UTTERANCES):
+        self.max_pending = max_pending
+        self._frames = {}
+        self._lengths = {}
+
+    def add(self, utterance_id: int, seq: int, end: bool, payload) -> bytes:
+        """Add a frame, return the utterance's audio once it is complete, None otherwise."""
+        frames = self._frames.get(utterance_id)
+        if frames is None:
+            if len(self._frames) >= self.max_pending:
+                Metrics.increment("stt_framing_errors", reason="too_many_pending")
+                raise ValueError(f"More than {self.max_pending} utterances pending")
+            frames = self._frames[utterance_id] = {}
+        frames[seq] = bytes(payload)
+        if end:
+            self._lengths[utterance_id] = seq + 1
+        length = self._lengths.get(utterance_id)
+        if length is None or len(frames) < length:
+            return None
+        self.discard(utterance_id)
+        if frames.keys() != set(range(length)):
+            Metrics.increment("stt_framing_errors", reason="after_end")
+            raise ValueError(f"Utterance {utterance_id} has frames after its end frame {length - 1}")
+        return b"".join(frames[i] for i in range(length))
+
+    def discard(self, utterance_id: int):
+        self._frames.pop(utterance_id, None)
+        self._lengths.pop(utterance_id, None)
+
+    @property
+    def pending(self) -> int:
+        return len(self._frames)
@@ -0,0 +1,55 @@
+import os
+import asyncio
+import logging
+import numpy as np
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+from metrics import Metrics
+
+STT_VAD_TRIM = os.environ.get("STT_VAD_TRIM", "false").lower() == "true"
+STT_VAD_THRESHOLD = float(os.environ.get("STT_VAD_THRESHOLD", "0.5"))
+STT_VAD_MIN_SPEECH_MS = int(os.environ.get("STT_VAD_MIN_SPEECH_MS", "250"))
+STT_VAD_MIN_SILENCE_MS = int(os.environ.get("STT_VAD_MIN_SILENCE_MS", "500"))
+STT_VAD_SPEECH_PAD_MS = int(os.environ.get("STT_VAD_SPEECH_PAD_MS", "200"))
+
+SAMPLE_RATE = 16000
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VAD_OPTIONS = VadOptions(
+    threshold=STT_VAD_THRESHOLD,
+    min_speech_duration_ms=STT_VAD_MIN_SPEECH_MS,
+    min_silence_duration_ms=STT_VAD_MIN_SILENCE_MS,
+    speech_pad_ms=STT_VAD_SPEECH_PAD_MS,
+)
+
+
+def speech_regions(data) -> list:
+    """Return (start, end) byte offsets of the speech regions in raw 16-bit PCM."""
+    audio = np.multiply(np.frombuffer(data, dtype=np.int16, count=len(data) // 2), 1.0 / 32768.0, dtype=np.float32)
+    return [(chunk["start"] * 2, chunk["end"] * 2) for chunk in get_speech_timestamps(audio, VAD_OPTIONS)]
+
+
+def trim_silence(data) -> bytes:
+    """Keep only the speech regions of raw 16-bit PCM, b'' when there is no speech at all."""
+    regions = speech_regions(data)
+    if len(regions) == 1:
+        start, end = regions[0]
+        return bytes(memoryview(data)[start:end])
+    view = memoryview(data)
+    return b"".join(view[start:end] for start, end in regions)
+
+
+async def trim_utterance(data) -> bytes:
+    """Run the Silero VAD off the event loop and record how much audio it removed."""
+    trimmed = await asyncio.to_thread(trim_silence, data)
+    removed = (len(data) - len(trimmed)) / 2 / SAMPLE_RATE
+    Metrics.increment("stt_vad_input_seconds", len(data) / 2 / SAMPLE_RATE)
+    Metrics.increment("stt_vad_removed_seconds", removed)
+    if not trimmed:
+        Metrics.increment("stt_vad_dropped_utterances")
+        logger.info(f"VAD dropped utterance of {len(data) / 2 / SAMPLE_RATE:.2f}s without speech.")
+    else:
+        logger.info(f"VAD removed {removed:.2f}s of {len(data) / 2 / SAMPLE_RATE:.2f}s of audio.")
+    return trimmed
@@ -0,0 +1,180 @@
+import os
+import re
+import sys
+import json
+import time
+import wave
+import asyncio
+import logging
+import argparse
+import ctranslate2
+from whisper_worker_pool import WhisperWorkerPool, WHISPER_MODEL
+
+STT_LANGUAGE_CODE = os.environ.get("STT_LANGUAGE_CODE", "en")
+WHISPER_AUTOTUNE = os.environ.get("WHISPER_AUTOTUNE", "false").lower() == "true"
+WHISPER_PROFILE_PATH = os.environ.get("WHISPER_PROFILE_PATH", "whisper_profile.json")
+WHISPER_AUTOTUNE_MAX_WER = float(os.environ.get("WHISPER_AUTOTUNE_MAX_WER", "0.15"))
+WHISPER_AUTOTUNE_MAX_RTF = float(os.environ.get("WHISPER_AUTOTUNE_MAX_RTF", "0.5"))
+# Every compute type is benchmarked with every worker split, fewer types shorten the first boot
+WHISPER_AUTOTUNE_COMPUTE_TYPES = os.environ.get("WHISPER_AUTOTUNE_COMPUTE_TYPES", "int8,int8_float32,float32")
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+REFERENCE_CLIP = os.path.join(ASSETS_DIR, "reference.wav")
+REFERENCE_TEXT = os.path.join(ASSETS_DIR, "reference.txt")
+
+CANDIDATE_COMPUTE_TYPES = [t.strip() for t in WHISPER_AUTOTUNE_COMPUTE_TYPES.split(",") if t.strip()]
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def normalize_words(text: str) -> list:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length."""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def read_clip(path: str) -> bytes:
+    with wave.open(path, "rb") as clip:
+        if clip.getframerate() != 16000 or clip.getnchannels() != 1 or clip.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16 kHz mono 16-bit PCM")
+        return clip.readframes(clip.getnframes())
+
+
+def candidate_profiles(cpu_count: int) -> list:
+    """Compute types supported on this CPU crossed with every worker/thread split of the cores."""
+    supported = ctranslate2.get_supported_compute_types("cpu")
+    splits = []
+    num_workers = 1
+    while num_workers <= cpu_count:
+        splits.append((num_workers, cpu_count // num_workers))
+        num_workers *= 2
+    return [
+        {"compute_type": compute_type, "num_workers": num_workers, "cpu_threads": cpu_threads}
+        for compute_type in CANDIDATE_COMPUTE_TYPES if compute_type in supported
+        for num_workers, cpu_threads in splits
+    ]
+
+
+async def benchmark_profile(profile: dict, audio: bytes, reference: str, rounds: int = 2) -> dict:
+    """Decode the clip on every worker at once and measure latency, throughput and accuracy."""
+    clip_duration = len(audio) / 2 / 16000
+    pool = WhisperWorkerPool(model_size=WHISPER_MODEL, warmup_s=0, **profile)
+    try:
+        # The first round spawns the workers and loads the models, it is not measured
+        await asyncio.gather(*[pool.transcribe(audio, language=STT_LANGUAGE_CODE) for _ in range(pool.num_workers)])
+
+        latencies = []
+        texts = []
+
+        async def timed_decode():
+            start = time.perf_counter()
+            result = await pool.transcribe(audio, language=STT_LANGUAGE_CODE)
+            latencies.append(time.perf_counter() - start)
+            texts.append(" ".join(segment["text"] for segment in result["segments"]))
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*[timed_decode() for _ in range(pool.num_workers)])
+        wall = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+
+    return {
+        **profile,
+        "wer": max(word_error_rate(reference, text) for text in texts),
+        "latency_rtf": max(latencies) / clip_duration,
+        "throughput_rtf": wall / (len(latencies) * clip_duration),
+    }
+
+
+def select_profile(results: list, max_wer: float, max_rtf: float) -> dict:
+    """Pick the highest throughput profile within budget, or the most accurate one if none is."""
+    within_budget = [r for r in results if r["wer"] <= max_wer and r["latency_rtf"] <= max_rtf]
+    if within_budget:
+        return min(within_budget, key=lambda r: r["throughput_rtf"])
+    logger.warning(f"No profile meets WER <= {max_wer} and RTF <= {max_rtf}, using the most accurate one.")
+    return min(results, key=lambda r: (r["wer"], r["latency_rtf"]))
+
+
+async def autotune(clip_path: str = REFERENCE_CLIP,
+                   reference_path: str = REFERENCE_TEXT,
+                   max_wer: float = WHISPER_AUTOTUNE_MAX_WER,
+                   max_rtf: float = WHISPER_AUTOTUNE_MAX_RTF,
+                   profile_path: str = WHISPER_PROFILE_PATH) -> dict:
+    audio = read_clip(clip_path)
+    with open(reference_path) as f:
+        reference = f.read()
+
+    cpu_count = os.cpu_count() or 1
+    results = []
+    for candidate in candidate_profiles(cpu_count):
+        logger.info(f"Benchmarking Whisper profile {candidate}")
+        result = await benchmark_profile(candidate, audio, reference)
+        logger.info(f"WER {result['wer']:.3f}, latency RTF {result['latency_rtf']:.3f}, throughput RTF {result['throughput_rtf']:.3f}")
+        results.append(result)
+
+    best = select_profile(results, max_wer, max_rtf)
+    profile = {
+        "model": WHISPER_MODEL,
+        "cpu_count": cpu_count,
+        "compute_type": best["compute_type"],
+        "num_workers": best["num_workers"],
+        "cpu_threads": best["cpu_threads"],
+        "tuned_at": time.time(),
+        "results": results,
+    }
+    with open(profile_path + ".tmp", "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(profile_path + ".tmp", profile_path)
+    logger.info(f"Selected Whisper profile {best}, saved to {profile_path}")
+    return profile
+
+
+def load_profile(profile_path: str = WHISPER_PROFILE_PATH) -> dict:
+    """Return the persisted profile if it was tuned for this model and machine size."""
+    try:
+        with open(profile_path) as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if profile.get("model") != WHISPER_MODEL or profile.get("cpu_count") != (os.cpu_count() or 1):
+        logger.info(f"Ignoring Whisper profile at {profile_path}, it was tuned for another model or machine.")
+        return None
+    return profile
+
+
+async def ensure_profile() -> dict:
+    """Load the persisted profile, running the autotuner first if there is none."""
+    return load_profile() or await autotune()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Whisper compute profiles and persist the fastest one.")
+    parser.add_argument("--clip", default=REFERENCE_CLIP, help="16 kHz mono 16-bit WAV clip")
+    parser.add_argument("--reference", default=REFERENCE_TEXT, help="Reference transcript of the clip")
+    parser.add_argument("--max-wer", type=float, default=WHISPER_AUTOTUNE_MAX_WER)
+    parser.add_argument("--max-rtf", type=float, default=WHISPER_AUTOTUNE_MAX_RTF)
+    parser.add_argument("--output", default=WHISPER_PROFILE_PATH)
+    args = parser.parse_args()
+    profile = asyncio.run(autotune(args.clip, args.reference, args.max_wer, args.max_rtf, args.output))
+    print(json.dumps({k: v for k, v in profile.items() if k != "results"}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import os
+import asyncio
+import logging
+from audio_ring import AudioRingBuffer
+from hallucination_filter import filter_segments, reject_utterance
+from metrics import Metrics
+
+STT_STREAMING_STEP_MS = int(os.environ.get("STT_STREAMING_STEP_MS", "500"))
+STT_STREAMING_WINDOW_S = float(os.environ.get("STT_STREAMING_WINDOW_S", "15"))
+# Audio a session can hold before the oldest audio is dropped, committed or not. Every session
+# keeps 8 bytes per sample of it in /dev/shm, so it defaults to just above the window.
+STT_STREAMING_BUFFER_S = float(os.environ.get("STT_STREAMING_BUFFER_S", str(STT_STREAMING_WINDOW_S + 5)))
+
+SAMPLE_RATE = 16000
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _normalize(word: str) -> str:
+    return word.strip().lower()
+
+
+def _join(words: list) -> str:
+    return "".join(word[2] for word in words).strip()
+
+
+class LocalAgreement:
+    """Commits the words on which two consecutive decodes of the rolling window agree.
+
+    Words are (start, end, text) tuples with absolute timestamps in seconds.
+    """
+
+    def __init__(self):
+        self.committed = []
+        self.unstable = []
+        self.last_committed_time = 0.0
+
+    def insert(self, words: list) -> list:
+        """Add a new hypothesis and return the words that became stable."""
+        new = [word for word in words if word[0] > self.last_committed_time - 0.1]
+
+        # The decoder often repeats the last committed words at the start of the window
+        if new and self.committed and abs(new[0][0] - self.last_committed_time) < 1:
+            for n in range(min(len(self.committed), len(new), 5), 0, -1):
+                if [_normalize(w[2]) for w in self.committed[-n:]] == [_normalize(w[2]) for w in new[:n]]:
+                    new = new[n:]
+                    break
+
+        stable = []
+        while new and self.unstable and _normalize(new[0][2]) == _normalize(self.unstable[0][2]):
+            stable.append(new.pop(0))
+            self.unstable.pop(0)
+        self.unstable = new
+
+        if stable:
+            self.committed.extend(stable)
+            self.last_committed_time = stable[-1][1]
+        return stable
+
+    def reset(self):
+        self.committed = []
+        self.unstable = []
+        self.last_committed_time = 0.0
+
+
+class WhisperStream:
+    """Rolling-window streaming transcription of one session on top of the worker pool.
+
+    Audio frames are converted into a shared float32 ring buffer as they
+    arrive and the window is re-decoded every STT_STREAMING_STEP_MS of new
+    audio. Workers read the window straight from the ring. Stable words are
+    reported as interim messages, so only the unstable tail is left to decode
+    when the utterance ends.
+    """
+
+    def __init__(self, pool, text_handler: callable, language: str, plan: callable = None):
+        self.pool = pool
+        self.plan = plan
+        self.text_handler = text_handler
+        self.language = language
+        self.agreement = LocalAgreement()
+        self.ring = AudioRingBuffer(max(STT_STREAMING_BUFFER_S, STT_STREAMING_WINDOW_S))
+        self.buffer_offset = 0.0  # seconds of audio trimmed from the front of the ring
+        self._decoded_samples = 0
+        self._last_interim = ""
+        self._task = None
+        # Whether every segment of the last decode was rejected
+        self._rejected = False
+
+    def feed(self, data):
+        dropped = self.ring.write(data)
+        if dropped:
+            # Nothing was committed for longer than the ring holds
+            Metrics.increment("stt_streaming_dropped_samples", dropped)
+            self._decoded_samples = max(0, self._decoded_samples - dropped)
+            self.buffer_offset += dropped / SAMPLE_RATE
+        if (self._task is None or self._task.done()) and self._has_new_audio():
+            self._task = asyncio.create_task(self._decode_loop())
+
+    def _has_new_audio(self) -> bool:
+        return len(self.ring) - self._decoded_samples >= STT_STREAMING_STEP_MS * SAMPLE_RATE // 1000
+
+    async def _decode_loop(self):
+        while self._has_new_audio():
+            await self._decode()
+            text = _join(self.agreement.committed + self.agreement.unstable)
+            if text and text != self._last_interim:
+                self._last_interim = text
+                await self.text_handler(text, type="interim", stable=_join(self.agreement.committed))
+            self._trim()
+
+    async def _decode(self):
+        self._decoded_samples = len(self.ring)
+        # Condition the decoder on the committed text that was trimmed out of the window
+        prompt = _join([word for word in self.agreement.committed if word[1] <= self.buffer_offset])[-200:]
+        # Under load plan may pick cheaper options or the fallback model
+        pool, options = self.plan(language=self.language) if self.plan else (self.pool, {"language": self.language})
+        result = await pool.transcribe_block(
+            self.ring.block(),
+            word_timestamps=True,
+            initial_prompt=prompt or None,
+            **options,
+        )
+        # Every decode of the window is filtered, only final transcripts count as rejected
+        kept = filter_segments(result["segments"], record=False)
+        self._rejected = bool(result["segments"]) and not kept
+        words = [
+            (self.buffer_offset + word["start"], self.buffer_offset + word["end"], word["word"])
+            for segment in kept
+            for word in segment["words"] or []
+        ]
+        return self.agreement.insert(words)
+
+    def _trim(self):
+        """Drop committed audio from the front once the window exceeds STT_STREAMING_WINDOW_S."""
+        if len(self.ring) / SAMPLE_RATE <= STT_STREAMING_WINDOW_S:
+            return
+        if self.agreement.last_committed_time <= self.buffer_offset:
+            return
+        cut = int((self.agreement.last_committed_time - self.buffer_offset) * SAMPLE_RATE)
+        self.ring.consume(cut)
+        self._decoded_samples = max(0, self._decoded_samples - cut)
+        self.buffer_offset += cut / SAMPLE_RATE
+        logger.debug(f"Trimmed streaming window to {len(self.ring) / SAMPLE_RATE:.2f}s")
+
+    async def finish(self) -> str:
+        """Decode the remaining audio, send the final transcript and reset for the next utterance."""
+        try:
+            if self._task:
+                await self._task
+            if len(self.ring) > self._decoded_samples:
+                await self._decode()
+
+            text = _join(self.agreement.committed + self.agreement.unstable)
+            if not text and self._rejected:
+                reject_utterance()
+            logger.info(f"Streaming final: {text}")
+            await self.text_handler(text, type="final")
+            return text
+        finally:
+            # Also after a failed decode, the next utterance must not start with this one's audio
+            self._reset()
+
+    def _reset(self):
+        self._task = None
+        self.agreement.reset()
+        self.ring.clear()
+        self.buffer_offset = 0.0
+        self._decoded_samples = 0
+        self._last_interim = ""
+        self._rejected = False
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.ring.close()
@@ -0,0 +1,438 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import numpy as np
+from faster_whisper import WhisperModel
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_compression_ratio, get_ctranslate2_storage, get_suppressed_tokens
+from metrics import Metrics
+
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "tiny")
+WHISPER_COMPUTE_TYPE = os.environ.get("WHISPER_COMPUTE_TYPE", "float32")
+WHISPER_NUM_WORKERS = int(os.environ.get("WHISPER_NUM_WORKERS", "1"))
+WHISPER_CPU_THREADS = int(os.environ.get("WHISPER_CPU_THREADS", "0"))
+WHISPER_WARMUP_S = float(os.environ.get("WHISPER_WARMUP_S", "2"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Model owned by the current worker process, set by the pool initializer.
+_worker_model = None
+# Queue shared by all workers to stream segments back while a decode is running.
+_segment_queue = None
+
+
+def synthetic_clip(seconds: float) -> np.ndarray:
+    """Low level noise with a few tones, enough to run the encoder and a full beam search."""
+    t = np.arange(int(seconds * 16000)) / 16000
+    tones = sum(0.05 * np.sin(2 * np.pi * f * t) for f in (220, 440, 880))
+    return (tones + np.random.default_rng(0).normal(0, 0.01, len(t))).astype(np.float32)
+
+
+def _init_worker(model_size: str, compute_type: str, cpu_threads: int, segment_queue, warmup_s: float):
+    global _worker_model, _segment_queue
+    _segment_queue = segment_queue
+    start = time.perf_counter()
+    _worker_model = WhisperModel(model_size, compute_type=compute_type, cpu_threads=cpu_threads)
+    load_s = time.perf_counter() - start
+    logger.info(f"Faster Whisper worker {os.getpid()} (model: {model_size}, compute_type: {compute_type}, cpu_threads: {cpu_threads}) loaded in {load_s:.2f}s.")
+
+    # The first decode allocates the CTranslate2 buffers, pay for it before live traffic arrives
+    start = time.perf_counter()
+    if warmup_s > 0:
+        segments, _ = _worker_model.transcribe(audio=synthetic_clip(warmup_s), language="en")
+        list(segments)
+    warmup_s = time.perf_counter() - start
+    segment_queue.put((None, "ready", {"pid": os.getpid(), "load_s": load_s, "warmup_s": warmup_s}))
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _write_shared_audio(data) -> shared_memory.SharedMemory:
+    """Copy raw 16-bit PCM into a new shared memory block owned by the caller."""
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    return shm
+
+
+def _read_shared_audio(shm_name: str, num_samples: int) -> np.ndarray:
+    """Attach to a shared PCM block and convert it to normalized float32 audio."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        pcm = np.ndarray((num_samples,), dtype=np.int16, buffer=shm.buf)
+        audio = np.multiply(pcm, 1.0 / 32768.0, dtype=np.float32)
+        # Drop the view before closing, the buffer cannot be released while exported.
+        del pcm
+    finally:
+        shm.close()
+    return audio
+
+
+def _transcribe_block(shm_name: str, offset: int, num_samples: int, options: dict) -> dict:
+    """Decode a window of a float32 ring buffer in place, without converting or copying it."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # The view must not outlive the mapping, _transcribe keeps no reference to the audio
+        audio = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf, offset=offset * 4)
+        audio.flags.writeable = False
+        return _transcribe(_worker_model, audio, options)
+    finally:
+        shm.close()
+
+
+def _segment_to_dict(segment) -> dict:
+    return {
+        "start": segment.start,
+        "end": segment.end,
+        "text": segment.text,
+        "avg_logprob": segment.avg_logprob,
+        "compression_ratio": segment.compression_ratio,
+        "no_speech_prob": segment.no_speech_prob,
+        "words": [
+            {"start": word.start, "end": word.end, "word": word.word, "probability": word.probability}
+            for word in segment.words
+        ] if segment.words else None,
+    }
+
+
+def _transcribe(model, audio: np.ndarray, options: dict) -> dict:
+    cpu = time.process_time()
+    segments, info = model.transcribe(audio=audio, **options)
+    return {
+        "segments": [_segment_to_dict(segment) for segment in segments],
+        "language": info.language,
+        "duration": info.duration,
+        # CPU time of all threads of the worker, taken after the lazy segments have been decoded
+        "cpu_s": time.process_time() - cpu,
+    }
+
+
+def _transcribe_batch(model, audios: list, options: dict) -> list:
+    """Decode several clips of up to 30 seconds with one encoder and one generate call.
+
+    The batched path decodes without timestamps and without temperature
+    fallback. Clips longer than the encoder window, or requests without an
+    explicit language, go through the regular sequential transcribe.
+    """
+    extractor = model.feature_extractor
+    language = options.get("language")
+    results = [None] * len(audios)
+    batch = []
+    for i, audio in enumerate(audios):
+        if language is None or len(audio) > extractor.n_samples:
+            results[i] = _transcribe(model, audio, options)
+        else:
+            batch.append(i)
+    if not batch:
+        return results
+
+    features = []
+    for i in batch:
+        mel = extractor(audios[i])
+        content_frames = mel.shape[-1] - extractor.nb_max_frames
+        features.append(pad_or_trim(mel[:, :content_frames], extractor.nb_max_frames))
+    features = np.ascontiguousarray(np.stack(features), dtype=np.float32)
+
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language)
+    prompt = tokenizer.sot_sequence + [tokenizer.no_timestamps]
+    encoder_output = model.model.encode(get_ctranslate2_storage(features))
+    generated = model.model.generate(
+        encoder_output,
+        [prompt] * len(batch),
+        beam_size=options.get("beam_size", 5),
+        max_length=model.max_length,
+        return_scores=True,
+        return_no_speech_prob=True,
+        suppress_blank=True,
+        suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+    )
+
+    no_speech_threshold = options.get("no_speech_threshold", 0.6)
+    log_prob_threshold = options.get("log_prob_threshold", -1.0)
+    for i, result in zip(batch, generated):
+        tokens = result.sequences_ids[0]
+        # Recover the average log prob from the returned score, as faster-whisper does
+        avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+        text = tokenizer.decode(tokens)
+        duration = len(audios[i]) / extractor.sampling_rate
+        segments = []
+        if text.strip() and not (result.no_speech_prob > no_speech_threshold and avg_logprob < log_prob_threshold):
+            segments.append({
+                "start": 0.0,
+                "end": duration,
+                "text": text,
+                "avg_logprob": avg_logprob,
+                "compression_ratio": get_compression_ratio(text.strip()),
+                "no_speech_prob": result.no_speech_prob,
+                "words": None,
+            })
+        results[i] = {"segments": segments, "language": language, "duration": duration}
+    return results
+
+
+def _transcribe_shared(shm_name: str, num_samples: int, options: dict) -> dict:
+    return _transcribe(_worker_model, _read_shared_audio(shm_name, num_samples), options)
+
+
+def _transcribe_batch_shared(blocks: list, options: dict) -> list:
+    cpu = time.process_time()
+    audios = [_read_shared_audio(shm_name, num_samples) for shm_name, num_samples in blocks]
+    results = _transcribe_batch(_worker_model, audios, options)
+    # The batch shares one decode, its CPU time is split between the utterances
+    cpu_s = (time.process_time() - cpu) / len(results)
+    for result in results:
+        result["cpu_s"] = cpu_s
+    return results
+
+
+def _transcribe_incremental_shared(job_id: int, shm_name: str, num_samples: int, options: dict) -> int:
+    """Push each segment to the segment queue as soon as the lazy generator yields it."""
+    try:
+        segments, info = _worker_model.transcribe(audio=_read_shared_audio(shm_name, num_samples), **options)
+        count = 0
+        for segment in segments:
+            _segment_queue.put((job_id, "segment", _segment_to_dict(segment)))
+            count += 1
+        _segment_queue.put((job_id, "done", {"language": info.language, "duration": info.duration}))
+        return count
+    except Exception as e:
+        _segment_queue.put((job_id, "error", repr(e)))
+        raise
+
+
+class WhisperWorkerPool:
+    """Pool of worker processes that each hold their own WhisperModel.
+
+    Audio is handed to the workers through shared memory so that only the
+    block name and the sample count are pickled per request. When a worker
+    dies the executor is broken for good, so it is replaced with fresh
+    workers and only the requests that were running fail.
+    """
+
+    # Loads the model in each worker process, tests replace it with a stub
+    worker_initializer = staticmethod(_init_worker)
+
+    def __init__(self,
+                 num_workers: int = WHISPER_NUM_WORKERS,
+                 model_size: str = WHISPER_MODEL,
+                 compute_type: str = WHISPER_COMPUTE_TYPE,
+                 cpu_threads: int = WHISPER_CPU_THREADS,
+                 warmup_s: float = WHISPER_WARMUP_S):
+        self.num_workers = max(1, num_workers)
+        # Split the available cores between the workers unless explicitly configured.
+        self.cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // self.num_workers)
+        self._context = multiprocessing.get_context("spawn")
+        self._segment_queue = self._context.SimpleQueue()
+        self._initargs = (model_size, compute_type, self.cpu_threads, self._segment_queue, warmup_s)
+        self._executor = self._new_executor()
+        # Load and warmup timings of the workers that are ready, keyed by pid
+        self.ready_workers = {}
+        self._all_ready = None
+        # Decodes submitted and not finished yet, and their smoothed latency including the queue wait
+        self.pending = 0
+        self.latency_ms = 0.0
+        # Incremental jobs waiting for segments, keyed by job id
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._reader = threading.Thread(target=self._read_segments, daemon=True)
+        self._reader.start()
+        logger.info(f"Whisper worker pool started with {self.num_workers} workers.")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=self._context,
+            initializer=self.worker_initializer,
+            initargs=self._initargs,
+        )
+
+    def _rebuild(self, broken: ProcessPoolExecutor):
+        """Replace a broken executor, requests that fail together only replace it once."""
+        if self._executor is not broken:
+            return
+        logger.error("A Whisper worker process died, restarting the worker pool.")
+        Metrics.increment("stt_worker_pool_restarts")
+        broken.shutdown(wait=False, cancel_futures=True)
+        # The workers report again once they are spawned
+        self.ready_workers = {}
+        self._executor = self._new_executor()
+
+    def _submit(self, fn, *args) -> tuple:
+        """Submit fn to a worker, return its future and the executor that runs it."""
+        executor = self._executor
+        try:
+            return executor.submit(fn, *args), executor
+        except BrokenProcessPool:
+            self._rebuild(executor)
+            return self._executor.submit(fn, *args), self._executor
+
+    async def start(self) -> list:
+        """Spawn every worker and wait until each one has loaded and warmed up its model.
+
+        Workers are otherwise spawned on demand by the first requests.
+        Returns the load and warmup timings of the workers.
+        """
+        loop = asyncio.get_running_loop()
+        self._all_ready = (loop, asyncio.Event())
+        if len(self.ready_workers) >= self.num_workers:
+            self._all_ready[1].set()
+        # Submitting one task per worker before any of them is up makes the executor spawn all of them
+        futures = [self._submit(_ping)[0] for _ in range(self.num_workers)]
+        # A worker that fails to load breaks the executor and fails the pings
+        await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+        await self._all_ready[1].wait()
+        return list(self.ready_workers.values())
+
+    def _submit_decode(self, fn, *args) -> tuple:
+        """Submit a decode like _submit, it counts as pending until its worker is done with it.
+
+        Callers that stop waiting early, a closed segment stream or the
+        cancelled loser of a hedged request, leave the worker decoding, so
+        the load seen by the governor follows the future instead of them.
+        """
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            future, executor = self._submit(fn, *args)
+        except BaseException:
+            self._finished(started)
+            raise
+
+        def on_done(_):
+            try:
+                loop.call_soon_threadsafe(self._finished, started)
+            except RuntimeError:
+                # The event loop was closed on shutdown
+                pass
+
+        # Added before the future is awaited, so the count drops before the caller resumes
+        future.add_done_callback(on_done)
+        return future, executor
+
+    def _finished(self, started: float):
+        self.pending -= 1
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.latency_ms = latency_ms if not self.latency_ms else 0.8 * self.latency_ms + 0.2 * latency_ms
+
+    async def _run(self, fn, *args):
+        """Run fn on a worker, tracking the pending decodes and their latency."""
+        future, executor = self._submit_decode(fn, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # Later requests get fresh workers instead of failing as well
+            self._rebuild(executor)
+            raise
+
+    async def transcribe(self, data, **options) -> dict:
+        """Transcribe raw 16-bit PCM on a worker process without blocking the event loop."""
+        if len(data) < 2:
+            return {"segments": [], "language": options.get("language"), "duration": 0.0}
+
+        shm = _write_shared_audio(data)
+        try:
+            return await self._run(_transcribe_shared, shm.name, len(data) // 2, options)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def transcribe_block(self, block: tuple, **options) -> dict:
+        """Transcribe a window of a shared AudioRingBuffer, given as returned by its block()."""
+        shm_name, offset, num_samples = block
+        if num_samples < 1:
+            return {"segments": [], "language": options.get("language"), "duration": 0.0}
+        return await self._run(_transcribe_block, shm_name, offset, num_samples, options)
+
+    async def transcribe_batch(self, datas: list, **options) -> list:
+        """Transcribe several utterances with a single batched decode on one worker."""
+        results = [{"segments": [], "language": options.get("language"), "duration": 0.0} for _ in datas]
+        indices = [i for i, data in enumerate(datas) if len(data) >= 2]
+        if not indices:
+            return results
+
+        blocks = [_write_shared_audio(datas[i]) for i in indices]
+        try:
+            batch = await self._run(
+                _transcribe_batch_shared,
+                [(shm.name, len(datas[i]) // 2) for shm, i in zip(blocks, indices)],
+                options,
+            )
+            for i, result in zip(indices, batch):
+                results[i] = result
+            return results
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    async def transcribe_segments(self, data, **options):
+        """Yield segment dicts as the worker decodes them instead of after the whole utterance."""
+        if len(data) < 2:
+            return
+
+        job_id = next(self._job_ids)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        self._jobs[job_id] = (loop, queue)
+
+        def on_done(future):
+            if future.cancelled() or future.exception() is None:
+                return
+            if isinstance(future.exception(), BrokenProcessPool):
+                loop.call_soon_threadsafe(self._rebuild, executor)
+            # A crashed worker never reports through the segment queue
+            if job_id in self._jobs:
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", repr(future.exception())))
+
+        shm = _write_shared_audio(data)
+        try:
+            # Consumers close the generator when they stop early (contextlib.aclosing), which runs the cleanup below
+            future, executor = self._submit_decode(_transcribe_incremental_shared, job_id, shm.name, len(data) // 2, options)
+            future.add_done_callback(on_done)
+            while True:
+                kind, payload = await queue.get()
+                if kind == "segment":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise RuntimeError(f"Whisper worker failed: {payload}")
+        finally:
+            self._jobs.pop(job_id, None)
+            shm.close()
+            shm.unlink()
+
+    def _read_segments(self):
+        """Route segments from the worker processes to the event loop of the waiting job."""
+        while True:
+            message = self._segment_queue.get()
+            if message is None:
+                return
+            job_id, kind, payload = message
+            if kind == "ready":
+                self.ready_workers[payload["pid"]] = payload
+                if self._all_ready and len(self.ready_workers) >= self.num_workers:
+                    loop, event = self._all_ready
+                    loop.call_soon_threadsafe(event.set)
+                continue
+            job = self._jobs.get(job_id)
+            if job:
+                loop, queue = job
+                loop.call_soon_threadsafe(queue.put_nowait, (kind, payload))
+
+    def shutdown(self):
+        self._segment_queue.put(None)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("Whisper worker pool shut down.")
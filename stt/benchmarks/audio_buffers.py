@@ -0,0 +1,101 @@
+"""Measure the allocations of buffering streamed audio for rolling-window decodes.
+
+Streams --seconds of 16-bit PCM in --frame-ms frames and hands a float32
+window of at most --window-s to the decoder every --step-ms, as the
+streaming mode does. "bytes" is the previous approach: a growing bytearray
+converted with np.frombuffer(...).flatten().astype(np.float32) / 32768.0 on
+every decode. "ring" converts each frame once into an AudioRingBuffer and
+decodes views of it. Allocated bytes are the sum of the tracemalloc peak
+of every frame, which includes temporaries freed within the frame.
+
+    cd stt
+    python benchmarks/audio_buffers.py --seconds 60
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from audio_ring import AudioRingBuffer, SAMPLE_RATE
+
+
+class BytesWindow:
+    def __init__(self, window_s: float):
+        self.window = int(window_s * SAMPLE_RATE) * 2
+        self.buffer = bytearray()
+
+    def write(self, frame: bytes):
+        self.buffer.extend(frame)
+        if len(self.buffer) > self.window:
+            del self.buffer[:len(self.buffer) - self.window]
+
+    def audio(self) -> np.ndarray:
+        return np.frombuffer(self.buffer, dtype=np.int16).flatten().astype(np.float32) / 32768.0
+
+
+class RingWindow:
+    def __init__(self, window_s: float):
+        self.window = int(window_s * SAMPLE_RATE)
+        self.ring = AudioRingBuffer(window_s, shared=False)
+
+    def write(self, frame: bytes):
+        self.ring.write(frame)
+
+    def audio(self) -> np.ndarray:
+        return self.ring.view(max(0, len(self.ring) - self.window))
+
+
+STRATEGIES = {"bytes": BytesWindow, "ring": RingWindow}
+
+
+def stream(strategy: str, pcm: np.ndarray, args, trace: bool) -> dict:
+    window = STRATEGIES[strategy](args.window_s)
+    frame = int(SAMPLE_RATE * args.frame_ms / 1000)
+    step = int(SAMPLE_RATE * args.step_ms / 1000)
+    frames = [pcm[start:start + frame].tobytes() for start in range(0, len(pcm), frame)]
+    allocated = 0
+    checksum = 0.0
+    fed = 0
+    started = time.perf_counter()
+    for data in frames:
+        if trace:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        window.write(data)
+        fed += len(data) // 2
+        if fed >= step:
+            fed = 0
+            # Stands in for the decoder reading the window
+            checksum += float(window.audio()[-1])
+        if trace:
+            allocated += tracemalloc.get_traced_memory()[1] - before
+    elapsed = time.perf_counter() - started
+    return {"allocated": allocated, "elapsed": elapsed, "checksum": checksum}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60.0, help="length of the streamed audio")
+    parser.add_argument("--frame-ms", type=float, default=20.0, help="size of the received frames")
+    parser.add_argument("--step-ms", type=float, default=500.0, help="audio between two decodes")
+    parser.add_argument("--window-s", type=float, default=15.0, help="longest window handed to the decoder")
+    args = parser.parse_args()
+
+    pcm = np.random.default_rng(0).integers(-8000, 8000, int(args.seconds * SAMPLE_RATE), dtype=np.int16)
+    print(f"{'strategy':>10} {'alloc MB/s audio':>17} {'us/s audio':>11}")
+    for strategy in STRATEGIES:
+        # Timing runs without tracemalloc, which slows down every allocation
+        timing = stream(strategy, pcm, args, trace=False)
+        tracemalloc.start()
+        traced = stream(strategy, pcm, args, trace=True)
+        tracemalloc.stop()
+        print(f"{strategy:>10} {traced['allocated'] / 2 ** 20 / args.seconds:>17.3f} "
+              f"{timing['elapsed'] * 1e6 / args.seconds:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compare Groq STT end-to-end latency for WAV, FLAC and Opus uploads across utterance lengths.
+
+Utterances are built by repeating the bundled reference clip. Encode time
+and body size are always measured; with GROQ_STT_API_KEY set every
+utterance is also sent through GroqSTT.transcribe (GROQ_BASE_URL may point
+at a stand-in server). Without a key the upload time is estimated from
+--uplink-mbps.
+
+    cd stt
+    python benchmarks/groq_upload_encoding.py --lengths 1 5 10 20 --repeats 5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+import audio_encoding
+from audio_encoding import ENCODINGS, SAMPLE_RATE, encode_upload
+from whisper_autotune import REFERENCE_CLIP, read_clip
+
+
+def make_utterance(clip: bytes, seconds: float) -> bytes:
+    num_bytes = int(seconds * SAMPLE_RATE) * 2
+    return (clip * (num_bytes // len(clip) + 1))[:num_bytes]
+
+
+async def end_to_end_ms(data: bytes, encoding: str) -> float:
+    import groq_stt
+    groq_stt.GROQ_STT_UPLOAD_ENCODING = encoding
+    stt = groq_stt.GroqSTT()
+    started = time.perf_counter()
+    await stt.transcribe(data)
+    return (time.perf_counter() - started) * 1000
+
+
+async def run(args):
+    clip = read_clip(REFERENCE_CLIP)
+    live = bool(os.environ.get("GROQ_STT_API_KEY"))
+    print(f"{'length_s':>8} {'encoding':>8} {'bytes':>9} {'encode_ms':>10} {'upload_ms':>10} {'e2e_ms':>8}")
+    for seconds in args.lengths:
+        data = make_utterance(clip, seconds)
+        for encoding in args.encodings:
+            encode_times, e2e_times = [], []
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                _, body = encode_upload(data, encoding)
+                encode_times.append((time.perf_counter() - started) * 1000)
+                if live:
+                    e2e_times.append(await end_to_end_ms(data, encoding))
+            encode_ms = statistics.median(encode_times)
+            upload_ms = len(body) * 8 / (args.uplink_mbps * 1000)
+            e2e = f"{statistics.median(e2e_times):8.1f}" if live else f"{'-':>8}"
+            print(f"{seconds:>8} {encoding:>8} {len(body):>9} {encode_ms:>10.2f} {upload_ms:>10.1f} {e2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=float, nargs="+", default=[1, 3, 5, 10, 20])
+    parser.add_argument("--encodings", nargs="+", default=list(ENCODINGS), choices=list(ENCODINGS))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--uplink-mbps", type=float, default=10.0,
+                        help="uplink bandwidth used to estimate upload time")
+    parser.add_argument("--opus-bitrate", type=int, default=audio_encoding.GROQ_STT_OPUS_BITRATE)
+    args = parser.parse_args()
+    audio_encoding.GROQ_STT_OPUS_BITRATE = args.opus_bitrate
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
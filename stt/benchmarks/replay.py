@@ -0,0 +1,299 @@
+"""Replay recorded utterances into the STT websocket and report latency, RTF, CPU/RSS and WER.
+
+Every session replays all clips of --clips (16 kHz mono 16-bit .wav or
+raw .pcm files, with an optional .txt reference transcript next to each)
+either at real-time pace or as fast as possible. The sweep runs every
+--concurrency level one after the other.
+
+Against a running service:
+
+    python benchmarks/replay.py --clips clips/ --url ws://localhost:8001/api/v1/ws --concurrency 1 2 4 8
+
+Or let the harness start the service, and local stand-ins for the remote
+providers, and measure the server's CPU and RSS as well (Linux only):
+
+    python benchmarks/replay.py --clips clips/ --spawn-server --provider groq --standins --concurrency 1 4 16
+"""
+import os
+import sys
+import json
+import time
+import wave
+import asyncio
+import argparse
+import subprocess
+import statistics
+import urllib.request
+import websockets
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app'))
+sys.path.append(APP_DIR)
+
+from whisper_autotune import word_error_rate, REFERENCE_CLIP
+
+SAMPLE_RATE = 16000
+
+
+def load_clips(path: str) -> list:
+    """Read every .wav/.pcm clip of a directory (or a single file) with its .txt reference, if any."""
+    files = [path] if os.path.isfile(path) else [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    clips = []
+    for file in files:
+        stem, ext = os.path.splitext(file)
+        if ext == ".wav":
+            with wave.open(file, "rb") as clip:
+                if clip.getframerate() != SAMPLE_RATE or clip.getnchannels() != 1 or clip.getsampwidth() != 2:
+                    raise ValueError(f"{file} must be 16 kHz mono 16-bit PCM")
+                pcm = clip.readframes(clip.getnframes())
+        elif ext == ".pcm":
+            with open(file, "rb") as f:
+                pcm = f.read()
+        else:
+            continue
+        reference = None
+        if os.path.exists(stem + ".txt"):
+            with open(stem + ".txt") as f:
+                reference = f.read().strip()
+        clips.append({"name": os.path.basename(file), "pcm": pcm, "reference": reference})
+    return clips
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def process_tree_usage(pid: int) -> tuple:
+    """CPU seconds and RSS bytes of a process and all its descendants, read from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                children.setdefault(int(fields[1]), []).append((int(entry), fields))
+            except OSError:
+                continue
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    cpu, rss = 0.0, 0
+    with open(f"/proc/{pid}/stat") as f:
+        stack = [(pid, f.read().rsplit(")", 1)[1].split())]
+    while stack:
+        current, fields = stack.pop()
+        # utime and stime are fields 14 and 15 of stat, rss is field 24
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+        rss += int(fields[21]) * page
+        stack.extend(children.get(current, []))
+    return cpu, rss
+
+
+class ResourceSampler:
+    """Samples CPU usage and peak RSS of the server process tree while a sweep level runs."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._task = None
+
+    async def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, process_tree_usage(self.pid)[1])
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.cpu_start = process_tree_usage(self.pid)[0]
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+
+    def stop(self):
+        self._task.cancel()
+        self.cpu_percent = 100 * (process_tree_usage(self.pid)[0] - self.cpu_start) / (time.perf_counter() - self.started)
+
+
+async def receive_final(ws) -> str:
+    """Wait for the message that completes the current utterance and return its text."""
+    while True:
+        message = await ws.recv()
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return message
+        if not isinstance(payload, dict):
+            return message
+        if payload.get("type") == "final" or payload.get("final") is True:
+            return payload.get("text", "")
+        if payload.get("type") not in ("interim", "segment"):
+            return payload.get("text", message)
+
+
+async def run_session(url: str, clips: list, offset: int, args) -> list:
+    """Replay every clip once, starting at clip offset, and return one record per clip."""
+    records = []
+    async with websockets.connect(url, max_size=None) as ws:
+        for i in range(len(clips)):
+            clip = clips[(offset + i) % len(clips)]
+            pcm = clip["pcm"]
+            duration = len(pcm) / 2 / SAMPLE_RATE
+            if args.mode == "streaming":
+                chunk = int(SAMPLE_RATE * args.chunk_ms / 1000) * 2
+                for start in range(0, len(pcm), chunk):
+                    await ws.send(pcm[start:start + chunk])
+                    if args.speed == "realtime":
+                        await asyncio.sleep(args.chunk_ms / 1000)
+                sent = time.perf_counter()
+                if args.end_action:
+                    await ws.send(json.dumps({"action": "end"}))
+            else:
+                if args.speed == "realtime":
+                    # The client sends the utterance once the speaker has finished
+                    await asyncio.sleep(duration)
+                await ws.send(pcm)
+                sent = time.perf_counter()
+            try:
+                text = await asyncio.wait_for(receive_final(ws), args.timeout)
+            except asyncio.TimeoutError:
+                text = None
+            records.append({
+                "clip": clip["name"],
+                "duration": duration,
+                "time_to_final": None if text is None else time.perf_counter() - sent,
+                "text": text,
+                "wer": word_error_rate(clip["reference"], text or "") if clip["reference"] is not None else None,
+            })
+    return records
+
+
+async def run_level(url: str, clips: list, concurrency: int, args, server_pid: int = None) -> dict:
+    sampler = ResourceSampler(server_pid) if server_pid else None
+    started = time.perf_counter()
+    if sampler:
+        sampler.start()
+    try:
+        sessions = await asyncio.gather(*[run_session(url, clips, i, args) for i in range(concurrency)])
+    finally:
+        if sampler:
+            sampler.stop()
+    wall = time.perf_counter() - started
+
+    records = [record for session in sessions for record in session]
+    done = [r for r in records if r["time_to_final"] is not None]
+    latencies = [r["time_to_final"] * 1000 for r in done]
+    wers = [r["wer"] for r in done if r["wer"] is not None]
+    audio = sum(r["duration"] for r in records)
+    return {
+        "concurrency": concurrency,
+        "utterances": len(records),
+        "timeouts": len(records) - len(done),
+        # Seconds spent waiting for the transcript per second of audio
+        "rtf": sum(r["time_to_final"] for r in done) / max(1e-9, sum(r["duration"] for r in done)),
+        "throughput": audio / wall,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "wer": statistics.mean(wers) if wers else None,
+        "cpu_percent": sampler.cpu_percent if sampler else None,
+        "peak_rss_mb": sampler.peak_rss / 2 ** 20 if sampler else None,
+    }
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def start_servers(args) -> tuple:
+    """Start the stand-ins (optional) and the STT service, return the processes and the service pid."""
+    processes = []
+    env = dict(os.environ, STT_PROVIDER=args.provider)
+    if args.standins:
+        standin_url = f"http://127.0.0.1:{args.standin_port}"
+        processes.append(subprocess.Popen([
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "standins.py"),
+            "--clips", args.clips, "--port", str(args.standin_port),
+            "--latency-ms", str(args.standin_latency_ms), "--rtf", str(args.standin_rtf),
+        ]))
+        wait_ready(f"{standin_url}/docs", processes[-1], 30)
+        env.update(GROQ_BASE_URL=standin_url, GROQ_STT_API_KEY="standin",
+                   STT_DEEPGRAM_URL=f"ws://127.0.0.1:{args.standin_port}", DG_API_KEY="standin")
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=APP_DIR, env=env,
+    ))
+    wait_ready(f"http://127.0.0.1:{args.port}/ready", processes[-1], args.ready_timeout)
+    return processes, processes[-1].pid
+
+
+def print_table(results: list):
+    columns = ["concurrency", "utterances", "timeouts", "rtf", "throughput", "p50_ms", "p95_ms", "p99_ms",
+               "wer", "cpu_percent", "peak_rss_mb"]
+    print(" ".join(f"{column:>11}" for column in columns))
+    for result in results:
+        cells = []
+        for column in columns:
+            value = result[column]
+            cells.append(f"{'-':>11}" if value is None else f"{value:>11.3f}" if isinstance(value, float) else f"{value:>11}")
+        print(" ".join(cells))
+
+
+async def run(args):
+    clips = load_clips(args.clips)
+    if not clips:
+        raise SystemExit(f"No .wav or .pcm clips in {args.clips}")
+    processes, server_pid = start_servers(args) if args.spawn_server else ([], None)
+    url = args.url or f"ws://127.0.0.1:{args.port}/api/v1/ws"
+    if args.mode == "streaming":
+        url += "?mode=streaming"
+    try:
+        results = []
+        for concurrency in args.concurrency:
+            result = await run_level(url, clips, concurrency, args, server_pid)
+            result.update(provider=args.provider if args.spawn_server else None, mode=args.mode, speed=args.speed)
+            results.append(result)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clips", default=REFERENCE_CLIP, help="directory of .wav/.pcm clips, or a single clip")
+    parser.add_argument("--url", help="websocket URL of a running service")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--speed", choices=["realtime", "max"], default="max")
+    parser.add_argument("--mode", choices=["utterance", "streaming"], default="utterance")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="frame size in streaming mode")
+    parser.add_argument("--no-end-action", dest="end_action", action="store_false",
+                        help="in streaming mode wait for the provider's endpointing instead of sending the end action")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for a transcript")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--spawn-server", action="store_true", help="start the service and measure its CPU and RSS")
+    parser.add_argument("--provider", default=os.environ.get("STT_PROVIDER", "faster_whisper"))
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--standins", action="store_true", help="point Groq and Deepgram at local stand-ins")
+    parser.add_argument("--standin-port", type=int, default=8765)
+    parser.add_argument("--standin-latency-ms", type=float, default=150.0)
+    parser.add_argument("--standin-rtf", type=float, default=0.05)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Local stand-ins for the Groq and Deepgram APIs so the replay benchmark runs offline.
+
+Neither stand-in recognizes speech. They answer with the reference text of
+the clip whose length is closest to the received audio, after a simulated
+server time of --latency-ms plus --rtf times the audio duration.
+
+    python benchmarks/standins.py --clips clips/ --port 8765
+
+Point the service at it with GROQ_BASE_URL=http://127.0.0.1:8765 and
+STT_DEEPGRAM_URL=ws://127.0.0.1:8765.
+"""
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import av
+import uvicorn
+from fastapi import FastAPI, File, Form, UploadFile, WebSocket, WebSocketDisconnect
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from replay import load_clips
+
+SAMPLE_RATE = 16000
+
+
+class StandIn:
+    def __init__(self, clips: list, latency_ms: float, rtf: float):
+        self.clips = [(len(clip["pcm"]) // 2, clip["reference"] or "") for clip in clips]
+        self.latency_ms = latency_ms
+        self.rtf = rtf
+
+    def lookup(self, num_samples: int) -> str:
+        if not self.clips:
+            return ""
+        return min(self.clips, key=lambda clip: abs(clip[0] - num_samples))[1]
+
+    async def simulate(self, duration: float):
+        await asyncio.sleep(self.latency_ms / 1000 + self.rtf * duration)
+
+
+def count_samples(body: bytes) -> int:
+    """Number of 16 kHz samples in an uploaded WAV, FLAC or Ogg/Opus file."""
+    with av.open(io.BytesIO(body)) as container:
+        stream = container.streams.audio[0]
+        samples = sum(frame.samples for frame in container.decode(stream))
+        return int(samples * SAMPLE_RATE / stream.rate)
+
+
+def deepgram_result(text: str, start: float, duration: float, speech_final: bool, from_finalize: bool = False) -> str:
+    return json.dumps({
+        "type": "Results",
+        "channel_index": [0, 1],
+        "duration": duration,
+        "start": start,
+        "is_final": True,
+        "speech_final": speech_final,
+        "from_finalize": from_finalize,
+        "channel": {"alternatives": [{"transcript": text, "confidence": 1.0, "words": []}]},
+        "metadata": {"request_id": str(uuid.uuid4()),
+                     "model_info": {"name": "standin", "version": "0", "arch": "standin"},
+                     "model_uuid": str(uuid.uuid4())},
+    })
+
+
+def create_app(standin: StandIn) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/openai/v1/audio/transcriptions")
+    async def groq_transcription(file: UploadFile = File(...), model: str = Form(""), language: str = Form("en"),
+                                 response_format: str = Form("json"), temperature: float = Form(0.0)):
+        body = await file.read()
+        num_samples = count_samples(body)
+        duration = num_samples / SAMPLE_RATE
+        await standin.simulate(duration)
+        text = standin.lookup(num_samples)
+        segments = [{"id": 0, "start": 0.0, "end": duration, "text": text, "no_speech_prob": 0.0}] if text else []
+        return {"text": text, "segments": segments, "language": language, "duration": duration}
+
+    @app.websocket("/v1/listen")
+    async def deepgram_listen(websocket: WebSocket):
+        await websocket.accept()
+        endpointing_ms = websocket.query_params.get("endpointing", "10")
+        endpoint_s = (10 if endpointing_ms in ("true", "false") else int(endpointing_ms)) / 1000
+        num_samples = 0
+        offset = 0.0
+        last_audio = None
+
+        async def finalize(from_finalize: bool = False):
+            nonlocal num_samples, offset, last_audio
+            duration = num_samples / SAMPLE_RATE
+            text = standin.lookup(num_samples)
+            num_samples, last_audio = 0, None
+            await standin.simulate(duration)
+            await websocket.send_text(deepgram_result(text, offset, duration, True, from_finalize))
+            offset += duration
+
+        try:
+            while True:
+                try:
+                    timeout = None if last_audio is None else max(0.0, last_audio + endpoint_s - time.perf_counter())
+                    message = await asyncio.wait_for(websocket.receive(), timeout)
+                except asyncio.TimeoutError:
+                    # No audio for the endpointing interval, the speaker is done
+                    await finalize()
+                    continue
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes") is not None:
+                    num_samples += len(message["bytes"]) // 2
+                    last_audio = time.perf_counter()
+                    continue
+                kind = json.loads(message["text"]).get("type")
+                if kind == "Finalize" and num_samples:
+                    await finalize(from_finalize=True)
+                elif kind == "CloseStream":
+                    await websocket.close()
+                    return
+        except WebSocketDisconnect:
+            return
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clips", required=True, help="directory of .wav/.pcm clips with optional .txt references")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="fixed server time per request")
+    parser.add_argument("--rtf", type=float, default=0.05, help="server time per second of audio")
+    args = parser.parse_args()
+    standin = StandIn(load_clips(args.clips), args.latency_ms, args.rtf)
+    uvicorn.run(create_app(standin), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import pytest
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from fastapi import WebSocketDisconnect
+from unittest.mock import patch
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from adaptive_decoding import LoadGovernor
+from whisper_worker_pool import WhisperWorkerPool
+from faster_whisper_stt import FasterWhisperSTT
+from metrics import Metrics
+from main import app
+
+
+def fake_pool(pending=0, latency_ms=0.0, num_workers=2):
+    return SimpleNamespace(pending=pending, latency_ms=latency_ms, num_workers=num_workers)
+
+
+def test_governor_degrades_with_queue_depth_and_latency():
+    Metrics.reset()
+    governor = LoadGovernor(enabled=True, queue_depths=[1, 2, 3], latency_ms=[1000, 2000, 3000], cooldown_s=60)
+    pool, fallback = fake_pool(), fake_pool()
+
+    assert governor.plan(pool, fallback, language="en") == (pool, {"language": "en"})
+
+    pool.pending = 2
+    assert governor.plan(pool, fallback, language="en") == (pool, {"language": "en", "beam_size": 1})
+
+    pool.latency_ms = 2500
+    assert governor.plan(pool, fallback) == (pool, {"beam_size": 1, "temperature": 0.0})
+
+    pool.pending = 6
+    assert governor.plan(pool, fallback) == (fallback, {"beam_size": 1, "temperature": 0.0})
+    # Without a smaller model the temperature fallback is the last step
+    assert governor.plan(pool)[0] is pool
+
+    counters = Metrics.snapshot()["counters"]
+    assert counters["stt_degradation_changes{direction=up,level=3}"] == 1
+    assert counters["stt_degraded_decodes{action=fallback_model}"] == 1
+    assert Metrics.snapshot()["gauges"]["stt_degradation_level"] == 3
+
+
+def test_governor_recovers_one_step_after_cooldown():
+    governor = LoadGovernor(enabled=True, queue_depths=[1, 2], latency_ms=[], cooldown_s=0)
+    pool = fake_pool(pending=4)
+    assert governor.level(pool) == 2
+
+    pool.pending = 0
+    assert governor.level(pool) == 2
+    assert governor.level(pool) == 1
+    assert governor.level(pool) == 1
+    assert governor.level(pool) == 0
+
+
+def test_governor_disabled_and_admission():
+    Metrics.reset()
+    governor = LoadGovernor(enabled=False, max_queue_depth=3)
+    pool = fake_pool(pending=4)
+    assert governor.plan(pool, language="en") == (pool, {"language": "en"})
+    assert governor.admit(pool)
+
+    pool.pending = 6
+    assert not governor.admit(pool)
+    assert Metrics.snapshot()["counters"]["stt_rejected_sessions{reason=overload}"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pool_tracks_pending_decodes_and_latency():
+    pool = WhisperWorkerPool.__new__(WhisperWorkerPool)
+    pool.pending, pool.latency_ms = 0, 0.0
+    pool._executor = ThreadPoolExecutor(1)
+
+    def decode():
+        assert pool.pending == 1
+        return "done"
+
+    try:
+        assert await pool._run(decode) == "done"
+    finally:
+        pool._executor.shutdown()
+    assert pool.pending == 0
+    assert pool.latency_ms > 0
+
+
+def test_websocket_rejects_sessions_when_overloaded():
+    client = TestClient(app)
+    with patch.object(FasterWhisperSTT, "admit", return_value=False):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            with pytest.raises(WebSocketDisconnect) as exc_info:
+                websocket.receive_text()
+            assert exc_info.value.code == 1013
@@ -0,0 +1,110 @@
+import pytest
+import os
+import sys
+import av
+import numpy as np
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock
+from fastapi import WebSocketDisconnect
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from audio_decoding import AudioDecoder, pack_packets, split_packets
+from main import app
+
+
+def sine(seconds, rate, frequency=440):
+    t = np.arange(int(seconds * rate)) / rate
+    return (np.sin(2 * np.pi * frequency * t) * 8000).astype(np.int16)
+
+
+def opus_packets(samples, rate=48000):
+    encoder = av.CodecContext.create("libopus", "w")
+    encoder.sample_rate = rate
+    encoder.layout = "mono"
+    encoder.format = "s16"
+    encoder.bit_rate = 24000
+    packets = []
+    frame_size = rate // 50
+    for start in range(0, len(samples), frame_size):
+        frame = av.AudioFrame.from_ndarray(samples[start:start + frame_size].reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = rate
+        frame.pts = start
+        packets.extend(bytes(packet) for packet in encoder.encode(frame))
+    packets.extend(bytes(packet) for packet in encoder.encode(None))
+    return packets
+
+
+def dominant_frequency(pcm):
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    return np.argmax(np.abs(np.fft.rfft(samples))) * 16000 / len(samples)
+
+
+def test_split_packets():
+    message = pack_packets([b"abc", b"", b"de"])
+    assert [bytes(packet) for packet in split_packets(message)] == [b"abc", b"", b"de"]
+
+    with pytest.raises(ValueError):
+        split_packets(message[:-1])
+
+
+def test_decode_opus_utterance():
+    packets = opus_packets(sine(1, 48000))
+    message = pack_packets(packets)
+    # 24 kbit/s instead of 256 kbit/s of 16 kHz PCM
+    assert len(message) < 32000 / 8
+
+    pcm = AudioDecoder("opus", 48000).decode(message, end=True)
+    assert abs(len(pcm) // 2 - 16000) < 800
+    assert abs(dominant_frequency(pcm) - 440) < 5
+
+
+def test_streaming_decode_matches_utterance_decode():
+    packets = opus_packets(sine(1, 48000))
+    decoder = AudioDecoder("opus", 48000, buffer_s=0.01)
+    streamed = b"".join(decoder.decode(pack_packets(packets[i:i + 5])) for i in range(0, len(packets), 5))
+    streamed += decoder.decode(b"", end=True)
+    assert streamed == AudioDecoder("opus", 48000).decode(pack_packets(packets), end=True)
+
+
+def test_resample_pcm():
+    stereo = np.repeat(sine(1, 8000), 2)
+    pcm = AudioDecoder("pcm", 8000, channels=2).decode(stereo.tobytes(), end=True)
+    assert abs(len(pcm) // 2 - 16000) < 100
+    assert abs(dominant_frequency(pcm) - 440) < 5
+
+    passthrough = AudioDecoder()
+    data = sine(0.1, 16000).tobytes()
+    assert passthrough.decode(data, end=True) is data
+
+
+def test_invalid_audio():
+    with pytest.raises(ValueError):
+        AudioDecoder("mp3")
+    with pytest.raises(ValueError):
+        AudioDecoder("opus", 44100)
+
+    decoder = AudioDecoder("opus", 48000)
+    with pytest.raises(ValueError):
+        decoder.decode(pack_packets([b"\xff\x00garbage"]), end=True)
+    assert decoder.decode(pack_packets(opus_packets(sine(0.2, 48000))), end=True)
+
+
+def test_websocket_opus_session():
+    client = TestClient(app)
+    mock_stt = AsyncMock()
+    mock_stt.transcribe = AsyncMock(return_value="hello")
+
+    with patch("main.STTFactory.get_instance", return_value=mock_stt):
+        with client.websocket_connect("/api/v1/ws?codec=opus&sample_rate=48000") as websocket:
+            websocket.send_bytes(pack_packets(opus_packets(sine(1, 48000))))
+            assert websocket.receive_text() == "hello"
+
+        with client.websocket_connect("/api/v1/ws?codec=mp3") as websocket:
+            with pytest.raises(WebSocketDisconnect) as exc_info:
+                websocket.receive_text()
+            assert exc_info.value.code == 1003
+
+    pcm = mock_stt.transcribe.call_args[0][0]
+    assert abs(len(pcm) // 2 - 16000) < 800
@@ -0,0 +1,50 @@
+import io
+import wave
+import os
+import sys
+import av
+import numpy as np
+import pytest
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from audio_encoding import encode_upload
+
+PCM = (np.sin(np.arange(16000) * 2 * np.pi * 440 / 16000) * 8000).astype(np.int16)
+
+
+def decode(body) -> tuple:
+    with av.open(io.BytesIO(body)) as container:
+        stream = container.streams.audio[0]
+        frames = [frame.to_ndarray().reshape(-1) for frame in container.decode(stream)]
+        return stream.codec_context.name, stream.rate, np.concatenate(frames)
+
+
+def test_wav_upload_is_readable():
+    filename, body = encode_upload(PCM.tobytes(), "wav")
+    with wave.open(io.BytesIO(body)) as wav:
+        assert (wav.getnchannels(), wav.getframerate(), wav.getsampwidth()) == (1, 16000, 2)
+        assert wav.readframes(wav.getnframes()) == PCM.tobytes()
+    assert filename == "audio.wav"
+
+
+def test_flac_upload_is_lossless_and_smaller():
+    filename, body = encode_upload(PCM.tobytes(), "flac")
+    codec, rate, samples = decode(body)
+    assert (filename, codec, rate) == ("audio.flac", "flac", 16000)
+    np.testing.assert_array_equal(samples, PCM)
+    assert len(body) < PCM.nbytes
+
+
+def test_opus_upload_decodes():
+    filename, body = encode_upload(PCM.tobytes(), "opus")
+    codec, rate, samples = decode(body)
+    assert (filename, codec) == ("audio.ogg", "opus")
+    assert abs(len(samples) / rate - 1.0) < 0.05
+    assert len(body) < PCM.nbytes / 5
+
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(ValueError):
+        encode_upload(PCM.tobytes(), "mp3")
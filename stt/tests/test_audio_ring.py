@@ -0,0 +1,58 @@
+import pytest
+import os
+import sys
+import errno
+import numpy as np
+from unittest.mock import patch
+from multiprocessing import shared_memory
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from audio_ring import AudioRingBuffer
+
+
+def pcm(start, stop):
+    return (np.arange(start, stop) % 20000 - 10000).astype(np.int16)
+
+
+def test_ring_views_are_contiguous_across_the_wrap():
+    ring = AudioRingBuffer(1.0, shared=False)
+    for start in range(0, 40000, 3000):
+        dropped = ring.write(pcm(start, start + 3000).tobytes())
+    assert len(ring) == 16000
+    assert dropped == 3000
+    np.testing.assert_allclose(ring.view(), pcm(26000, 42000) / 32768.0)
+
+    ring.consume(1000)
+    np.testing.assert_allclose(ring.view(10, 20), pcm(27010, 27020) / 32768.0)
+    with pytest.raises(ValueError):
+        ring.view()[0] = 0.0
+    with pytest.raises(ValueError):
+        ring.block()
+
+    ring.clear()
+    assert len(ring) == 0
+
+
+def test_ring_in_shared_memory():
+    ring = AudioRingBuffer(0.5)
+    assert ring.write(pcm(0, 20000).tobytes()) == 12000
+    name, offset, length = ring.block()
+    assert length == 8000
+    np.testing.assert_allclose(ring.view(), pcm(12000, 20000) / 32768.0)
+    ring.close()
+
+
+def test_ring_fails_right_away_when_shared_memory_is_full():
+    def full(fd, offset, size):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    with patch.object(os, "posix_fallocate", full, create=True), \
+            patch.object(shared_memory.SharedMemory, "unlink", autospec=True) as unlink:
+        with pytest.raises(OSError, match="/dev/shm"):
+            AudioRingBuffer(1.0)
+
+    # The block that did not fit is removed again
+    block = unlink.call_args.args[0]
+    shared_memory.SharedMemory.unlink(block)
@@ -0,0 +1,93 @@
+import pytest
+import asyncio
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from batch_scheduler import TranscriptionBatcher
+from metrics import Metrics
+
+
+class FakePool:
+    def __init__(self):
+        self.batches = []
+
+    async def transcribe_batch(self, datas, **options):
+        self.batches.append((list(datas), options))
+        return [{"segments": [{"text": data.decode()}], "language": options.get("language")} for data in datas]
+
+    async def transcribe(self, data, **options):
+        # Single utterances take the regular decode path
+        self.batches.append(([data], {**options, "single": True}))
+        return {"segments": [{"text": data.decode()}], "language": options.get("language")}
+
+
+@pytest.mark.asyncio
+async def test_batcher_groups_concurrent_utterances():
+    Metrics.reset()
+    pool = FakePool()
+    batcher = TranscriptionBatcher(pool, max_batch_size=4, max_wait_ms=50)
+
+    results = await asyncio.gather(*[batcher.transcribe(f"utt{i}".encode(), language="en") for i in range(4)])
+
+    assert [result["segments"][0]["text"] for result in results] == ["utt0", "utt1", "utt2", "utt3"]
+    assert len(pool.batches) == 1
+    assert Metrics.snapshot()["summaries"]["stt_batch_size"]["max"] == 4
+
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_after_max_wait():
+    pool = FakePool()
+    batcher = TranscriptionBatcher(pool, max_batch_size=8, max_wait_ms=10)
+
+    result = await asyncio.wait_for(batcher.transcribe(b"alone", language="en"), timeout=1)
+
+    assert result["segments"][0]["text"] == "alone"
+    assert pool.batches == [([b"alone"], {"language": "en", "single": True})]
+
+
+@pytest.mark.asyncio
+async def test_batcher_splits_batches_by_options():
+    pool = FakePool()
+    batcher = TranscriptionBatcher(pool, max_batch_size=4, max_wait_ms=20)
+
+    await asyncio.gather(
+        batcher.transcribe(b"a", language="en"),
+        batcher.transcribe(b"b", language="de"),
+        batcher.transcribe(b"c", language="en"),
+    )
+
+    assert sorted((options["language"], datas) for datas, options in pool.batches) == [
+        ("de", [b"b"]),
+        ("en", [b"a", b"c"]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_batcher_handles_unhashable_options():
+    pool = FakePool()
+    batcher = TranscriptionBatcher(pool, max_batch_size=2, max_wait_ms=20)
+
+    results = await asyncio.wait_for(asyncio.gather(
+        batcher.transcribe(b"a", temperature=[0.0, 0.2]),
+        batcher.transcribe(b"b", temperature=[0.0, 0.2]),
+    ), timeout=1)
+
+    assert [result["segments"][0]["text"] for result in results] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_queued_utterances_fail_when_the_batcher_dies():
+    pool = FakePool()
+    batcher = TranscriptionBatcher(pool, max_batch_size=4, max_wait_ms=1000)
+    first = asyncio.create_task(batcher.transcribe(b"a", language="en"))
+    second = asyncio.create_task(batcher.transcribe(b"b", language="en"))
+    await asyncio.sleep(0.01)
+
+    batcher._task.cancel()
+
+    for task in (first, second):
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(task, timeout=1)
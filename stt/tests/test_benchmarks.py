@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+from fastapi.testclient import TestClient
+
+# Add the path to the benchmark modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+from replay import load_clips, percentile, process_tree_usage
+from standins import StandIn, create_app
+
+ASSETS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app', 'assets'))
+
+
+def test_load_clips_reads_wav_and_reference():
+    clips = load_clips(ASSETS_DIR)
+    assert [clip["name"] for clip in clips] == ["reference.wav"]
+    assert clips[0]["reference"].startswith("Hello, thank you for calling.")
+
+
+def test_percentile_and_process_usage():
+    assert percentile([5, 1, 4, 2, 3], 0.5) == 3
+    assert percentile([], 0.99) == 0.0
+    cpu, rss = process_tree_usage(os.getpid())
+    assert cpu > 0 and rss > 0
+
+
+def test_standin_answers_groq_and_deepgram_requests():
+    clips = load_clips(ASSETS_DIR)
+    client = TestClient(create_app(StandIn(clips, latency_ms=0, rtf=0)))
+    pcm = clips[0]["pcm"]
+    wav = open(os.path.join(ASSETS_DIR, "reference.wav"), "rb").read()
+
+    response = client.post("/openai/v1/audio/transcriptions", files={"file": ("audio.wav", wav)},
+                           data={"model": "whisper-large-v3", "language": "en"})
+    assert response.json()["text"] == clips[0]["reference"]
+
+    with client.websocket_connect("/v1/listen?endpointing=10") as websocket:
+        websocket.send_bytes(pcm)
+        websocket.send_text(json.dumps({"type": "Finalize"}))
+        result = json.loads(websocket.receive_text())
+    assert result["speech_final"] and result["channel"]["alternatives"][0]["transcript"] == clips[0]["reference"]
@@ -0,0 +1,91 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+import asyncio
+import numpy as np
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+import faster_whisper_stt
+from faster_whisper_stt import FasterWhisperSTT
+from chunked_transcription import plan_chunks, stitch, SAMPLE_RATE
+from metrics import Metrics
+
+
+def speech(seconds: float, silences=()) -> bytes:
+    """Loud noise with silent gaps, given as (start, end) seconds."""
+    pcm = np.random.default_rng(0).integers(-8000, 8000, int(seconds * SAMPLE_RATE), dtype=np.int16)
+    for start, end in silences:
+        pcm[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)] = 0
+    return pcm.tobytes()
+
+
+def transcription(*segments, cpu_s=0.1):
+    return {
+        "segments": [
+            {"start": start, "end": end, "text": text, "words": None,
+             "avg_logprob": -0.2, "no_speech_prob": 0.05, "compression_ratio": 1.2}
+            for start, end, text in segments
+        ],
+        "language": "en",
+        "duration": 0.0,
+        "cpu_s": cpu_s,
+    }
+
+
+def test_plan_chunks_cuts_at_silences():
+    chunks = plan_chunks(speech(50, silences=[(17.0, 17.2), (34.0, 34.2)]), target_s=20, search_s=5, overlap_s=1)
+
+    assert [(round(cut / SAMPLE_RATE), round(end / SAMPLE_RATE)) for _, cut, end in chunks] == [(0, 17), (17, 34), (34, 50)]
+    assert 17.0 * SAMPLE_RATE <= chunks[0][2] <= 17.2 * SAMPLE_RATE
+    # Every chunk after the first is decoded from the overlap before its cut
+    assert chunks[0][0] == 0
+    assert chunks[1][1] - chunks[1][0] == SAMPLE_RATE
+    assert chunks[-1][2] == 50 * SAMPLE_RATE
+
+
+def test_plan_chunks_keeps_short_audio_whole():
+    assert plan_chunks(speech(10), target_s=20) == [(0, 0, 10 * SAMPLE_RATE)]
+
+
+def test_stitch_removes_repeated_overlap_words():
+    Metrics.reset()
+    chunks = [(0, 0, 20 * SAMPLE_RATE), (19 * SAMPLE_RATE, 20 * SAMPLE_RATE, 30 * SAMPLE_RATE)]
+    merged = stitch(chunks, [
+        transcription((0.0, 19.8, " So we went to the park.")),
+        transcription((0.0, 0.8, " the park."), (0.8, 5.0, " Then it rained."), cpu_s=0.2),
+    ], overlap_s=1)
+
+    assert [segment["text"] for segment in merged["segments"]] == [" So we went to the park.", " Then it rained."]
+    assert merged["segments"][1]["start"] == pytest.approx(19.8)
+    assert merged["duration"] == 30.0
+    assert merged["cpu_s"] == pytest.approx(0.3)
+    assert Metrics.snapshot()["counters"]["stt_chunk_overlap_words"] == 2
+
+
+@pytest.mark.asyncio
+async def test_long_utterances_are_decoded_concurrently():
+    Metrics.reset()
+    active = []
+    peak = []
+
+    async def decode(data, **options):
+        active.append(data)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(data)
+        return transcription((0.0, len(data) / 2 / SAMPLE_RATE, f" {len(data) // 2 // SAMPLE_RATE} seconds."))
+
+    pool = AsyncMock()
+    pool.transcribe = decode
+    with patch.object(faster_whisper_stt, "STT_CHUNKING", True), \
+            patch.object(FasterWhisperSTT, "get_pool", return_value=pool):
+        result = await FasterWhisperSTT().transcribe(speech(45, silences=[(18.0, 18.5)]))
+
+    assert max(peak) == 3
+    assert result.count("seconds.") == 3
+    snapshot = Metrics.snapshot()
+    assert snapshot["counters"]["stt_chunked_utterances"] == 1
+    assert snapshot["summaries"]["stt_utterance_chunks"]["max"] == 3
@@ -0,0 +1,199 @@
+import pytest
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+import deepgram_stt
+from deepgram import LiveTranscriptionEvents
+from deepgram_pool import DeepgramConnectionPool
+from deepgram_stt import DeepGramSTT
+from metrics import Metrics
+
+
+class FakeConnection:
+    def __init__(self):
+        self.handlers = {}
+        self.started = False
+        self.finished = False
+        self.alive = True
+        # Answer Finalize with a from_finalize result, like Deepgram does
+        self.flushes = True
+        self.sent = []
+
+    def on(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    async def emit(self, event, **kwargs):
+        for handler in self.handlers.get(event, []):
+            await handler(self, **kwargs)
+
+    async def start(self, options, addons=None):
+        self.started = True
+        return True
+
+    async def send(self, data):
+        self.sent.append(data)
+        return True
+
+    async def finalize(self):
+        if self.alive and self.flushes:
+            asyncio.get_running_loop().call_soon(
+                asyncio.ensure_future, self.emit(LiveTranscriptionEvents.Transcript, result=transcript("", from_finalize=True)))
+        return self.alive
+
+    async def keep_alive(self):
+        return self.alive
+
+    async def finish(self):
+        self.finished = True
+        return True
+
+
+class FakeClient:
+    def __init__(self):
+        self.connections = []
+        self.listen = SimpleNamespace(asyncwebsocket=SimpleNamespace(v=self.connect))
+
+    def connect(self, version):
+        connection = FakeConnection()
+        self.connections.append(connection)
+        return connection
+
+
+def transcript(text, from_finalize=False):
+    return SimpleNamespace(channel=SimpleNamespace(alternatives=[SimpleNamespace(transcript=text)]),
+                           is_final=True, speech_final=not from_finalize, from_finalize=from_finalize)
+
+
+@pytest.mark.asyncio
+async def test_pool_hands_out_open_connections_and_refills():
+    Metrics.reset()
+    client = FakeClient()
+    pool = DeepgramConnectionPool(client, {}, size=2, check_interval_s=60)
+    await pool.start()
+    assert len(client.connections) == 2 and all(c.started for c in client.connections)
+
+    pooled = await pool.acquire(object())
+    assert pooled.connection is client.connections[0]
+    await pool._fill_task
+    assert len(client.connections) == 3
+    assert Metrics.snapshot()["counters"]["stt_deepgram_pool_checkouts{result=hit}"] == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_events_reach_only_the_session_holding_the_connection():
+    pool = DeepgramConnectionPool(FakeClient(), {}, size=1, check_interval_s=60)
+    await pool.start()
+    session = SimpleNamespace(on_message=AsyncMock())
+
+    pooled = await pool.acquire(session)
+    await pooled.connection.emit(LiveTranscriptionEvents.Transcript, result=transcript("hello"))
+    await pool.release(pooled)
+    await pooled.connection.emit(LiveTranscriptionEvents.Transcript, result=transcript("late"))
+
+    session.on_message.assert_called_once()
+    assert session.on_message.call_args.kwargs["result"].channel.alternatives[0].transcript == "hello"
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_returned_connections_wait_for_their_trailing_results():
+    Metrics.reset()
+    client = FakeClient()
+    pool = DeepgramConnectionPool(client, {}, size=2, check_interval_s=60, flush_timeout_s=0.1)
+    await pool.start()
+    first, second = SimpleNamespace(on_message=AsyncMock()), SimpleNamespace(on_message=AsyncMock())
+    pooled = await pool.acquire(first)
+    pooled.connection.flushes = False
+
+    release = asyncio.create_task(pool.release(pooled))
+    await asyncio.sleep(0)
+    # The connection is not handed out before the results of the first session's audio arrived
+    assert (await pool.acquire(second)).connection is not pooled.connection
+    await pool._fill_task
+    await pooled.connection.emit(LiveTranscriptionEvents.Transcript, result=transcript("late"))
+    await pooled.connection.emit(LiveTranscriptionEvents.Transcript, result=transcript("tail", from_finalize=True))
+    await release
+
+    assert pooled in pool._idle
+    pooled.session = second
+    await pooled.connection.emit(LiveTranscriptionEvents.Transcript, result=transcript("next"))
+    first.on_message.assert_not_called()
+    assert second.on_message.call_args.kwargs["result"].channel.alternatives[0].transcript == "next"
+
+    # Without the from_finalize result the connection is closed instead
+    pool._idle.clear()
+    await pool.release(pooled)
+    assert pooled.connection.finished and pooled not in pool._idle
+    assert Metrics.snapshot()["counters"]["stt_deepgram_pool_discarded{reason=flush_timeout}"] == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_health_check_replaces_dead_connections():
+    Metrics.reset()
+    client = FakeClient()
+    pool = DeepgramConnectionPool(client, {}, size=2, check_interval_s=60)
+    await pool.start()
+    first, second = client.connections
+    first.alive = False
+    await second.emit(LiveTranscriptionEvents.Close, close=None)
+
+    await pool.check()
+
+    assert first.finished and second.finished
+    assert [p.connection for p in pool._idle] == client.connections[2:]
+    counters = Metrics.snapshot()["counters"]
+    assert counters["stt_deepgram_pool_discarded{reason=failed_probe}"] == 1
+    assert counters["stt_deepgram_pool_discarded{reason=closed}"] == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_deepgram_session_checks_out_and_returns_connection():
+    client = FakeClient()
+    pool = DeepgramConnectionPool(client, {}, size=1, check_interval_s=60)
+    await pool.start()
+    text_handler = AsyncMock()
+
+    with patch.object(deepgram_stt, "STT_DEEPGRAM_POOL_SIZE", 1), \
+            patch.object(DeepGramSTT, "get_client", return_value=client), \
+            patch.object(DeepGramSTT, "get_pool", return_value=pool):
+        stt = DeepGramSTT()
+        await stt.initialize(text_handler)
+        # The refilled connection is checked out by another session
+        await pool._fill_task
+        pool._idle.clear()
+        await stt.transcribe(b"\x00" * 320)
+        connection = client.connections[0]
+        await connection.emit(LiveTranscriptionEvents.Transcript, result=transcript("hello"))
+        await stt.close()
+
+    assert connection.sent == [b"\x00" * 320]
+    text_handler.assert_called_once_with("hello")
+    assert connection in [p.connection for p in pool._idle]
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_custom_endpoint_timings_open_their_own_connection():
+    client = FakeClient()
+
+    with patch.object(deepgram_stt, "STT_DEEPGRAM_POOL_SIZE", 1), \
+            patch.object(DeepGramSTT, "get_client", return_value=client), \
+            patch.object(DeepGramSTT, "_pools", {}):
+        stt = DeepGramSTT(streaming=True, endpointing_ms=123)
+        await stt.initialize(AsyncMock())
+        assert stt.pooled is None and stt.dg_connection is client.connections[0]
+        with pytest.raises(ValueError):
+            DeepGramSTT.get_pool(stt.session_options)
+        await stt.close()
+        assert DeepGramSTT._pools == {}
+
+    assert client.connections[0].finished
@@ -0,0 +1,76 @@
+import pytest
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from deepgram_stt import DeepGramSTT, live_options
+from main import app, STTFactory
+
+
+def result(text, is_final=False, speech_final=False, from_finalize=None):
+    return SimpleNamespace(channel=SimpleNamespace(alternatives=[SimpleNamespace(transcript=text)]),
+                           is_final=is_final, speech_final=speech_final, from_finalize=from_finalize)
+
+
+def make_stt(**kwargs):
+    stt = DeepGramSTT(streaming=True, **kwargs)
+    stt.text_handler = AsyncMock()
+    return stt
+
+
+def test_streaming_options_enable_interim_results_and_endpointing():
+    options = live_options(True, 250, 500)
+    assert options.interim_results and options.vad_events
+    assert options.endpointing == 250
+    # Deepgram does not accept UtteranceEnd timeouts below one second
+    assert options.utterance_end_ms == "1000"
+    assert live_options().interim_results is None
+
+
+@pytest.mark.asyncio
+async def test_streaming_sends_interim_then_final_on_endpointing():
+    stt = make_stt()
+    await stt.on_message(None, result=result("hello"))
+    await stt.on_message(None, result=result("hello there", is_final=True))
+    await stt.on_message(None, result=result("general"))
+    await stt.on_message(None, result=result("general kenobi", is_final=True, speech_final=True))
+
+    calls = [(c.args[0], c.kwargs) for c in stt.text_handler.call_args_list]
+    assert calls == [
+        ("hello", {"type": "interim"}),
+        ("hello there general", {"type": "interim"}),
+        ("hello there general kenobi", {"type": "final", "reason": "endpointing"}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_streaming_finalizes_on_utterance_end():
+    stt = make_stt()
+    await stt.on_message(None, result=result("hello there", is_final=True))
+    await stt.on_utterance_end(None, utterance_end=SimpleNamespace(last_word_end=1.2))
+    await stt.on_utterance_end(None, utterance_end=SimpleNamespace(last_word_end=1.2))
+
+    stt.text_handler.assert_called_once_with("hello there", type="final", reason="utterance_end")
+
+
+def test_websocket_passes_endpoint_timing_to_session():
+    client = TestClient(app)
+    mock_stt = AsyncMock()
+
+    with patch("main.STTFactory.get_instance", return_value=mock_stt) as mock_get_instance:
+        with client.websocket_connect("/api/v1/ws?mode=streaming&endpointing_ms=200&utterance_end_ms=1200"):
+            pass
+
+    assert mock_get_instance.call_args.kwargs == {"streaming": True, "endpointing_ms": 200, "utterance_end_ms": 1200,
+                                                  "model": None, "language": None, "compute_type": None}
+
+
+def test_factory_builds_streaming_deepgram_session():
+    stt = STTFactory.get_instance("deepgram", streaming=True, endpointing_ms=100)
+    assert stt.streaming
+    assert stt.session_options == (True, 100, 1000)
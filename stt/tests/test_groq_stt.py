@@ -0,0 +1,68 @@
+import pytest
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+import httpx
+from groq import APIConnectionError
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+import groq_stt
+from groq_stt import GroqSTT
+from metrics import Metrics
+
+TRANSCRIPTION = SimpleNamespace(text="hello world", segments=[{"no_speech_prob": 0.01}])
+
+
+def make_model(create):
+    return SimpleNamespace(audio=SimpleNamespace(transcriptions=SimpleNamespace(create=create)))
+
+
+@pytest.mark.asyncio
+async def test_transcribe_retries_connection_errors():
+    Metrics.reset()
+    error = APIConnectionError(request=httpx.Request("POST", "https://api.groq.com"))
+    create = AsyncMock(side_effect=[error, TRANSCRIPTION])
+
+    with patch.object(GroqSTT, "get_model", return_value=make_model(create)), \
+            patch.object(groq_stt, "GROQ_STT_BACKOFF_S", 0.01):
+        result = await GroqSTT().transcribe(b"\x00" * 3200)
+
+    assert result == "hello world"
+    assert create.call_count == 2
+    assert Metrics.snapshot()["counters"]["stt_groq_retries"] == 1
+    assert create.call_args.kwargs["timeout"] <= groq_stt.GROQ_STT_TIMEOUT_S
+
+
+@pytest.mark.asyncio
+async def test_transcribe_gives_up_at_deadline():
+    Metrics.reset()
+
+    async def hang(**kwargs):
+        await asyncio.sleep(10)
+
+    with patch.object(GroqSTT, "get_model", return_value=make_model(hang)), \
+            patch.object(groq_stt, "GROQ_STT_TIMEOUT_S", 0.1):
+        result = await GroqSTT().transcribe(b"\x00" * 3200)
+
+    assert result == ""
+    assert Metrics.snapshot()["counters"]["stt_groq_failures{reason=deadline}"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sessions_overlap_network_waits():
+    async def slow_create(**kwargs):
+        await asyncio.sleep(0.2)
+        return TRANSCRIPTION
+
+    with patch.object(GroqSTT, "get_model", return_value=make_model(slow_create)):
+        started = time.perf_counter()
+        results = await asyncio.gather(*(GroqSTT().transcribe(b"\x00" * 3200) for _ in range(5)))
+        elapsed = time.perf_counter() - started
+
+    assert results == ["hello world"] * 5
+    assert elapsed < 0.5
@@ -0,0 +1,68 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from faster_whisper_stt import FasterWhisperSTT
+from hallucination_filter import rejection_reason, filter_segments
+from metrics import Metrics
+
+
+def segment(text=" Book a table for two.", avg_logprob=-0.3, no_speech_prob=0.05, compression_ratio=1.2):
+    return {"start": 0.0, "end": 1.0, "text": text, "avg_logprob": avg_logprob,
+            "no_speech_prob": no_speech_prob, "compression_ratio": compression_ratio, "words": None}
+
+
+def test_rejection_reason():
+    assert rejection_reason(segment()) is None
+    assert rejection_reason(segment(no_speech_prob=0.9)) == "no_speech_prob"
+    assert rejection_reason(segment(avg_logprob=-1.5, no_speech_prob=0.65)) == "avg_logprob"
+    # Real speech the model is unsure about is kept
+    assert rejection_reason(segment(avg_logprob=-1.5)) is None
+    assert rejection_reason(segment(" I'm, I'm, I'm, I'm, I'm, I'm, I'm.", compression_ratio=4.0)) == "compression_ratio"
+    assert rejection_reason(segment(" Thanks for watching!")) == "phrase"
+    assert rejection_reason(segment(" Subtitles by the Amara.org community")) == "phrase"
+    assert rejection_reason(segment(" Thank you for watching. Please subscribe!")) == "phrase"
+    # Speech that merely contains a phrase is kept
+    assert rejection_reason(segment(" Thanks for watching my dog.")) is None
+    assert rejection_reason(segment(" Thanks for watchingthe kids.")) is None
+
+
+def test_filter_segments_counts_rejections():
+    Metrics.reset()
+    kept = filter_segments([segment(), segment(" Please subscribe.")])
+
+    assert [s["text"] for s in kept] == [" Book a table for two."]
+    assert filter_segments([segment(no_speech_prob=0.95)]) == []
+    assert filter_segments([segment(no_speech_prob=0.95)], record=False) == []
+
+    counters = Metrics.snapshot()["counters"]
+    assert counters["stt_rejected_segments{reason=phrase}"] == 1
+    assert counters["stt_rejected_segments{reason=no_speech_prob}"] == 1
+    assert counters["stt_rejected_utterances"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rejected_utterances_produce_no_transcript():
+    Metrics.reset()
+    pool = AsyncMock()
+    pool.transcribe = AsyncMock(return_value={
+        "segments": [segment(" Thank you for watching.")], "language": "en", "duration": 1.0,
+    })
+
+    async def transcribe_segments(data, **options):
+        yield segment(" Thanks for watching!")
+        yield segment()
+
+    pool.transcribe_segments = transcribe_segments
+    with patch.object(FasterWhisperSTT, "get_pool", return_value=pool):
+        stt = FasterWhisperSTT()
+        assert await stt.transcribe(b"\x00" * 3200) == ""
+        assert [text async for text in stt.transcribe_segments(b"\x00" * 3200)] == [" Book a table for two."]
+
+    counters = Metrics.snapshot()["counters"]
+    assert counters["stt_rejected_utterances"] == 1
+    assert counters["stt_rejected_segments{reason=phrase}"] == 2
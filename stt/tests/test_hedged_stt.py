@@ -0,0 +1,99 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from hedged_stt import HedgedSTT
+from metrics import Metrics
+from main import STTFactory, GroqSTT, FasterWhisperSTT
+
+
+class FakeProvider:
+    def __init__(self, text, delay, error=None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.cancelled = False
+        self.initialize = AsyncMock()
+        self.close = AsyncMock()
+
+    async def transcribe(self, data):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return self.text
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_wins_without_hedging():
+    Metrics.reset()
+    secondary = FakeProvider("local", 0.0)
+    stt = HedgedSTT(FakeProvider("remote", 0.01), secondary, delay_ms=100)
+
+    assert await stt.transcribe(b"\x00" * 320) == "remote"
+    counters = Metrics.snapshot()["counters"]
+    assert counters == {"stt_hedge_wins{winner=primary}": 1}
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    Metrics.reset()
+    primary = FakeProvider("remote", 1.0)
+    stt = HedgedSTT(primary, FakeProvider("local", 0.01), delay_ms=20)
+
+    assert await stt.transcribe(b"\x00" * 320) == "local"
+    await asyncio.sleep(0)
+    assert primary.cancelled
+    snapshot = Metrics.snapshot()
+    assert snapshot["counters"]["stt_hedge_wins{winner=secondary}"] == 1
+    assert snapshot["counters"]["stt_hedge_secondary_started{reason=delay}"] == 1
+    assert snapshot["summaries"]["stt_hedge_loser_elapsed_ms{loser=primary}"]["max"] >= 20
+
+
+@pytest.mark.asyncio
+async def test_failed_primary_starts_secondary_immediately():
+    Metrics.reset()
+    stt = HedgedSTT(FakeProvider("", 0.0, error=RuntimeError("503")), FakeProvider("local", 0.0), delay_ms=1000)
+
+    assert await asyncio.wait_for(stt.transcribe(b"\x00" * 320), 0.5) == "local"
+    assert Metrics.snapshot()["counters"]["stt_hedge_secondary_started{reason=error}"] == 1
+
+
+@pytest.mark.asyncio
+async def test_empty_primary_result_defers_to_secondary():
+    Metrics.reset()
+    # Groq returns no text once its retries or deadline ran out
+    stt = HedgedSTT(FakeProvider("", 0.0), FakeProvider("local", 0.01), delay_ms=1000)
+
+    assert await asyncio.wait_for(stt.transcribe(b"\x00" * 320), 0.5) == "local"
+    counters = Metrics.snapshot()["counters"]
+    assert counters["stt_hedge_secondary_started{reason=empty}"] == 1
+    assert counters["stt_hedge_wins{winner=secondary}"] == 1
+
+    # Without speech both providers return no text
+    stt = HedgedSTT(FakeProvider("", 0.0), FakeProvider("", 0.01, error=RuntimeError("503")), delay_ms=1000)
+    assert await stt.transcribe(b"\x00" * 320) == ""
+
+
+@pytest.mark.asyncio
+async def test_both_failing_raises():
+    stt = HedgedSTT(FakeProvider("", 0.0, error=RuntimeError("primary")),
+                    FakeProvider("", 0.0, error=RuntimeError("secondary")), delay_ms=10)
+
+    with pytest.raises(RuntimeError):
+        await stt.transcribe(b"\x00" * 320)
+
+
+def test_factory_builds_hedged_provider():
+    stt = STTFactory.get_instance("hedged")
+    assert isinstance(stt, HedgedSTT)
+    assert isinstance(stt.primary, GroqSTT)
+    assert isinstance(stt.secondary, FasterWhisperSTT)
@@ -1,14 +1,19 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
 import os
 import sys
+import asyncio
 import numpy as np
 
 # Add the path to the main.py file
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
 
 from main import app, STTFactory, FasterWhisperSTT, GroqSTT, DeepGramSTT
+from session_limiter import SessionLimiter
+from utterance_framing import pack_frame
+from metrics import Metrics
+from fastapi import WebSocketDisconnect
 
 @pytest.fixture
 def test_client():
@@ -40,26 +45,10 @@ async def test_websocket_connection():
 
 @pytest.mark.asyncio
 async def test_stt_factory():
-    # Reset the STTFactory instance before each test
-    STTFactory._instance = None
-
-    with patch.dict(os.environ, {"STT_PROVIDER": "faster_whisper"}):
-        assert isinstance(STTFactory.get_instance("faster_whisper"), FasterWhisperSTT)
-
-    # Reset again before testing the next provider
-    STTFactory._instance = None
-
-    with patch.dict(os.environ, {"STT_PROVIDER": "groq"}):
-        assert isinstance(STTFactory.get_instance("groq"), GroqSTT)
-
-    # Reset again
-    STTFactory._instance = None
-
-    with patch.dict(os.environ, {"STT_PROVIDER": "deepgram"}):
-        assert isinstance(STTFactory.get_instance("deepgram"), DeepGramSTT)
-
-    # Reset one more time to test unsupported provider
-    STTFactory._instance = None
+    # Every call creates a new session of the requested provider
+    assert isinstance(STTFactory.get_instance("faster_whisper"), FasterWhisperSTT)
+    assert isinstance(STTFactory.get_instance("groq"), GroqSTT)
+    assert isinstance(STTFactory.get_instance("deepgram"), DeepGramSTT)
 
     with pytest.raises(ValueError):
         STTFactory.get_instance("unsupported_provider")
@@ -133,4 +122,178 @@ async def test_multiple_transcriptions():
             assert response2 == "Transcription 2"
     
     assert mock_stt.transcribe.call_count == 2
-    mock_stt.close.assert_called_once()
\ No newline at end of file
+    mock_stt.close.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_websocket_segment_results():
+    client = TestClient(app)
+
+    async def transcribe_segments(data):
+        for text in ["first segment", "second segment"]:
+            yield text
+
+    mock_stt = AsyncMock()
+    mock_stt.transcribe_segments = transcribe_segments
+
+    with patch("main.STTFactory.get_instance", return_value=mock_stt):
+        with client.websocket_connect("/api/v1/ws?results=segments") as websocket:
+            websocket.send_bytes(b"\x00" * 3200)
+            assert websocket.receive_json() == {"text": "first segment", "type": "segment", "index": 0, "final": False}
+            assert websocket.receive_json() == {"text": "second segment", "type": "segment", "index": 1, "final": False}
+            assert websocket.receive_json() == {"text": "", "type": "segment", "index": 2, "final": True}
+
+    mock_stt.close.assert_called_once()
+
+def test_invalid_control_messages_are_answered_with_an_error():
+    client = TestClient(app)
+    mock_stt = AsyncMock()
+    mock_stt.transcribe = AsyncMock(return_value="still here")
+
+    with patch("main.STTFactory.get_instance", return_value=mock_stt):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.send_text("hello")
+            assert websocket.receive_json()["type"] == "error"
+            websocket.send_text("[]")
+            assert websocket.receive_json()["type"] == "error"
+            websocket.send_bytes(b"\x00" * 3200)
+            assert websocket.receive_text() == "still here"
+
+    mock_stt.close.assert_called_once()
+
+def test_session_is_closed_when_the_handler_fails():
+    client = TestClient(app)
+    mock_stt = AsyncMock()
+    mock_stt.initialize = AsyncMock(side_effect=RuntimeError("boom"))
+
+    with patch("main.STTFactory.get_instance", return_value=mock_stt):
+        with pytest.raises(RuntimeError):
+            with client.websocket_connect("/api/v1/ws") as websocket:
+                websocket.receive_text()
+
+    mock_stt.close.assert_called_once()
+    assert SessionLimiter._active == 0
+
+@pytest.mark.asyncio
+async def test_stt_factory_creates_session_per_connection():
+    first = STTFactory.get_instance("faster_whisper")
+    second = STTFactory.get_instance("faster_whisper")
+    assert first is not second
+    assert STTFactory.get_instance("faster_whisper", streaming=True).streaming
+
+    with pytest.raises(ValueError):
+        STTFactory.get_instance("groq", streaming=True)
+
+@pytest.mark.asyncio
+async def test_websocket_rejects_sessions_over_limit():
+    client = TestClient(app)
+    mock_stt = AsyncMock()
+
+    with patch("session_limiter.STT_MAX_SESSIONS", 1), \
+            patch("main.STTFactory.get_instance", return_value=mock_stt):
+        with client.websocket_connect("/api/v1/ws"):
+            with client.websocket_connect("/api/v1/ws") as rejected:
+                with pytest.raises(WebSocketDisconnect) as exc_info:
+                    rejected.receive_text()
+                assert exc_info.value.code == 1013
+
+    assert SessionLimiter.active() == 0
+
+def test_ready_after_warm_up():
+    with patch("main.STTFactory.preload", new=AsyncMock()) as mock_preload:
+        with TestClient(app) as client:
+            response = client.get("/ready")
+            for _ in range(50):
+                if response.status_code == 200:
+                    break
+                response = client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    mock_preload.assert_called_once()
+
+def test_not_ready_when_warm_up_fails():
+    with patch("main.STTFactory.preload", new=AsyncMock(side_effect=RuntimeError("model not found"))):
+        with TestClient(app) as client:
+            response = client.get("/ready")
+            for _ in range(50):
+                if response.json()["status"] != "warming_up":
+                    break
+                response = client.get("/ready")
+
+    assert response.status_code == 503
+    assert response.json()["status"] == "failed"
+
+def test_framed_utterances_are_pipelined_and_tagged():
+    client = TestClient(app)
+    started = []
+    second_started = None
+
+    async def transcribe(data):
+        nonlocal second_started
+        started.append(data)
+        if second_started is None:
+            second_started = asyncio.Event()
+        if data == b"\x01\x00" * 4:
+            # The first utterance only finishes once the second one is being transcribed
+            await second_started.wait()
+        else:
+            second_started.set()
+        return f"utterance of {len(data)} bytes"
+
+    mock_stt = AsyncMock()
+    mock_stt.transcribe = transcribe
+
+    with patch("main.STTFactory.get_instance", return_value=mock_stt):
+        with client.websocket_connect("/api/v1/ws?protocol=framed") as websocket:
+            websocket.send_bytes(pack_frame(1, 0, b"\x01\x00" * 2))
+            websocket.send_bytes(pack_frame(1, 1, b"\x01\x00" * 2, end=True))
+            websocket.send_bytes(pack_frame(2, 0, b"\x02\x00" * 3, end=True))
+            first = websocket.receive_json()
+            second = websocket.receive_json()
+
+    assert first == {"text": "utterance of 6 bytes", "type": "final", "utterance_id": 2}
+    assert second == {"text": "utterance of 8 bytes", "type": "final", "utterance_id": 1}
+    mock_stt.close.assert_called_once()
+
+def test_framed_utterance_can_be_cancelled():
+    client = TestClient(app)
+    Metrics.reset()
+
+    async def transcribe(data):
+        if data == b"\x01\x00":
+            # Never answers unless cancelled
+            await asyncio.Event().wait()
+        return "second"
+
+    mock_stt = AsyncMock()
+    mock_stt.transcribe = transcribe
+
+    with patch("main.STTFactory.get_instance", return_value=mock_stt):
+        with client.websocket_connect("/api/v1/ws?protocol=framed") as websocket:
+            websocket.send_bytes(pack_frame(1, 0, b"\x01\x00", end=True))
+            websocket.send_json({"action": "cancel", "utterance_id": 1})
+            websocket.send_bytes(pack_frame(2, 0, b"\x02\x00", end=True))
+            assert websocket.receive_json() == {"text": "second", "type": "final", "utterance_id": 2}
+            websocket.send_bytes(b"\x00")
+            assert websocket.receive_json()["type"] == "error"
+
+    assert Metrics.snapshot()["counters"]["stt_utterances_cancelled"] == 1
+
+@pytest.mark.asyncio
+async def test_websocket_rejects_sessions_while_warming_up():
+    client = TestClient(app)
+    get_instance = MagicMock(return_value=AsyncMock())
+    warm_up = MagicMock()
+    warm_up.done.return_value = False
+
+    with patch.object(app.state, "warm_up", warm_up, create=True), \
+            patch("main.STTFactory.get_instance", get_instance), \
+            patch("main.STTFactory.admit") as admit:
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            with pytest.raises(WebSocketDisconnect) as exc_info:
+                websocket.receive_text()
+            assert exc_info.value.code == 1013
+
+    # No pool was created before the tuned profile is loaded
+    admit.assert_not_called()
+    assert SessionLimiter.active() == 0
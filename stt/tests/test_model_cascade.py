@@ -0,0 +1,68 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+import faster_whisper_stt
+from faster_whisper_stt import FasterWhisperSTT
+from model_cascade import escalation_reason, cascade_enabled
+from metrics import Metrics
+
+
+def transcription(text="yes", avg_logprob=-0.2, no_speech_prob=0.05, compression_ratio=1.1, cpu_s=0.1):
+    segments = [{"start": 0.0, "end": 1.0, "text": text, "avg_logprob": avg_logprob,
+                 "no_speech_prob": no_speech_prob, "compression_ratio": compression_ratio}]
+    return {"segments": segments, "language": "en", "duration": 1.0, "cpu_s": cpu_s}
+
+
+def test_escalation_reason():
+    assert escalation_reason(transcription()) is None
+    assert escalation_reason({"segments": []}) is None
+    assert escalation_reason(transcription(avg_logprob=-1.2)) == "avg_logprob"
+    assert escalation_reason(transcription(no_speech_prob=0.8)) == "no_speech_prob"
+    assert escalation_reason(transcription(compression_ratio=3.0)) == "compression_ratio"
+
+
+def test_cascade_is_disabled_for_the_main_model():
+    assert cascade_enabled(True, "small", "tiny")
+    assert not cascade_enabled(True, "tiny", "tiny")
+    assert not cascade_enabled(False, "small", "tiny")
+
+
+@pytest.mark.asyncio
+async def test_cascade_accepts_confident_fast_decodes():
+    Metrics.reset()
+    fast, main = AsyncMock(), AsyncMock()
+    fast.transcribe = AsyncMock(return_value=transcription("yes"))
+    main.transcribe = AsyncMock(return_value=transcription("yes please"))
+
+    with patch.object(faster_whisper_stt, "STT_CASCADE", True), \
+            patch.object(FasterWhisperSTT, "get_pool", return_value=main), \
+            patch.object(FasterWhisperSTT, "get_cascade_pool", return_value=fast):
+        assert await FasterWhisperSTT().transcribe(b"\x00" * 3200) == "yes "
+
+    main.transcribe.assert_not_called()
+    snapshot = Metrics.snapshot()
+    assert snapshot["counters"]["stt_cascade_utterances{result=accepted}"] == 1
+    assert snapshot["summaries"]["stt_utterance_cpu_ms"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cascade_escalates_unreliable_fast_decodes():
+    Metrics.reset()
+    fast, main = AsyncMock(), AsyncMock()
+    fast.transcribe = AsyncMock(return_value=transcription("yes yes yes", compression_ratio=3.5, cpu_s=0.1))
+    main.transcribe = AsyncMock(return_value=transcription("yes please", cpu_s=0.4))
+
+    with patch.object(faster_whisper_stt, "STT_CASCADE", True), \
+            patch.object(FasterWhisperSTT, "get_pool", return_value=main), \
+            patch.object(FasterWhisperSTT, "get_cascade_pool", return_value=fast):
+        assert await FasterWhisperSTT().transcribe(b"\x00" * 3200) == "yes please "
+
+    snapshot = Metrics.snapshot()
+    assert snapshot["counters"]["stt_cascade_utterances{result=escalated}"] == 1
+    assert snapshot["counters"]["stt_cascade_escalations{reason=compression_ratio}"] == 1
+    assert snapshot["summaries"]["stt_utterance_cpu_ms"]["max"] == pytest.approx(500)
@@ -0,0 +1,114 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+import asyncio
+import itertools
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+import model_registry
+from model_registry import ModelRegistry, select_model
+from faster_whisper_stt import FasterWhisperSTT
+from metrics import Metrics
+from main import app
+
+PIDS = itertools.count(1000)
+
+
+class FakePool:
+    """Loads instantly, its worker takes 100MB."""
+
+    def __init__(self, num_workers=1, model_size="tiny", compute_type="float32"):
+        self.model_size = model_size
+        self.ready_workers = {}
+        self.pending = 0
+        self.shut_down = False
+
+    async def start(self):
+        await asyncio.sleep(0.01)
+        self.ready_workers = {next(PIDS): {"load_s": 0.5, "warmup_s": 0.1}}
+        return list(self.ready_workers.values())
+
+    async def transcribe(self, data, **options):
+        return {"segments": [{"start": 0.0, "end": 1.0, "text": f"{self.model_size} {options['language']}",
+                              "avg_logprob": -0.2, "no_speech_prob": 0.01, "compression_ratio": 1.0}]}
+
+    def shutdown(self):
+        self.shut_down = True
+
+
+@pytest.fixture
+def fake_pools():
+    Metrics.reset()
+    with patch.object(model_registry, "WhisperWorkerPool", FakePool), \
+            patch.object(model_registry, "process_rss_mb", return_value=100.0), \
+            patch.object(model_registry, "STT_ALLOWED_MODELS", ["base", "small"]), \
+            patch.object(model_registry, "STT_ALLOWED_COMPUTE_TYPES", ["int8"]):
+        yield
+
+
+def test_select_model(fake_pools):
+    assert select_model() is None
+    assert select_model(language="de") is None
+    assert select_model("base") == ("base", "float32")
+    assert select_model(compute_type="int8") == ("tiny", "int8")
+    for selection in ({"model": "large-v3"}, {"compute_type": "float16"}, {"language": "xx"}):
+        with pytest.raises(ValueError):
+            select_model(**selection)
+
+
+@pytest.mark.asyncio
+async def test_sessions_share_a_model_loaded_once(fake_pools):
+    registry = ModelRegistry(budget_mb=0)
+    first, second = await asyncio.gather(registry.acquire("base", "float32"), registry.acquire("base", "float32"))
+
+    assert first is second
+    counters = Metrics.snapshot()["counters"]
+    assert counters["stt_model_loads{compute_type=float32,model=base}"] == 1
+    assert counters["stt_model_hits{compute_type=float32,model=base}"] == 1
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_idle_models_are_evicted(fake_pools):
+    registry = ModelRegistry(budget_mb=250)
+    base = await registry.acquire("base", "float32")
+    registry.release("base", "float32")
+    small = await registry.acquire("small", "float32")
+    registry.release("small", "float32")
+    assert await registry.acquire("base", "float32") is base
+    await registry.acquire("tiny", "int8")
+
+    # small was the only idle model once tiny loaded
+    assert ("small", "float32") not in registry
+    assert small.shut_down and not base.shut_down
+    counters = Metrics.snapshot()["counters"]
+    assert counters["stt_model_evictions{compute_type=float32,model=small}"] == 1
+    assert Metrics.snapshot()["gauges"]["stt_loaded_models"] == 2
+
+    # Models with sessions stay loaded over the budget
+    await registry.acquire("small", "float32")
+    assert Metrics.snapshot()["gauges"]["stt_model_memory_mb"] == 300
+
+
+@pytest.mark.asyncio
+async def test_session_decodes_with_its_selected_model(fake_pools):
+    registry = ModelRegistry(budget_mb=0)
+    with patch.object(FasterWhisperSTT, "get_registry", return_value=registry):
+        stt = FasterWhisperSTT(model="small", language="de")
+        await stt.initialize()
+        assert await stt.transcribe(b"\x00" * 3200) == "small de "
+        await stt.close()
+
+    assert registry._entries[("small", "float32")]["sessions"] == 0
+
+
+def test_websocket_rejects_unsupported_models():
+    client = TestClient(app)
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect("/api/v1/ws?model=unknown") as websocket:
+            websocket.receive_text()
+    assert exc_info.value.code == 1003
@@ -0,0 +1,38 @@
+import pytest
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from utterance_framing import UtteranceAssembler, pack_frame, parse_frame
+
+
+def test_parse_frame_round_trip():
+    utterance_id, seq, end, payload = parse_frame(pack_frame(7, 3, b"\x01\x02", end=True))
+    assert (utterance_id, seq, end, bytes(payload)) == (7, 3, True, b"\x01\x02")
+
+    with pytest.raises(ValueError):
+        parse_frame(b"\x00" * 4)
+
+
+def test_assembler_interleaved_and_out_of_order_frames():
+    assembler = UtteranceAssembler()
+    assert assembler.add(1, 0, False, b"a") is None
+    assert assembler.add(2, 1, True, b"d") is None
+    assert assembler.add(1, 1, True, b"b") == b"ab"
+    assert assembler.pending == 1
+    assert assembler.add(2, 0, False, b"c") == b"cd"
+    assert assembler.pending == 0
+
+
+def test_assembler_rejects_bad_utterances():
+    assembler = UtteranceAssembler(max_pending=1)
+    assembler.add(1, 0, False, b"a")
+    with pytest.raises(ValueError):
+        assembler.add(2, 0, False, b"b")
+
+    assembler.add(1, 5, False, b"x")
+    with pytest.raises(ValueError):
+        assembler.add(1, 1, True, b"b")
+    assert assembler.pending == 0
@@ -0,0 +1,37 @@
+import pytest
+import os
+import sys
+import numpy as np
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from vad_trim import trim_silence, trim_utterance
+from whisper_autotune import read_clip, REFERENCE_CLIP
+from metrics import Metrics
+
+SILENCE = np.zeros(16000, dtype=np.int16).tobytes()  # 1 second
+
+
+def test_trim_silence_drops_speech_free_audio():
+    noise = (np.random.default_rng(0).normal(0, 30, 32000)).astype(np.int16).tobytes()
+    assert trim_silence(SILENCE * 2) == b""
+    assert trim_silence(noise) == b""
+
+
+def test_trim_silence_removes_leading_and_trailing_silence():
+    speech = read_clip(REFERENCE_CLIP)
+    trimmed = trim_silence(SILENCE * 2 + speech + SILENCE * 2)
+
+    assert 0 < len(trimmed) < len(speech) + len(SILENCE)
+    assert len(trimmed) % 2 == 0
+
+
+@pytest.mark.asyncio
+async def test_trim_utterance_reports_removed_audio():
+    Metrics.reset()
+    assert await trim_utterance(SILENCE * 3) == b""
+
+    counters = Metrics.snapshot()["counters"]
+    assert counters["stt_vad_removed_seconds"] == 3.0
+    assert counters["stt_vad_dropped_utterances"] == 1
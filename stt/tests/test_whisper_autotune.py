@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from whisper_autotune import (
+    word_error_rate,
+    select_profile,
+    candidate_profiles,
+    load_profile,
+    read_clip,
+    REFERENCE_CLIP,
+    WHISPER_MODEL,
+)
+
+
+def test_word_error_rate_ignores_case_and_punctuation():
+    assert word_error_rate("Hello, world.", "hello world") == 0.0
+    assert word_error_rate("one two three four", "one too three") == 0.5
+
+
+def test_select_profile_prefers_throughput_within_budget():
+    results = [
+        {"compute_type": "float32", "wer": 0.0, "latency_rtf": 0.4, "throughput_rtf": 0.4},
+        {"compute_type": "int8", "wer": 0.05, "latency_rtf": 0.2, "throughput_rtf": 0.1},
+        {"compute_type": "int8_float32", "wer": 0.3, "latency_rtf": 0.1, "throughput_rtf": 0.05},
+    ]
+    assert select_profile(results, max_wer=0.1, max_rtf=0.5)["compute_type"] == "int8"
+    assert select_profile(results, max_wer=0.01, max_rtf=0.1)["compute_type"] == "float32"
+
+
+def test_candidate_profiles_split_cores():
+    profiles = candidate_profiles(4)
+    assert {(p["num_workers"], p["cpu_threads"]) for p in profiles} == {(1, 4), (2, 2), (4, 1)}
+    assert "int8" in {p["compute_type"] for p in profiles}
+
+
+def test_load_profile_rejects_other_model(tmp_path):
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps({"model": WHISPER_MODEL, "cpu_count": os.cpu_count(), "compute_type": "int8",
+                                "num_workers": 1, "cpu_threads": 1}))
+    assert load_profile(str(path))["compute_type"] == "int8"
+
+    path.write_text(json.dumps({"model": "not-" + WHISPER_MODEL, "cpu_count": os.cpu_count()}))
+    assert load_profile(str(path)) is None
+    assert load_profile(str(tmp_path / "missing.json")) is None
+
+
+def test_reference_clip_is_bundled():
+    assert len(read_clip(REFERENCE_CLIP)) > 16000 * 2
@@ -0,0 +1,121 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+import whisper_streaming
+from whisper_streaming import LocalAgreement, WhisperStream
+from metrics import Metrics
+from main import app
+
+SCRIPT = [(0.0, 0.4, " hello"), (0.5, 0.9, " there"), (1.0, 1.4, " general"), (1.5, 1.9, " kenobi")]
+
+
+class FakePool:
+    """Returns the words of SCRIPT that end within the decoded audio."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def transcribe_block(self, block, **options):
+        self.calls.append(options)
+        duration = block[2] / 16000
+        words = [{"start": s, "end": e, "word": w} for s, e, w in SCRIPT if e <= duration]
+        segment = {"text": "".join(w["word"] for w in words), "words": words,
+                   "avg_logprob": -0.2, "no_speech_prob": 0.05, "compression_ratio": 1.2}
+        return {"segments": [segment]}
+
+
+def test_local_agreement_commits_common_prefix():
+    agreement = LocalAgreement()
+    assert agreement.insert(SCRIPT[:2]) == []
+    assert agreement.insert(SCRIPT[:3]) == SCRIPT[:2]
+    assert agreement.unstable == SCRIPT[2:3]
+    assert agreement.insert(SCRIPT) == SCRIPT[2:3]
+    assert agreement.last_committed_time == 1.4
+
+
+def test_local_agreement_drops_repeated_boundary_words():
+    agreement = LocalAgreement()
+    agreement.insert(SCRIPT[:2])
+    agreement.insert(SCRIPT[:2])
+    # The next window starts with the last committed word again
+    assert agreement.insert([(0.95, 1.0, " there"), SCRIPT[2]]) == []
+    assert agreement.unstable == [SCRIPT[2]]
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_interim_then_final():
+    messages = []
+
+    async def text_handler(text, **fields):
+        messages.append((text, fields))
+
+    pool = FakePool()
+    stream = WhisperStream(pool, text_handler, "en")
+    with patch.object(whisper_streaming, "STT_STREAMING_STEP_MS", 500):
+        for _ in range(4):
+            stream.feed(b"\x00" * 16000)  # 0.5 s
+            await stream._task
+        stream.feed(b"\x00" * 3200)
+        final = await stream.finish()
+
+    assert final == "hello there general kenobi"
+    assert messages[-1] == ("hello there general kenobi", {"type": "final"})
+    interims = [fields for _, fields in messages if fields["type"] == "interim"]
+    assert interims and interims[-1]["stable"].startswith("hello there")
+    assert all(call["word_timestamps"] for call in pool.calls)
+    assert len(stream.ring) == 0
+    stream.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_final_decode_resets_the_stream():
+    pool = FakePool()
+    stream = WhisperStream(pool, AsyncMock(), "en")
+    stream.feed(b"\x00" * 3200)
+    stream.agreement.unstable = SCRIPT[:1]
+    pool.transcribe_block = AsyncMock(side_effect=RuntimeError("worker died"))
+
+    with pytest.raises(RuntimeError):
+        await stream.finish()
+
+    assert len(stream.ring) == 0 and stream.agreement.unstable == [] and stream._task is None
+    stream.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_streamed_utterance_is_counted():
+    Metrics.reset()
+    pool = FakePool()
+    pool.transcribe_block = AsyncMock(return_value={"segments": [{
+        "text": " Thanks for watching!", "words": [{"start": 0.0, "end": 0.5, "word": " Thanks"}],
+        "avg_logprob": -0.2, "no_speech_prob": 0.05, "compression_ratio": 1.2}]})
+    stream = WhisperStream(pool, AsyncMock(), "en")
+    stream.feed(b"\x00" * 3200)
+
+    assert await stream.finish() == ""
+    assert Metrics.snapshot()["counters"]["stt_rejected_utterances"] == 1
+    stream.close()
+
+
+def test_websocket_streaming_mode_end_action():
+    client = TestClient(app)
+    mock_stt = AsyncMock()
+    mock_stt.transcribe = AsyncMock(return_value="")
+    mock_stt.end_utterance = AsyncMock(return_value="hello")
+
+    with patch("main.STTFactory.get_instance", return_value=mock_stt) as mock_get_instance:
+        with client.websocket_connect("/api/v1/ws?mode=streaming") as websocket:
+            websocket.send_bytes(b"\x00" * 960)
+            websocket.send_json({"action": "end"})
+            assert websocket.receive_text() == "hello"
+
+    assert mock_get_instance.call_args.kwargs["streaming"] is True
+    mock_stt.transcribe.assert_called_once()
+    mock_stt.end_utterance.assert_called_once()
+    mock_stt.close.assert_called_once()
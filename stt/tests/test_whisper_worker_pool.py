@@ -0,0 +1,190 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+import asyncio
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Add the path to the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+import whisper_worker_pool
+from whisper_worker_pool import _write_shared_audio, _read_shared_audio, _transcribe_shared, _transcribe_block, _init_worker
+from whisper_worker_pool import WhisperWorkerPool
+from metrics import Metrics
+from audio_ring import AudioRingBuffer
+from faster_whisper_stt import FasterWhisperSTT
+
+
+def make_segment(text, start=0.0, end=1.0):
+    return SimpleNamespace(start=start, end=end, text=text, avg_logprob=-0.2,
+                           compression_ratio=1.2, no_speech_prob=0.01, words=None)
+
+
+class FakeWhisperModel:
+    def __init__(self):
+        self.audio = None
+
+    def transcribe(self, audio, **options):
+        self.audio = audio
+        info = SimpleNamespace(language=options.get("language"), duration=len(audio) / 16000)
+        return iter([make_segment("hello"), make_segment("world", 1.0, 2.0)]), info
+
+
+def test_shared_audio_round_trip():
+    pcm = (np.arange(-8000, 8000, dtype=np.int16) * 2)
+    shm = _write_shared_audio(pcm.tobytes())
+    try:
+        audio = _read_shared_audio(shm.name, len(pcm))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    assert audio.dtype == np.float32
+    np.testing.assert_allclose(audio, pcm.astype(np.float32) / 32768.0)
+
+
+def test_transcribe_shared_uses_worker_model():
+    pcm = np.zeros(16000, dtype=np.int16).tobytes()
+    model = FakeWhisperModel()
+    shm = _write_shared_audio(pcm)
+    try:
+        with patch.object(whisper_worker_pool, "_worker_model", model):
+            result = _transcribe_shared(shm.name, len(pcm) // 2, {"language": "en"})
+    finally:
+        shm.close()
+        shm.unlink()
+
+    assert len(model.audio) == 16000
+    assert result["language"] == "en"
+    assert result["cpu_s"] >= 0
+    assert [segment["text"] for segment in result["segments"]] == ["hello", "world"]
+
+
+def test_transcribe_block_reads_the_ring_in_place():
+    pcm = (np.arange(24000) % 1000).astype(np.int16)
+    model = FakeWhisperModel()
+    transcribe = model.transcribe
+    # The audio is a view of the ring, keep a copy to check it after the ring is closed
+    model.transcribe = lambda audio, **options: transcribe(audio.copy(), **options)
+    ring = AudioRingBuffer(1.0)
+    try:
+        ring.write(pcm.tobytes())
+        ring.consume(4000)
+        with patch.object(whisper_worker_pool, "_worker_model", model):
+            result = _transcribe_block(*ring.block(), {"language": "en"})
+    finally:
+        ring.close()
+
+    np.testing.assert_allclose(model.audio, pcm[12000:] / 32768.0)
+    assert result["duration"] == 0.75
+
+def test_init_worker_warms_up_and_reports_ready():
+    model = FakeWhisperModel()
+    queue = []
+
+    with patch.object(whisper_worker_pool, "WhisperModel", return_value=model), \
+            patch.object(whisper_worker_pool, "_worker_model", None), \
+            patch.object(whisper_worker_pool, "_segment_queue", None):
+        _init_worker("tiny", "int8", 1, SimpleNamespace(put=queue.append), 1.5)
+
+    assert len(model.audio) == 24000
+    job_id, kind, payload = queue[0]
+    assert (job_id, kind, payload["pid"]) == (None, "ready", os.getpid())
+    assert payload["warmup_s"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_faster_whisper_transcribe_uses_pool():
+    pool = AsyncMock()
+    pool.transcribe = AsyncMock(return_value={
+        "segments": [
+            {"start": 0.0, "end": 1.0, "text": "hello", "avg_logprob": -0.2, "no_speech_prob": 0.01, "compression_ratio": 1.0},
+            {"start": 1.0, "end": 2.0, "text": "world", "avg_logprob": -0.2, "no_speech_prob": 0.01, "compression_ratio": 1.0},
+        ],
+        "language": "en",
+        "duration": 2.0,
+    })
+    data = np.zeros(32000, dtype=np.int16).tobytes()
+
+    with patch.object(FasterWhisperSTT, "get_pool", return_value=pool):
+        stt = FasterWhisperSTT()
+        result = await stt.transcribe(data)
+
+    assert result == "hello world "
+    assert pool.transcribe.call_args[0][0] == data
+
+
+def _stub_worker(model_size, compute_type, cpu_threads, segment_queue, warmup_s):
+    # Runs in the spawned worker, which gets a fake model instead of loading one
+    whisper_worker_pool._worker_model = FakeWhisperModel()
+    whisper_worker_pool._segment_queue = segment_queue
+    segment_queue.put((None, "ready", {"pid": os.getpid(), "load_s": 0.0, "warmup_s": 0.0}))
+
+
+def _crash():
+    os._exit(1)
+
+
+class StubWorkerPool(WhisperWorkerPool):
+    worker_initializer = staticmethod(_stub_worker)
+
+
+@pytest.mark.asyncio
+async def test_worker_processes_are_replaced_after_a_crash():
+    Metrics.reset()
+    pool = StubWorkerPool(num_workers=1, warmup_s=0)
+    data = np.zeros(16000, dtype=np.int16).tobytes()
+    try:
+        assert len(await asyncio.wait_for(pool.start(), 60)) == 1
+        result = await pool.transcribe(data, language="en")
+        assert [segment["text"] for segment in result["segments"]] == ["hello", "world"]
+
+        with pytest.raises(BrokenProcessPool):
+            await pool._run(_crash)
+        result = await asyncio.wait_for(pool.transcribe(data, language="en"), 60)
+        assert result["duration"] == 1.0
+        assert Metrics.snapshot()["counters"]["stt_worker_pool_restarts"] == 1
+
+        # A consumer that stops early releases the job and its audio right away,
+        # the decode stays pending until the worker is done with it
+        segments = pool.transcribe_segments(data, language="en")
+        assert (await segments.__anext__())["text"] == "hello"
+        await segments.aclose()
+        assert pool._jobs == {}
+        for _ in range(100):
+            if pool.pending == 0:
+                break
+            await asyncio.sleep(0.05)
+        assert pool.pending == 0
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_abandoned_decodes_stay_pending_until_the_worker_finishes():
+    pool = WhisperWorkerPool.__new__(WhisperWorkerPool)
+    pool.pending, pool.latency_ms = 0, 0.0
+    pool._executor = ThreadPoolExecutor(1)
+    release = threading.Event()
+
+    try:
+        # Like the losing request of a hedged pair
+        task = asyncio.create_task(pool._run(release.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert pool.pending == 1
+
+        release.set()
+        await asyncio.get_running_loop().run_in_executor(None, pool._executor.shutdown)
+        await asyncio.sleep(0)
+        assert pool.pending == 0
+    finally:
+        release.set()
+        pool._executor.shutdown()
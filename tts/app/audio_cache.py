@@ -0,0 +1,317 @@
+import os
+import json
+import logging
+import hashlib
+from collections import OrderedDict
+from metrics import Metrics
+from pack_store import PackStore
+
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "cache")
+# Synthesized audio kept on disk, the least recently used entries are deleted beyond it
+TTS_CACHE_MAX_MB = float(os.environ.get("TTS_CACHE_MAX_MB", "512"))
+# Audio kept in memory in front of the disk, pinned phrases included
+TTS_CACHE_MEMORY_MB = float(os.environ.get("TTS_CACHE_MEMORY_MB", "32"))
+# Storage of the entries on disk, "files" (one file per entry) or "pack" (segment files)
+TTS_CACHE_BACKEND = os.environ.get("TTS_CACHE_BACKEND", "files")
+
+# Bumped when the layout of cached audio changes, older entries are then never hit
+CACHE_VERSION = 1
+SUFFIX = ".pcm"
+TEMP_SUFFIX = ".tmp"
+# Entries larger than this share of the memory tier are only served from disk
+MEMORY_ENTRY_FRACTION = 0.25
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def cache_key(provider: str, voice: str, model: str, sample_rate, text: str, **settings) -> str:
+    """Key of synthesized audio, covering everything that changes the audio besides the text."""
+    parts = {
+        "version": CACHE_VERSION,
+        "provider": provider,
+        "voice": voice,
+        "model": model,
+        "sample_rate": str(sample_rate),
+        "settings": settings,
+        "text": text,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FileWriter:
+    """Writes one entry to a temporary file that is renamed into place on commit()."""
+
+    def __init__(self, store, key: str):
+        self.store = store
+        self.key = key
+        self.temp_path = os.path.join(store.directory, f"{key}.{os.getpid()}.{os.urandom(4).hex()}{TEMP_SUFFIX}")
+        self._file = open(self.temp_path, "wb")
+
+    def write(self, data):
+        self._file.write(data)
+
+    def commit(self):
+        # A concurrent writer of the same key is replaced atomically
+        self._file.close()
+        os.replace(self.temp_path, self.store.path(self.key))
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class FileStore:
+    """Cache storage with one file per entry, recency is kept in the file mtimes."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{SUFFIX}")
+
+    def scan(self) -> list:
+        """Return (last use, key, size) of every entry."""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(TEMP_SUFFIX):
+                    # Left behind by a process that stopped mid-synthesis
+                    os.remove(item.path)
+                elif item.name.endswith(SUFFIX) and item.is_file():
+                    stat = item.stat()
+                    entries.append((stat.st_mtime, item.name[:-len(SUFFIX)], stat.st_size))
+        return entries
+
+    def writer(self, key: str) -> FileWriter:
+        return FileWriter(self, key)
+
+    def touch(self, key: str) -> bool:
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            return False
+        return True
+
+    def read(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def chunks(self, key: str, chunk_size: int):
+        with open(self.path(key), "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def remove(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def close(self):
+        pass
+
+
+STORES = {"files": FileStore, "pack": PackStore}
+
+
+class CacheEntryWriter:
+    """Writes one cache entry through the store, it only becomes visible on commit().
+
+    Used as a context manager, an entry that was not committed when the
+    block exits (error, cancellation, truncated stream) is dropped.
+    """
+
+    def __init__(self, cache, key: str):
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        self._writer = cache.store.writer(key)
+        # Kept for the memory tier as long as the entry is small enough for it
+        self._chunks = []
+
+    def write(self, data):
+        self._writer.write(data)
+        self.size += len(data)
+        if self._chunks is not None:
+            self._chunks.append(bytes(data))
+            if self.size > self.cache.max_memory_entry:
+                self._chunks = None
+
+    def commit(self):
+        """Publish the entry, it replaces an earlier one of the same key."""
+        self._writer.commit()
+        self.cache._add(self.key, self.size, b"".join(self._chunks) if self._chunks is not None else None)
+        self._writer = None
+
+    def discard(self):
+        if self._writer is None:
+            return
+        self._writer.discard()
+        self._writer = None
+        Metrics.increment("tts_cache_aborted_writes")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.discard()
+
+
+class AudioCache:
+    """Size-bounded disk cache of synthesized audio shared by all TTS providers.
+
+    Entries only become visible once the provider finished the synthesis,
+    so readers never see truncated audio. How they are kept on disk is up
+    to the store selected with TTS_CACHE_BACKEND, which also keeps their
+    recency for startup. Recently used entries are also held in memory and
+    served as memoryview slices of one bytes object, without any disk
+    access or copy. Pinned entries stay in memory regardless of their use.
+    """
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = int(TTS_CACHE_MAX_MB * 2 ** 20),
+                 memory_bytes: int = int(TTS_CACHE_MEMORY_MB * 2 ** 20), backend: str = TTS_CACHE_BACKEND):
+        if backend not in STORES:
+            raise ValueError(f"Unknown TTS cache backend '{backend}', expected one of {', '.join(STORES)}.")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.max_memory_entry = int(memory_bytes * MEMORY_ENTRY_FRACTION)
+        # key -> size, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        # key -> audio, least recently used first
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._pinned = set()
+        self.store = STORES[backend](directory)
+        self._load()
+
+    def _load(self):
+        for _, key, size in sorted(self.store.scan()):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+        self._report()
+        logger.info(f"Audio cache holds {len(self._entries)} entries, {self._size / 2 ** 20:.1f}MB.")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._memory or key in self._entries
+
+    def get(self, key: str, chunk_size: int = 4096):
+        """Return the cached audio of key as an iterator of chunks, None on a miss."""
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            if key in self._entries:
+                # The stored recency is left alone, a hot entry only needs to survive restarts
+                self._entries.move_to_end(key)
+            Metrics.increment("tts_cache_hits", tier="memory")
+            return self._slices(audio, chunk_size)
+        if not self.lookup(key):
+            return None
+        if self._entries[key] > self.max_memory_entry:
+            return self.read(key, chunk_size)
+        audio = bytes(self.store.read(key))
+        self._remember(key, audio)
+        return self._slices(audio, chunk_size)
+
+    @staticmethod
+    def _slices(audio: bytes, chunk_size: int):
+        # Slices share the buffer, an entry evicted meanwhile stays alive until they are sent
+        view = memoryview(audio)
+        Metrics.increment("tts_cache_hit_bytes", len(view))
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    def lookup(self, key: str) -> bool:
+        """Mark an entry on disk as recently used, False on a miss."""
+        if key not in self._entries:
+            Metrics.increment("tts_cache_misses")
+            return False
+        if not self.store.touch(key):
+            # Deleted behind our back
+            self._remove(key)
+            Metrics.increment("tts_cache_misses")
+            return False
+        self._entries.move_to_end(key)
+        Metrics.increment("tts_cache_hits", tier="disk")
+        return True
+
+    def pin(self, key: str) -> bool:
+        """Keep an entry in memory for good, False if it is not cached or too large."""
+        if key not in self._memory:
+            if key not in self._entries or self._entries[key] > self.max_memory_entry:
+                return False
+            self._remember(key, bytes(self.store.read(key)))
+        self._pinned.add(key)
+        Metrics.set_gauge("tts_cache_pinned_entries", len(self._pinned))
+        return key in self._memory
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_memory_entry:
+            return
+        self._memory_size += len(audio) - len(self._memory.pop(key, b""))
+        self._memory[key] = audio
+        for candidate in list(self._memory):
+            if self._memory_size <= self.memory_bytes:
+                break
+            if candidate in self._pinned or candidate == key:
+                continue
+            self._memory_size -= len(self._memory.pop(candidate))
+            Metrics.increment("tts_cache_memory_evictions")
+        if self._memory_size > self.memory_bytes:
+            logger.warning(f"Pinned audio takes {self._memory_size / 2 ** 20:.1f}MB, over the memory tier.")
+        Metrics.set_gauge("tts_cache_memory_bytes", self._memory_size)
+
+    def read(self, key: str, chunk_size: int = 4096):
+        """Yield the audio of an entry on disk in chunks."""
+        for chunk in self.store.chunks(key, chunk_size):
+            Metrics.increment("tts_cache_hit_bytes", len(chunk))
+            yield chunk
+
+    def writer(self, key: str) -> CacheEntryWriter:
+        return CacheEntryWriter(self, key)
+
+    def _add(self, key: str, size: int, audio: bytes = None):
+        self._size += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        Metrics.increment("tts_cache_written_bytes", size)
+        if audio is not None:
+            self._remember(key, audio)
+        self._evict()
+        self._report()
+
+    def _remove(self, key: str):
+        self._size -= self._entries.pop(key)
+        self.store.remove(key)
+        # Pinned audio stays in memory for good, other entries are gone once they left the disk
+        if key in self._memory and key not in self._pinned:
+            self._memory_size -= len(self._memory.pop(key))
+            Metrics.set_gauge("tts_cache_memory_bytes", self._memory_size)
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            Metrics.increment("tts_cache_evictions")
+            Metrics.increment("tts_cache_evicted_bytes", self._entries[key])
+            self._remove(key)
+
+    def _report(self):
+        Metrics.set_gauge("tts_cache_bytes", self._size)
+        Metrics.set_gauge("tts_cache_entries", len(self._entries))
+
+    def close(self):
+        self.store.close()
@@ -1,11 +1,11 @@
 import os
 import logging
-import hashlib
 import json
 import base64
 import asyncio
 import websockets
 from tts_interface import TTSInterface
+from audio_cache import AudioCache, cache_key
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,12 +18,6 @@ SAMPLE_RATE = os.getenv("TTS_SAMPLE_RATE", "24000")
 
 cartesia_endpoint = f"wss://api.cartesia.ai/tts/websocket?api_key={CARTESIA_API_KEY}&cartesia_version={CARTESIA_VERSION}"
 
-CACHE_DIR = "cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-def get_cache_key(content):
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
-
 class CartesiaTTS(TTSInterface):
     def __init__(self):
         self._is_open = False
@@ -34,15 +28,19 @@ class CartesiaTTS(TTSInterface):
         self._is_open = True
         logger.info("CartesiaTTS initialized.")
 
+    def get_cache_key(self, content):
+        return cache_key("cartesia", CARTESIA_VOICE_ID, CARTESIA_MODEL_ID, SAMPLE_RATE, content,
+                         version=CARTESIA_VERSION, language="en")
+
     async def synthesize(self, content):
-        cache_key = get_cache_key(content)
-        cache_path = os.path.join(CACHE_DIR, f"{cache_key}.pcm")
+        cache = AudioCache.get_instance()
+        key = self.get_cache_key(content)
+        chunks = cache.get(key)
 
-        if os.path.exists(cache_path):
+        if chunks is not None:
             logger.info("Cache hit, sending cached audio")
-            with open(cache_path, "rb") as f:
-                while chunk := f.read(4096):
-                    yield chunk
+            for chunk in chunks:
+                yield chunk
             return
 
         self.cartesia_ws = await websockets.connect(cartesia_endpoint)
@@ -70,7 +68,7 @@ class CartesiaTTS(TTSInterface):
             await self.cartesia_ws.send(json.dumps(input_message))
             logger.info(f"Sent initial message to Cartesia: {input_message}")
 
-            with open(cache_path, "wb") as f:
+            with cache.writer(key) as entry:
                 async for message in self.cartesia_ws:
                     msg = json.loads(message)
                     if msg["context_id"] != self.context_id:
@@ -78,11 +76,13 @@ class CartesiaTTS(TTSInterface):
                         continue
                     if msg["type"] == "done":
                         logger.info("Synthesis completed")
+                        # Only complete audio is cached, a cut off stream is discarded
+                        entry.commit()
                         break
                     elif msg["type"] == "chunk":
                         audio_data = base64.b64decode(msg["data"])
                         logger.info(f"Received audio chunk from Cartesia of size: {len(audio_data)} bytes")
-                        f.write(audio_data)
+                        entry.write(audio_data)
                         yield audio_data
                     elif msg["type"] == "timestamps":
                         logger.debug(f"Received timestamps: {msg['word_timestamps']}")
@@ -1,7 +1,7 @@
 import os
 import logging
-import hashlib
 from tts_interface import TTSInterface
+from audio_cache import AudioCache, cache_key
 import requests
 from requests.exceptions import RequestException
 import asyncio
@@ -18,12 +18,6 @@ sample_rate = SAMPLE_RATE
 
 DEEPGRAM_URL = f"https://api.deepgram.com/v1/speak?model={DG_TTS_MODEL_VOICE}&encoding={encoding}&sample_rate={sample_rate}&container=none"
 
-CACHE_DIR = "cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-
-def get_cache_key(content):
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
 
 class DeepgramTTS(TTSInterface):
     def __init__(self):
@@ -33,15 +27,18 @@ class DeepgramTTS(TTSInterface):
         self._is_open = True
         logger.info("DeepgramTTS initialized.")
 
+    def get_cache_key(self, content):
+        return cache_key("deepgram", DG_TTS_MODEL_VOICE, DG_TTS_MODEL_VOICE, sample_rate, content, encoding=encoding)
+
     async def synthesize(self, content):
-        cache_key = get_cache_key(content)
-        cache_path = os.path.join(CACHE_DIR, f"{cache_key}.pcm")
+        cache = AudioCache.get_instance()
+        key = self.get_cache_key(content)
+        chunks = cache.get(key)
 
-        if os.path.exists(cache_path):
+        if chunks is not None:
             logger.info("Cache hit, sending cached audio")
-            with open(cache_path, "rb") as f:
-                while chunk := f.read(4096):
-                    yield chunk
+            for chunk in chunks:
+                yield chunk
             return
 
         headers = {
@@ -62,12 +59,14 @@ class DeepgramTTS(TTSInterface):
             response.raise_for_status()
             logger.info("Sent initial message to Deepgram")
 
-            with open(cache_path, "wb") as f:
+            with cache.writer(key) as entry:
                 async for chunk in self._iter_content(response):
                     if chunk:
                         logger.info(f"Received audio chunk from Deepgram of size: {len(chunk)}")
-                        await loop.run_in_executor(None, f.write, chunk)
+                        await loop.run_in_executor(None, entry.write, chunk)
                         yield chunk
+                # The response body ended, the audio is complete
+                entry.commit()
             logger.info("No more audio data.")
 
         except RequestException as e:
@@ -4,8 +4,8 @@ import base64
 import os
 import logging
 import asyncio
-import hashlib
 from tts_interface import TTSInterface
+from audio_cache import AudioCache, cache_key
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,12 +19,6 @@ TTS_SAMPLE_RATE = os.getenv('TTS_SAMPLE_RATE', '24000')
 
 elevenlabs_endpoint = f"wss://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}/stream-input?output_format=pcm_{TTS_SAMPLE_RATE}"
 
-CACHE_DIR = "cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-def get_cache_key(content):
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
-
 class ElevenLabsTTS(TTSInterface):
     def __init__(self):
         self._is_open = False
@@ -34,15 +28,19 @@ class ElevenLabsTTS(TTSInterface):
         self._is_open = True
         logger.info("ElevenLabsTTS initialized.")
 
+    def get_cache_key(self, content):
+        return cache_key("elevenlabs", ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, TTS_SAMPLE_RATE, content,
+                         stability=ELEVENLABS_VOICE_STABILITY, similarity=ELEVENLABS_VOICE_SIMILARITY)
+
     async def synthesize(self, content):
-        cache_key = get_cache_key(content)
-        cache_path = os.path.join(CACHE_DIR, f"{cache_key}.pcm")
+        cache = AudioCache.get_instance()
+        key = self.get_cache_key(content)
+        chunks = cache.get(key)
 
-        if os.path.exists(cache_path):
+        if chunks is not None:
             logger.info("Cache hit, sending cached audio")
-            with open(cache_path, "rb") as f:
-                while chunk := f.read(4096):
-                    yield chunk
+            for chunk in chunks:
+                yield chunk
             return
 
         self.elevenlabs_ws = await websockets.connect(elevenlabs_endpoint)
@@ -66,7 +64,7 @@ class ElevenLabsTTS(TTSInterface):
             await self.elevenlabs_ws.send(json.dumps(eos_message))
             logger.info("Sent EOS message to 11labs")
 
-            with open(cache_path, "wb") as f:
+            with cache.writer(key) as entry:
                 while True:
                     try:
                         response = await self.elevenlabs_ws.recv()
@@ -74,13 +72,15 @@ class ElevenLabsTTS(TTSInterface):
                         if "audio" in data and data["audio"] is not None:
                             audio_data = base64.b64decode(data["audio"])
                             logger.info(f"Received audio chunk from 11labs of size: {len(audio_data)}")
-                            f.write(audio_data)
+                            entry.write(audio_data)
                             yield audio_data
                         elif "error" in data:
                             logger.error(f"Error from 11labs: {data['error']}")
                             raise Exception(f"ElevenLabs API error: {data['error']}")
                         else:
                             logger.info("No more audio data.")
+                            # Only complete audio is cached, a cut off stream is discarded
+                            entry.commit()
                             break
                     except json.JSONDecodeError:
                         logger.warning("Failed to parse EOS response as JSON")
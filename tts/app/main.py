@@ -1,11 +1,15 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 import os
 import logging
+import time
 import asyncio
 from elevenlabs_tts import ElevenLabsTTS
 from deepgram_tts import DeepgramTTS
 from openai_tts import OpenAITTS
 from cartesia_tts import CartesiaTTS
+from metrics import Metrics
+from audio_cache import AudioCache
+from phrase_manifest import load_manifest, presynthesize, TTS_PHRASE_MANIFEST
 import textwrap
 
 # Initialize FastAPI app
@@ -37,18 +41,59 @@ class TTSFactory:
             ValueError: If an unsupported TTS provider is specified.
         """
         if cls._instance is None:
-            if provider == "elevenlabs":
-                cls._instance = ElevenLabsTTS()
-            elif provider == "deepgram":
-                cls._instance = DeepgramTTS()
-            elif provider == "openai":
-                cls._instance = OpenAITTS()
-            elif provider == "cartesia":
-                cls._instance = CartesiaTTS()
-            else:
-                raise ValueError(f"Unsupported TTS provider: {provider}")
+            cls._instance = cls.create(provider)
         return cls._instance
 
+    @classmethod
+    def create(cls, provider: str):
+        """Create a TTS instance that is not shared with the websocket sessions."""
+        if provider == "elevenlabs":
+            return ElevenLabsTTS()
+        elif provider == "deepgram":
+            return DeepgramTTS()
+        elif provider == "openai":
+            return OpenAITTS()
+        elif provider == "cartesia":
+            return CartesiaTTS()
+        raise ValueError(f"Unsupported TTS provider: {provider}")
+
+@app.on_event("startup")
+async def start_presynthesis():
+    # Common phrases are synthesized in the background, sessions are served meanwhile
+    if TTS_PHRASE_MANIFEST:
+        app.state.presynthesis = asyncio.create_task(presynthesize_manifest(TTS_PHRASE_MANIFEST))
+
+async def presynthesize_phrases(phrases: list) -> dict:
+    # Providers keep the upstream stream of a call on the instance, sessions must not share it
+    tts_model = TTSFactory.create(TTS_PROVIDER)
+    await tts_model.initialize()
+    try:
+        return await presynthesize(tts_model, phrases)
+    finally:
+        await tts_model.close()
+
+async def presynthesize_manifest(path: str) -> dict:
+    try:
+        return await presynthesize_phrases(load_manifest(path))
+    except Exception:
+        logger.exception(f"Presynthesizing the phrase manifest {path} failed.")
+        raise
+
+@app.on_event("shutdown")
+def close_cache():
+    # The pack store flushes its index and stops compacting
+    if AudioCache._instance is not None:
+        AudioCache._instance.close()
+
+@app.post("/api/v1/phrases")
+async def add_phrases(payload: dict):
+    """Synthesize and pin more phrases on demand, e.g. when a new agent prompt is deployed."""
+    return await presynthesize_phrases(list(dict.fromkeys(payload.get("phrases", []))))
+
+@app.get("/api/v1/metrics")
+async def metrics():
+    return Metrics.snapshot()
+
 @app.websocket("/api/v1/ws")
 async def websocket_endpoint(tts_ws: WebSocket):
     tts_model = TTSFactory.get_instance(TTS_PROVIDER)
@@ -71,8 +116,13 @@ async def websocket_endpoint(tts_ws: WebSocket):
                     synthesis_task.cancel()
                 
                 async def synthesize_and_send():
+                    start = time.perf_counter()
+                    first = True
                     for text_chunk in textwrap.wrap(content, 4000):
                         async for audio_chunk in tts_model.synthesize(text_chunk):
+                            if first and audio_chunk:
+                                Metrics.observe("tts_first_byte_ms", (time.perf_counter() - start) * 1000)
+                                first = False
                             await tts_ws.send_bytes(audio_chunk)
                     await tts_ws.send_json({"action": "done"})
 
@@ -0,0 +1,68 @@
+import time
+from collections import deque
+
+# Number of recent observations kept per summary for percentile estimates
+SUMMARY_WINDOW = 1024
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class Metrics:
+    """Process-wide counters, gauges and summaries exposed on /api/v1/metrics."""
+
+    _counters = {}
+    _gauges = {}
+    _summaries = {}
+    _started = time.time()
+
+    @classmethod
+    def increment(cls, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        cls._counters[key] = cls._counters.get(key, 0) + value
+
+    @classmethod
+    def set_gauge(cls, name: str, value: float, **labels):
+        cls._gauges[_key(name, labels)] = value
+
+    @classmethod
+    def observe(cls, name: str, value: float, **labels):
+        key = _key(name, labels)
+        summary = cls._summaries.get(key)
+        if summary is None:
+            summary = cls._summaries[key] = {"count": 0, "sum": 0.0, "max": value, "recent": deque(maxlen=SUMMARY_WINDOW)}
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+        summary["recent"].append(value)
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        summaries = {}
+        for key, summary in cls._summaries.items():
+            recent = sorted(summary["recent"])
+            summaries[key] = {
+                "count": summary["count"],
+                "mean": summary["sum"] / summary["count"],
+                "max": summary["max"],
+                "p50": recent[int(0.50 * (len(recent) - 1))],
+                "p95": recent[int(0.95 * (len(recent) - 1))],
+                "p99": recent[int(0.99 * (len(recent) - 1))],
+            }
+        return {
+            "uptime_s": time.time() - cls._started,
+            "counters": dict(cls._counters),
+            "gauges": dict(cls._gauges),
+            "summaries": summaries,
+        }
+
+    @classmethod
+    def reset(cls):
+        cls._counters = {}
+        cls._gauges = {}
+        cls._summaries = {}
+        cls._started = time.time()
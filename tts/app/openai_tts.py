@@ -1,9 +1,8 @@
 import os
 import logging
-import hashlib
 from tts_interface import TTSInterface
+from audio_cache import AudioCache, cache_key
 from openai import OpenAI
-import io
 import numpy as np
 import resampy
 
@@ -13,8 +12,6 @@ logger = logging.getLogger(__name__)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", '')
 OPENAI_TTS_MODEL = os.environ.get('OPENAI_TTS_MODEL', 'tts-1')
 OPENAI_TTS_VOICE = os.environ.get('OPENAI_TTS_VOICE', 'alloy')
-CACHE_DIR = "cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
 
 # Openai TTS has a sample rate of 24kHz.
 # xRx works at 16kHz. To avoid glitches in resampling the audio, the chunk size has been increased to 12288 from the original 4096 bytes.
@@ -22,9 +19,6 @@ os.makedirs(CACHE_DIR, exist_ok=True)
 
 CHUNK_SIZE = 12288
 
-def get_cache_key(content):
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
-
 class OpenAITTS(TTSInterface):
     def __init__(self):
         self._is_open = False
@@ -35,18 +29,23 @@ class OpenAITTS(TTSInterface):
         self.client = OpenAI(api_key=OPENAI_API_KEY)
         logger.info("OpenAITTS initialized.")
 
+    def get_cache_key(self, content):
+        # The audio is cached after resampling to 16kHz
+        return cache_key("openai", OPENAI_TTS_VOICE, OPENAI_TTS_MODEL, 16000, content)
+
     async def synthesize(self, content):
-        cache_key = get_cache_key(content)
-        cache_path = os.path.join(CACHE_DIR, f"{cache_key}.pcm")
+        cache = AudioCache.get_instance()
+        key = self.get_cache_key(content)
+        chunks = cache.get(key, CHUNK_SIZE)
 
-        if os.path.exists(cache_path):
+        if chunks is not None:
             logger.info("Cache hit, sending cached audio")
-            with open(cache_path, "rb") as f:
-                while chunk := f.read(CHUNK_SIZE):
-                    yield chunk
+            for chunk in chunks:
+                yield chunk
             yield b''  # Signal end of stream
             return
 
+        entry = cache.writer(key)
         try:
             logger.info(f"Synthesizing speech for content: {content[:50]}...")
             response = self.client.audio.speech.create(
@@ -57,7 +56,6 @@ class OpenAITTS(TTSInterface):
             )
 
             buffer = b""
-            cache_buffer = io.BytesIO()
             chunk_count = 0
 
             for chunk in response.iter_bytes(chunk_size=CHUNK_SIZE):
@@ -67,7 +65,7 @@ class OpenAITTS(TTSInterface):
                     resampled_chunk = resampy.resample(audio_data, 24000, 16000)
                     resampled_bytes = resampled_chunk.astype(np.int16).tobytes()
                     
-                    cache_buffer.write(resampled_bytes)
+                    entry.write(resampled_bytes)
                     yield resampled_bytes
                     
                     buffer = buffer[CHUNK_SIZE:]
@@ -79,15 +77,14 @@ class OpenAITTS(TTSInterface):
                 audio_data = np.frombuffer(buffer, dtype=np.int16)
                 resampled_chunk = resampy.resample(audio_data, 24000, 16000)
                 resampled_bytes = resampled_chunk.astype(np.int16).tobytes()
-                cache_buffer.write(resampled_bytes)
+                entry.write(resampled_bytes)
                 yield resampled_bytes
                 chunk_count += 1
                 logger.debug(f"Processed final chunk {chunk_count}, size: {len(resampled_bytes)} bytes")
 
-            # Write the entire resampled audio to cache
-            with open(cache_path, "wb") as f:
-                f.write(cache_buffer.getvalue())
-            logger.info(f"Cached synthesized audio to {cache_path}")
+            # Publish the entire resampled audio to the cache
+            entry.commit()
+            logger.info(f"Cached synthesized audio under {key}")
 
             logger.info(f"Finished synthesizing speech. Total chunks: {chunk_count}")
             yield b''  # Signal end of stream
@@ -96,6 +93,9 @@ class OpenAITTS(TTSInterface):
             logger.exception(f"An error occurred while synthesizing speech: {str(e)}")
             yield b''  # Signal end of stream even in case of error
             raise
+        finally:
+            # Nothing is cached when the synthesis failed or was cancelled
+            entry.discard()
 
     async def close(self):
         self._is_open = False
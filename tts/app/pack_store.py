@@ -0,0 +1,370 @@
+import os
+import mmap
+import fcntl
+import time
+import struct
+import hashlib
+import logging
+import threading
+from metrics import Metrics
+
+# Audio is appended to segment files of about this size
+TTS_PACK_SEGMENT_MB = float(os.environ.get("TTS_PACK_SEGMENT_MB", "64"))
+# Share of deleted audio at which a full segment is rewritten
+TTS_PACK_COMPACT_RATIO = float(os.environ.get("TTS_PACK_COMPACT_RATIO", "0.5"))
+# Seconds between background compactions, 0 disables them
+TTS_PACK_COMPACT_INTERVAL_S = float(os.environ.get("TTS_PACK_COMPACT_INTERVAL_S", "60"))
+# Initial slots of the index, it doubles whenever it is 70% full
+TTS_PACK_INDEX_SLOTS = int(os.environ.get("TTS_PACK_INDEX_SLOTS", "65536"))
+
+INDEX_NAME = "index.bin"
+INDEX_MAGIC = b"TTSPACK1"
+INDEX_HEADER = struct.Struct("<8sI")  # magic, number of slots
+# Key digest, segment, offset of the record, length of the audio, last use in unix seconds
+SLOT = struct.Struct("<16sIQII")
+USED_OFFSET = 32  # offset of the last use within a slot
+EMPTY = 0
+DELETED = 0xFFFFFFFF
+MAX_LOAD = 0.7
+# A record is its audio length and key length, then the key, then the audio
+RECORD = struct.Struct("<IH")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".pack"
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def _record_size(key: str, length: int) -> int:
+    return RECORD.size + len(key.encode("utf-8")) + length
+
+
+class PackWriter:
+    """Collects the audio of one entry, it is appended to the active segment in one piece on commit()."""
+
+    def __init__(self, store, key: str):
+        self.store = store
+        self.key = key
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+
+    def commit(self):
+        self.store._append(self.key, self._buffer)
+        self._buffer = None
+
+    def discard(self):
+        self._buffer = None
+
+
+class PackStore:
+    """Cache storage that appends audio to large segment files instead of one file per entry.
+
+    An open addressing hash table in a memory mapped index file maps key
+    digests to their record. Reads are memoryview slices of memory mapped
+    segments. Deleted and replaced records stay in their segment until a
+    background thread rewrites the live records of mostly dead segments
+    and deletes them. Only one process may use a directory at a time, it
+    is locked while the store is open.
+    """
+
+    def __init__(self, directory: str, segment_mb: float = TTS_PACK_SEGMENT_MB,
+                 compact_ratio: float = TTS_PACK_COMPACT_RATIO,
+                 compact_interval_s: float = TTS_PACK_COMPACT_INTERVAL_S,
+                 index_slots: int = TTS_PACK_INDEX_SLOTS):
+        self.directory = directory
+        self.segment_bytes = int(segment_mb * 2 ** 20)
+        self.compact_ratio = compact_ratio
+        self.compact_interval = compact_interval_s
+        # Appends and index updates come from the event loop and the compaction thread
+        self._lock = threading.RLock()
+        self._maps = {}  # segment -> read-only mapping, replaced once the segment outgrows it
+        self._sizes = {}  # segment -> bytes written
+        self._live = {}  # segment -> bytes of records the index points to
+        os.makedirs(directory, exist_ok=True)
+        self._dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            fcntl.flock(self._dir_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._dir_fd)
+            raise RuntimeError(f"TTS cache directory {directory} is used by another process.") from None
+        for name in os.listdir(directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                segment = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                self._sizes[segment] = os.path.getsize(self._segment_path(segment))
+                self._live[segment] = 0
+        self._open_index(index_slots)
+        self._recover()
+        self._active = None
+        self._file = None
+        self._roll(max(self._sizes, default=None))
+        self._stop = threading.Event()
+        self._compactor = None
+        if self.compact_interval > 0:
+            self._compactor = threading.Thread(target=self._compact_loop, daemon=True)
+            self._compactor.start()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment:08d}{SEGMENT_SUFFIX}")
+
+    def _open_index(self, slots: int):
+        path = os.path.join(self.directory, INDEX_NAME)
+        if os.path.exists(path):
+            with open(path, "r+b") as f:
+                index = mmap.mmap(f.fileno(), 0)
+            magic, capacity = INDEX_HEADER.unpack_from(index)
+            if magic == INDEX_MAGIC and len(index) == INDEX_HEADER.size + capacity * SLOT.size:
+                self._index = index
+                self._capacity = capacity
+                # Slots that were ever taken, deleted ones included, they all lengthen probing
+                self._taken = sum(1 for i in range(capacity) if self._slot(i)[1] != EMPTY)
+                return
+            index.close()
+            # The segments are reclaimed by compaction once nothing points to them
+            logger.warning(f"Discarding unreadable TTS cache index {path}.")
+        self._index, self._capacity = self._create_index(path, slots)
+        self._taken = 0
+
+    @staticmethod
+    def _create_index(path: str, slots: int) -> tuple:
+        with open(path, "w+b") as f:
+            f.truncate(INDEX_HEADER.size + slots * SLOT.size)
+            index = mmap.mmap(f.fileno(), 0)
+        INDEX_HEADER.pack_into(index, 0, INDEX_MAGIC, slots)
+        return index, slots
+
+    def _slot(self, i: int) -> tuple:
+        return SLOT.unpack_from(self._index, INDEX_HEADER.size + i * SLOT.size)
+
+    def _set_slot(self, i: int, *fields):
+        SLOT.pack_into(self._index, INDEX_HEADER.size + i * SLOT.size, *fields)
+
+    def _find(self, digest: bytes) -> tuple:
+        """Return the slot holding digest or None, and the first slot it could be inserted at."""
+        i = int.from_bytes(digest[:8], "little") % self._capacity
+        free = None
+        for _ in range(self._capacity):
+            slot_digest, segment = self._slot(i)[:2]
+            if segment == EMPTY:
+                return None, i if free is None else free
+            if segment == DELETED:
+                if free is None:
+                    free = i
+            elif slot_digest == digest:
+                return i, free
+            i = (i + 1) % self._capacity
+        return None, free
+
+    def _map(self, segment: int, end: int):
+        mapping = self._maps.get(segment)
+        if mapping is None or len(mapping) < end:
+            with open(self._segment_path(segment), "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapping
+        return mapping
+
+    def _record(self, segment: int, offset: int, length: int) -> tuple:
+        """Return the key and a view of the audio of a record."""
+        mapping = self._map(segment, offset + RECORD.size)
+        _, key_length = RECORD.unpack_from(mapping, offset)
+        start = offset + RECORD.size + key_length
+        mapping = self._map(segment, start + length)
+        view = memoryview(mapping)
+        return bytes(view[offset + RECORD.size:start]).decode("utf-8"), view[start:start + length]
+
+    def _recover(self):
+        """Drop slots that point past their segment and count the live bytes of every segment."""
+        for i in range(self._capacity):
+            digest, segment, offset, length, _ = self._slot(i)
+            if segment in (EMPTY, DELETED):
+                continue
+            size = self._sizes.get(segment, 0)
+            if offset + RECORD.size + length <= size:
+                key, _ = self._record(segment, offset, length)
+                if offset + _record_size(key, length) <= size:
+                    self._live[segment] += _record_size(key, length)
+                    continue
+            # The process stopped before the record reached the disk
+            self._set_slot(i, digest, DELETED, 0, 0, 0)
+
+    def scan(self) -> list:
+        """Return (last use, key, size) of every entry."""
+        entries = []
+        with self._lock:
+            for i in range(self._capacity):
+                _, segment, offset, length, used = self._slot(i)
+                if segment not in (EMPTY, DELETED):
+                    entries.append((used, self._record(segment, offset, length)[0], length))
+        self._report()
+        return entries
+
+    def writer(self, key: str) -> PackWriter:
+        return PackWriter(self, key)
+
+    def _roll(self, segment: int = None):
+        """Continue appending to segment, or to a new one."""
+        if self._file is not None:
+            self._file.close()
+        if segment is None or self._sizes.get(segment, 0) >= self.segment_bytes:
+            segment = max(self._sizes, default=0) + 1
+            self._sizes[segment] = 0
+            self._live[segment] = 0
+        self._active = segment
+        self._file = open(self._segment_path(segment), "ab")
+
+    def _write_record(self, key: str, audio) -> tuple:
+        """Append a record to the active segment, return its segment and offset."""
+        if self._sizes[self._active] >= self.segment_bytes:
+            self._roll()
+        key_bytes = key.encode("utf-8")
+        offset = self._sizes[self._active]
+        self._file.write(RECORD.pack(len(audio), len(key_bytes)) + key_bytes)
+        self._file.write(audio)
+        # Readers map the file, the record must be out of the write buffer first
+        self._file.flush()
+        size = RECORD.size + len(key_bytes) + len(audio)
+        self._sizes[self._active] += size
+        self._live[self._active] += size
+        return self._active, offset
+
+    def _append(self, key: str, audio):
+        digest = _digest(key)
+        with self._lock:
+            segment, offset = self._write_record(key, audio)
+            # The slot is written last, a record without one is dead space
+            found, free = self._find(digest)
+            if found is not None:
+                old = self._slot(found)
+                self._live[old[1]] -= _record_size(key, old[3])
+                free = found
+            elif self._slot(free)[1] == EMPTY:
+                self._taken += 1
+            self._set_slot(free, digest, segment, offset, len(audio), int(time.time()))
+            if self._taken > self._capacity * MAX_LOAD:
+                self._grow()
+        self._report()
+
+    def _grow(self):
+        """Rebuild the index with twice the slots, dropping deleted slots."""
+        slots = [self._slot(i) for i in range(self._capacity)]
+        path = os.path.join(self.directory, INDEX_NAME)
+        index, capacity = self._create_index(path + ".tmp", self._capacity * 2)
+        old, self._index, self._capacity = self._index, index, capacity
+        self._taken = 0
+        for slot in slots:
+            if slot[1] not in (EMPTY, DELETED):
+                _, free = self._find(slot[0])
+                self._set_slot(free, *slot)
+                self._taken += 1
+        self._index.flush()
+        os.replace(path + ".tmp", path)
+        old.close()
+        logger.info(f"Grew the TTS cache index to {capacity} slots.")
+
+    def touch(self, key: str) -> bool:
+        with self._lock:
+            found, _ = self._find(_digest(key))
+            if found is None:
+                return False
+            struct.pack_into("<I", self._index, INDEX_HEADER.size + found * SLOT.size + USED_OFFSET, int(time.time()))
+            return True
+
+    def read(self, key: str):
+        """Return a view of the audio of key inside its mapped segment, None if it is missing."""
+        with self._lock:
+            found, _ = self._find(_digest(key))
+            if found is None:
+                return None
+            _, segment, offset, length, _ = self._slot(found)
+            return self._record(segment, offset, length)[1]
+
+    def chunks(self, key: str, chunk_size: int):
+        view = self.read(key)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    def remove(self, key: str):
+        digest = _digest(key)
+        with self._lock:
+            found, _ = self._find(digest)
+            if found is None:
+                return
+            _, segment, _, length, _ = self._slot(found)
+            self._live[segment] -= _record_size(key, length)
+            self._set_slot(found, digest, DELETED, 0, 0, 0)
+
+    def compact(self) -> int:
+        """Rewrite the live records of full segments that are mostly dead, return the bytes reclaimed."""
+        reclaimed = 0
+        with self._lock:
+            candidates = [
+                segment for segment, size in self._sizes.items()
+                if segment != self._active and size and 1 - self._live[segment] / size >= self.compact_ratio
+            ]
+        for segment in candidates:
+            reclaimed += self._rewrite(segment)
+        if candidates:
+            Metrics.increment("tts_pack_compactions", len(candidates))
+            Metrics.increment("tts_pack_reclaimed_bytes", reclaimed)
+            logger.info(f"Compacted {len(candidates)} TTS cache segments, reclaimed {reclaimed / 2 ** 20:.1f}MB.")
+            self._report()
+        return reclaimed
+
+    def _rewrite(self, segment: int) -> int:
+        with self._lock:
+            digests = [slot[0] for slot in map(self._slot, range(self._capacity)) if slot[1] == segment]
+        for digest in digests:
+            # One record at a time, reads and writes go on in between and may grow the index,
+            # so the slot is looked up again by its digest
+            with self._lock:
+                found, _ = self._find(digest)
+                if found is None:
+                    continue
+                _, slot_segment, offset, length, used = self._slot(found)
+                if slot_segment != segment:
+                    continue
+                key, audio = self._record(segment, offset, length)
+                new_segment, new_offset = self._write_record(key, audio)
+                self._live[segment] -= _record_size(key, length)
+                self._set_slot(found, digest, new_segment, new_offset, length, used)
+        with self._lock:
+            if any(self._slot(i)[1] == segment for i in range(self._capacity)):
+                # Never delete a segment the index still points to, a later compaction retries it
+                logger.warning(f"TTS cache segment {segment} still holds live records, keeping it.")
+                return 0
+            size = self._sizes.pop(segment)
+            live = self._live.pop(segment)
+            # Views handed out before keep the mapping alive, the file is gone once they are dropped
+            self._maps.pop(segment, None)
+            os.remove(self._segment_path(segment))
+        return size - live
+
+    def _compact_loop(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Compacting the TTS cache failed.")
+
+    def _report(self):
+        with self._lock:
+            Metrics.set_gauge("tts_pack_segments", len(self._sizes))
+            Metrics.set_gauge("tts_pack_dead_bytes", sum(self._sizes.values()) - sum(self._live.values()))
+
+    def close(self):
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        with self._lock:
+            self._file.close()
+            self._index.flush()
+            if self._dir_fd is not None:
+                # Closing the descriptor releases the directory lock
+                os.close(self._dir_fd)
+                self._dir_fd = None
@@ -0,0 +1,57 @@
+import os
+import time
+import asyncio
+import logging
+from audio_cache import AudioCache
+from metrics import Metrics
+
+# File with one phrase per line that is synthesized into the cache at startup
+TTS_PHRASE_MANIFEST = os.environ.get("TTS_PHRASE_MANIFEST", "")
+# Phrases synthesized at the same time, providers keep one upstream connection per instance
+TTS_PRESYNTHESIS_CONCURRENCY = int(os.environ.get("TTS_PRESYNTHESIS_CONCURRENCY", "1"))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_manifest(path: str) -> list:
+    """Read the phrases of a manifest, blank lines and lines starting with # are skipped."""
+    with open(path, encoding="utf-8") as f:
+        phrases = [line.strip() for line in f]
+    return list(dict.fromkeys(phrase for phrase in phrases if phrase and not phrase.startswith("#")))
+
+
+async def presynthesize(tts_model, phrases: list, concurrency: int = TTS_PRESYNTHESIS_CONCURRENCY) -> dict:
+    """Synthesize phrases into the cache and pin them in memory, already cached ones are only pinned."""
+    cache = AudioCache.get_instance()
+    slots = asyncio.Semaphore(max(1, concurrency))
+    summary = {"phrases": len(phrases), "synthesized": 0, "cached": 0, "pinned": 0, "failed": 0}
+    start = time.perf_counter()
+
+    async def prepare(phrase):
+        key = tts_model.get_cache_key(phrase)
+        if key is None:
+            summary["failed"] += 1
+            return
+        async with slots:
+            if key in cache:
+                summary["cached"] += 1
+            else:
+                try:
+                    async for _ in tts_model.synthesize(phrase):
+                        pass
+                except Exception:
+                    logger.exception(f"Presynthesizing '{phrase}' failed.")
+                # Providers swallow most upstream errors, only a committed entry counts
+                if key not in cache:
+                    summary["failed"] += 1
+                    Metrics.increment("tts_presynthesis_failures")
+                    return
+                summary["synthesized"] += 1
+            if cache.pin(key):
+                summary["pinned"] += 1
+
+    await asyncio.gather(*[prepare(phrase) for phrase in phrases])
+    Metrics.observe("tts_presynthesis_ms", (time.perf_counter() - start) * 1000)
+    logger.info(f"Presynthesized phrases: {summary}.")
+    return summary
@@ -13,6 +13,10 @@ class TTSInterface(ABC):
         """Synthesize text to audio and yield audio chunks."""
         pass
 
+    def get_cache_key(self, text: str) -> str:
+        """Key of the cached audio of text, None for providers that do not cache."""
+        return None
+
     @abstractmethod
     async def close(self):
         """Close the connection to the service."""
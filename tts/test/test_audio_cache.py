@@ -0,0 +1,170 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+
+# Add the directory containing the app modules to the system path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from audio_cache import AudioCache, cache_key
+from phrase_manifest import load_manifest, presynthesize
+from tts_interface import TTSInterface
+from metrics import Metrics
+
+
+@pytest.fixture
+def cache(tmp_path):
+    Metrics.reset()
+    return AudioCache(str(tmp_path), max_bytes=10, memory_bytes=0)
+
+
+@pytest.fixture
+def hot_cache(tmp_path):
+    Metrics.reset()
+    return AudioCache(str(tmp_path), max_bytes=100, memory_bytes=16)
+
+
+def write(cache, key, data):
+    with cache.writer(key) as entry:
+        entry.write(data)
+        entry.commit()
+
+
+def test_cache_key_covers_voice_model_and_format():
+    key = cache_key("elevenlabs", "voice", "model", 24000, "Hello")
+    assert key == cache_key("elevenlabs", "voice", "model", "24000", "Hello")
+    assert key != cache_key("cartesia", "voice", "model", 24000, "Hello")
+    assert key != cache_key("elevenlabs", "other", "model", 24000, "Hello")
+    assert key != cache_key("elevenlabs", "voice", "other", 24000, "Hello")
+    assert key != cache_key("elevenlabs", "voice", "model", 16000, "Hello")
+    assert key != cache_key("elevenlabs", "voice", "model", 24000, "Hello", stability=0.5)
+
+
+def test_uncommitted_entries_are_never_served(cache):
+    with cache.writer("cut") as entry:
+        entry.write(b"1234")
+
+    assert cache.get("cut") is None
+    assert os.listdir(cache.directory) == []
+    counters = Metrics.snapshot()["counters"]
+    assert counters["tts_cache_aborted_writes"] == 1
+    assert counters["tts_cache_misses"] == 1
+
+
+def test_hits_are_read_back_in_chunks(cache):
+    write(cache, "hello", b"123456")
+
+    assert list(cache.get("hello", chunk_size=4)) == [b"1234", b"56"]
+    counters = Metrics.snapshot()["counters"]
+    assert counters["tts_cache_hits{tier=disk}"] == 1
+    assert counters["tts_cache_hit_bytes"] == 6
+    assert counters["tts_cache_written_bytes"] == 6
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    write(cache, "a", b"1234")
+    write(cache, "b", b"1234")
+    assert cache.lookup("a")
+    write(cache, "c", b"1234")
+
+    assert not cache.lookup("b")
+    assert cache.lookup("a") and cache.lookup("c")
+    snapshot = Metrics.snapshot()
+    assert snapshot["counters"]["tts_cache_evictions"] == 1
+    assert snapshot["gauges"]["tts_cache_bytes"] == 8
+
+
+def test_index_is_rebuilt_on_startup(cache):
+    write(cache, "a", b"1234")
+    open(os.path.join(cache.directory, "b.123.tmp"), "wb").close()
+
+    restarted = AudioCache(cache.directory, max_bytes=10)
+    assert restarted.lookup("a")
+    assert sorted(os.listdir(cache.directory)) == ["a.pcm"]
+
+
+def test_memory_tier_serves_slices_without_touching_disk(hot_cache):
+    write(hot_cache, "hello", b"1234")
+    os.remove(hot_cache.store.path("hello"))
+
+    chunks = list(hot_cache.get("hello", chunk_size=3))
+    assert all(isinstance(chunk, memoryview) for chunk in chunks)
+    assert [bytes(chunk) for chunk in chunks] == [b"123", b"4"]
+    assert Metrics.snapshot()["counters"]["tts_cache_hits{tier=memory}"] == 1
+
+
+def test_memory_tier_is_bounded_and_keeps_pinned_entries(hot_cache):
+    for key in ("a", "b", "c", "d"):
+        write(hot_cache, key, b"1234")
+    assert hot_cache.pin("a")
+    write(hot_cache, "e", b"1234")
+    write(hot_cache, "f", b"1234")
+
+    # Entries larger than a quarter of the memory tier stay on disk only
+    write(hot_cache, "large", b"12345")
+    assert isinstance(next(hot_cache.get("large")), bytes)
+
+    assert set(hot_cache._memory) == {"a", "d", "e", "f"}
+    assert Metrics.snapshot()["gauges"]["tts_cache_memory_bytes"] == 16
+    assert bytes(next(hot_cache.get("b"))) == b"1234"
+    assert Metrics.snapshot()["counters"]["tts_cache_hits{tier=disk}"] == 2
+
+
+
+def test_entries_evicted_from_disk_leave_the_memory_tier(tmp_path):
+    Metrics.reset()
+    cache = AudioCache(str(tmp_path), max_bytes=8, memory_bytes=16)
+    write(cache, "a", b"1234")
+    write(cache, "b", b"1234")
+    assert cache.pin("a")
+    write(cache, "c", b"1234")
+    write(cache, "d", b"1234")
+
+    # Pinned audio is still served from memory, unpinned audio is gone with its file
+    assert "b" not in cache and cache.get("b") is None
+    assert "a" in cache and bytes(next(cache.get("a"))) == b"1234"
+    assert set(cache._memory) == {"a", "c", "d"}
+    assert Metrics.snapshot()["gauges"]["tts_cache_memory_bytes"] == 12
+
+class PhraseTTS(TTSInterface):
+    def __init__(self):
+        self.synthesized = []
+
+    async def initialize(self):
+        pass
+
+    def get_cache_key(self, text):
+        return cache_key("fake", "voice", "model", 16000, text)
+
+    async def synthesize(self, text):
+        self.synthesized.append(text)
+        if text == "fails":
+            yield b"cut"
+            return
+        with AudioCache.get_instance().writer(self.get_cache_key(text)) as entry:
+            entry.write(text.encode())
+            entry.commit()
+        yield text.encode()
+
+    async def close(self):
+        pass
+
+    @property
+    def is_open(self):
+        return True
+
+
+@pytest.mark.asyncio
+async def test_manifest_phrases_are_synthesized_once_and_pinned(tmp_path, hot_cache):
+    manifest = tmp_path / "phrases.txt"
+    manifest.write_text("# greetings\nHi!\n\nBye.\nHi!\nfails\n")
+    tts = PhraseTTS()
+
+    with patch.object(AudioCache, "_instance", hot_cache):
+        first = await presynthesize(tts, load_manifest(str(manifest)))
+        second = await presynthesize(tts, ["Hi!", "Bye."])
+
+    assert tts.synthesized == ["Hi!", "Bye.", "fails"]
+    assert first == {"phrases": 3, "synthesized": 2, "cached": 0, "pinned": 2, "failed": 1}
+    assert second == {"phrases": 2, "synthesized": 0, "cached": 2, "pinned": 2, "failed": 0}
+    assert hot_cache._pinned == {tts.get_cache_key("Hi!"), tts.get_cache_key("Bye.")}
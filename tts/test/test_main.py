@@ -12,8 +12,9 @@ import requests
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
 
 try:
-    from main import app, TTSFactory
+    from main import app, TTSFactory, presynthesize_phrases
     from tts_interface import TTSInterface
+    from audio_cache import AudioCache, cache_key
 except ImportError as e:
     print(f"Error importing modules: {e}")
     print(f"Current sys.path: {sys.path}")
@@ -130,5 +131,47 @@ async def test_error_handling(test_client):
             with pytest.raises(WebSocketDisconnect):
                 await websocket.receive_bytes()
 
+class StreamingTTS(MockTTS):
+    """Keeps the stream of the current call on the instance, like the websocket providers."""
+
+    def __init__(self):
+        self.text = None
+        self.closed = False
+
+    def get_cache_key(self, text):
+        return cache_key("stream", "voice", "model", 16000, text)
+
+    async def synthesize(self, text):
+        self.text = text
+        await asyncio.sleep(0.01)
+        with AudioCache.get_instance().writer(self.get_cache_key(text)) as entry:
+            entry.write(self.text.encode())
+            entry.commit()
+        yield self.text.encode()
+
+    async def close(self):
+        self.closed = True
+
+@pytest.mark.asyncio
+async def test_presynthesis_does_not_share_the_session_provider(tmp_path):
+    session_tts = StreamingTTS()
+    created = []
+    cache = AudioCache(str(tmp_path), max_bytes=1000, memory_bytes=100)
+
+    async def session_turn():
+        return [chunk async for chunk in TTSFactory.get_instance("elevenlabs").synthesize("Hello there")]
+
+    with patch.object(TTSFactory, "_instance", session_tts), \
+            patch.object(TTSFactory, "create", side_effect=lambda provider: created.append(StreamingTTS()) or created[-1]), \
+            patch.object(AudioCache, "_instance", cache):
+        summary, audio = await asyncio.gather(presynthesize_phrases(["Welcome back."]), session_turn())
+
+    assert audio == [b"Hello there"]
+    assert summary["synthesized"] == 1 and summary["pinned"] == 1
+    assert bytes(next(cache.get(session_tts.get_cache_key("Welcome back.")))) == b"Welcome back."
+    # The presynthesis instance is closed, the session keeps its own
+    assert len(created) == 1 and created[0] is not session_tts
+    assert created[0].closed and not session_tts.closed
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
@@ -0,0 +1,160 @@
+import pytest
+import os
+import sys
+
+# Add the directory containing the app modules to the system path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from pack_store import PackStore
+from audio_cache import AudioCache
+from metrics import Metrics
+
+
+@pytest.fixture
+def store(tmp_path):
+    Metrics.reset()
+    # Every record starts a new segment, compaction only runs when called
+    store = PackStore(str(tmp_path), segment_mb=8 / 2 ** 20, compact_interval_s=0, index_slots=4)
+    yield store
+    store.close()
+
+
+def write(store, key, data):
+    writer = store.writer(key)
+    writer.write(data)
+    writer.commit()
+
+
+def test_entries_are_read_from_mapped_segments(store):
+    write(store, "a", b"1234")
+    discarded = store.writer("b")
+    discarded.write(b"5678")
+    discarded.discard()
+
+    assert isinstance(store.read("a"), memoryview)
+    assert bytes(store.read("a")) == b"1234"
+    assert [bytes(chunk) for chunk in store.chunks("a", 3)] == [b"123", b"4"]
+    assert store.read("b") is None
+    assert store.touch("a") and not store.touch("b")
+
+
+def test_index_grows_and_survives_restarts(store):
+    for key in "abcdef":
+        write(store, key, key.encode() * 4)
+    write(store, "a", b"new")
+    store.remove("b")
+    store.close()
+
+    restarted = PackStore(store.directory, compact_interval_s=0)
+    assert restarted._capacity == 16
+    assert sorted((key, size) for _, key, size in restarted.scan()) == [
+        ("a", 3), ("c", 4), ("d", 4), ("e", 4), ("f", 4)]
+    assert bytes(restarted.read("a")) == b"new"
+    restarted.close()
+
+
+def test_records_past_the_end_of_a_segment_are_dropped(store):
+    write(store, "a", b"1234")
+    write(store, "b", b"5678")
+    store.close()
+    with open(os.path.join(store.directory, "segment-00000002.pack"), "r+b") as f:
+        f.truncate(8)
+
+    restarted = PackStore(store.directory, compact_interval_s=0)
+    assert [key for _, key, _ in restarted.scan()] == ["a"]
+    restarted.close()
+
+
+def test_compaction_rewrites_live_records_of_dead_segments(store):
+    for key in "abc":
+        write(store, key, b"1234")
+    view = store.read("a")
+    store.remove("a")
+    write(store, "b", b"5678")
+
+    # The active segment is left alone
+    assert store.compact() == 22
+    assert sorted(os.listdir(store.directory)) == ["index.bin", "segment-00000003.pack", "segment-00000004.pack"]
+    # Views handed out before keep their audio
+    assert bytes(view) == b"1234"
+    assert bytes(store.read("b")) == b"5678" and bytes(store.read("c")) == b"1234"
+    assert store.compact() == 0
+    snapshot = Metrics.snapshot()
+    assert snapshot["counters"]["tts_pack_reclaimed_bytes"] == 22
+    assert snapshot["gauges"]["tts_pack_dead_bytes"] == 0
+
+
+
+class GrowingLock:
+    """Lock of a store that grows its index right after the first record was rewritten."""
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = store._lock
+        self.rewritten = False
+        self.grown = False
+
+    def __enter__(self):
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        self.lock.__exit__(*exc_info)
+        if self.rewritten and not self.grown:
+            self.grown = True
+            with self.lock:
+                self.store._grow()
+
+
+def test_compaction_survives_the_index_growing(tmp_path):
+    # Four records fill a segment, growing the index moves a3 to another slot
+    store = PackStore(str(tmp_path), segment_mb=64 / 2 ** 20, compact_interval_s=0, index_slots=8)
+    for i in range(5):
+        write(store, f"a{i}", str(i).encode() * 8)
+    store.remove("a0")
+    store.remove("a1")
+    lock = store._lock = GrowingLock(store)
+    write_record = store._write_record
+
+    def rewrite_record(key, audio):
+        lock.rewritten = True
+        return write_record(key, audio)
+
+    store._write_record = rewrite_record
+    store.compact()
+
+    assert lock.grown and store._capacity == 16
+    assert not os.path.exists(store._segment_path(1))
+    assert bytes(store.read("a2")) == b"2" * 8 and bytes(store.read("a3")) == b"3" * 8
+    store.remove("a3")
+    assert store.read("a3") is None
+    store.close()
+
+
+def test_directory_is_locked_while_open(tmp_path):
+    store = PackStore(str(tmp_path), compact_interval_s=60)
+    with pytest.raises(RuntimeError):
+        PackStore(str(tmp_path), compact_interval_s=0)
+
+    compactor = store._compactor
+    store.close()
+    assert not compactor.is_alive()
+    PackStore(str(tmp_path), compact_interval_s=0).close()
+
+def test_audio_cache_on_the_pack_backend(tmp_path):
+    Metrics.reset()
+    cache = AudioCache(str(tmp_path), max_bytes=10, memory_bytes=0, backend="pack")
+    for key in ("a", "b", "c"):
+        with cache.writer(key) as entry:
+            entry.write(b"1234")
+            entry.commit()
+
+    assert cache.get("a") is None
+    assert [bytes(chunk) for chunk in cache.get("b", chunk_size=3)] == [b"123", b"4"]
+    cache.close()
+
+    restarted = AudioCache(str(tmp_path), max_bytes=10, memory_bytes=0, backend="pack")
+    assert set(restarted._entries) == {"b", "c"}
+    restarted.close()
+
+    with pytest.raises(ValueError):
+        AudioCache(str(tmp_path), backend="unknown")